@@ -0,0 +1,501 @@
+"""
+Columnar snapshot of sales for ad-hoc reporting (enable with POS_ANALYTICS_DIR=<directory>).
+
+An exporter appends new sales and sale items, in sale_id order, to one binary file
+per column, partitioned by month:
+
+    <dir>/manifest.json              last exported sale_id, row counts, dictionaries
+    <dir>/2026-10/sales.total.i8     one int64 per sale
+    <dir>/2026-10/items.product.i4   one int32 per sale item (dictionary code)
+    ...
+
+Timestamps are stored as YYYYMMDDHHMMSS integers (local time, as in sales.sale_date),
+money as integer cents, and product, cashier and payment method as codes into the
+manifest's dictionaries. Queries memory-map the columns of the months in range and
+group with NumPy bincount, so a group-by over years of sales is a few vectorized passes
+that never touch SQLite. Without NumPy the same files are read with the array module
+and grouped in plain Python (same results, slower).
+
+The manifest is the commit point: column files are fsynced before it is replaced, and
+bytes past its row counts (an export interrupted by a crash) are truncated on the next
+export. The store is derived data: delete the directory to rebuild it from the database.
+Checkouts only ever add sales, which appending by sale_id covers; sales archived before the
+exporter reached them are read from their monthly archive (see archive_manager.py). Replication can also
+replace or delete sales at head office (see replication.py); it counts those per day in
+sales_day_changes.rewrites, and the export re-exports every month whose count moved into a
+fresh directory (<dir>/2026-10.r3/), which the manifest then points to.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+from array import array
+from urllib.request import pathname2url
+
+from archive_manager import month_start
+from money import from_cents, sql_cents
+from sales_manager import MAX_ATTACHED_PARTITIONS
+from sales_journal import _fsync_dir, _lock_exclusive
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+LOCK_FILE = "export.lock"
+DEFAULT_EXPORT_INTERVAL = float(os.environ.get("POS_ANALYTICS_EXPORT_S", "30"))
+DEFAULT_EXPORT_BATCH = 5000
+
+# table -> column -> array typecode ('q' int64, 'i' int32)
+COLUMNS = {
+    "sales": {"sale_id": "q", "ts": "q", "cashier": "i", "payment_method": "i", "total": "q"},
+    "items": {"sale_id": "q", "ts": "q", "cashier": "i", "product": "i", "quantity": "i", "amount": "q"},
+}
+_NUMPY_DTYPES = {"q": "=i8", "i": "=i4"}
+_FILE_SUFFIX = {"q": "i8", "i": "i4"}
+
+# dimension -> (table, column grouped on); 'hour' and 'day' are derived from ts
+DIMENSIONS = {
+    "hour": ("sales", "ts"),
+    "day": ("sales", "ts"),
+    "month": ("sales", "ts"),
+    "cashier": ("sales", "cashier"),
+    "payment_method": ("sales", "payment_method"),
+    "product": ("items", "product"),
+}
+
+
+def _ts_int(sale_date):
+    """'YYYY-MM-DD HH:MM:SS' -> YYYYMMDDHHMMSS"""
+    return int(sale_date[:19].replace("-", "").replace(" ", "").replace(":", "").ljust(14, "0"))
+
+
+def _column_path(root, directory, table, column):
+    return os.path.join(root, directory, f"{table}.{column}.{_FILE_SUFFIX[COLUMNS[table][column]]}")
+
+
+def _partition_dir(month, counts):
+    """Directory of a month's columns: the month itself, or the one of its latest rebuild."""
+    return counts.get("dir", month)
+
+
+_PARTITION_DIR = re.compile(r"^\d{4}-\d{2}(\.r\d+)?$")
+
+
+class ColumnarSalesStore:
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_mtime = None
+
+    # --- Manifest ---
+    def _empty_manifest(self):
+        return {"last_sale_id": 0, "partitions": {},
+                "dictionaries": {"product": [], "product_name": [], "cashier": [], "payment_method": []}}
+
+    def manifest(self):
+        """:return: The current manifest, re-read only when another process has replaced it."""
+        path = os.path.join(self.root, MANIFEST)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return self._empty_manifest()
+        with self._lock:
+            if self._manifest is None or mtime != self._manifest_mtime:
+                with open(path, encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+            return self._manifest
+
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.root, MANIFEST)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_dir(self.root)
+
+    # --- Export ---
+    def export(self, db_path, batch=DEFAULT_EXPORT_BATCH):
+        """
+        Appends every sale newer than the last exported one. Only one process exports at
+        a time (lock file); others return immediately.
+        :return: Number of sales exported, or None if another process holds the export lock.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        lock_fd = os.open(os.path.join(self.root, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                _lock_exclusive(lock_fd)
+            except OSError:
+                return None
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+            try:
+                manifest = json.loads(json.dumps(self.manifest()))  # private copy to mutate
+                self._truncate_to_manifest(manifest)
+                self._remove_unreferenced(manifest)
+                self._rebuild_rewritten_months(conn, db_path, manifest)
+                exported = 0
+                while True:
+                    count = self._export_batch(conn, db_path, manifest, batch)
+                    exported += count
+                    if count < batch:
+                        break
+                return exported
+            finally:
+                conn.close()
+        finally:
+            os.close(lock_fd)  # also releases the lock
+
+    def _truncate_to_manifest(self, manifest):
+        """Drops bytes appended after the last manifest, i.e. by an export that crashed."""
+        for month, counts in manifest["partitions"].items():
+            for table, columns in COLUMNS.items():
+                for column, typecode in columns.items():
+                    path = _column_path(self.root, _partition_dir(month, counts), table, column)
+                    size = counts[table] * array(typecode).itemsize
+                    if os.path.exists(path) and os.path.getsize(path) > size:
+                        with open(path, "r+b") as f:
+                            f.truncate(size)
+                        logger.warning(f"Analytics store: discarded an unfinished export in {path}.")
+
+    def _remove_unreferenced(self, manifest):
+        """
+        Deletes column directories the manifest does not point to: months replaced by a rebuild
+        in an earlier export (kept until now for queries still reading them), and the output of
+        exports or rebuilds that crashed before their manifest was written.
+        """
+        referenced = {_partition_dir(month, counts) for month, counts in manifest["partitions"].items()}
+        for name in os.listdir(self.root):
+            if _PARTITION_DIR.match(name) and name not in referenced:
+                shutil.rmtree(os.path.join(self.root, name))
+
+    def _rebuild_rewritten_months(self, conn, db_path, manifest):
+        """Re-exports the months in which replication replaced or deleted sales since the last export."""
+        try:
+            rewrites = dict(conn.execute("SELECT substr(day, 1, 7), SUM(rewrites) FROM sales_day_changes GROUP BY 1"))
+        except sqlite3.OperationalError:
+            return  # a database from before replication
+        done = manifest.setdefault("rewrites", {})
+        changed = [month for month, count in sorted(rewrites.items()) if done.get(month, 0) != count]
+        if not changed:
+            return
+        for month in changed:
+            # A month never exported has nothing to rebuild; its sales are appended as usual
+            if month in manifest["partitions"]:
+                self._rebuild_month(conn, db_path, manifest, month, rewrites[month])
+            done[month] = rewrites[month]
+        self._write_manifest(manifest)
+
+    def _rebuild_month(self, conn, db_path, manifest, month, revision):
+        """Exports the month's already exported sales again, from the live tables and its archive if any."""
+        bounds = month_start(month)
+        sources = ["main"]
+        archived = conn.execute("SELECT path FROM sales_partitions WHERE month = ?", (month,)).fetchone()
+        if archived:
+            path = os.path.join(os.path.dirname(os.path.abspath(db_path)), archived[0])
+            conn.execute("ATTACH DATABASE ? AS archived", ("file:" + pathname2url(path) + "?mode=ro",))
+            sources.append("archived")
+        try:
+            # UNION keeps a sale found in both databases (an interrupted archive run) once
+            month_sales = "SELECT sale_id FROM {db}.sales WHERE sale_date >= ? AND sale_date < ? AND sale_id <= ?"
+            params = bounds + (manifest["last_sale_id"],)
+            sales = conn.execute(" UNION ".join(f"""
+                SELECT sale_id, sale_date, cashier_id, payment_method, {sql_cents('total_amount')}
+                FROM {db}.sales WHERE sale_date >= ? AND sale_date < ? AND sale_id <= ?
+            """ for db in sources) + " ORDER BY sale_id", params * len(sources)).fetchall()
+            items = conn.execute(" UNION ".join(f"""
+                SELECT item_id, sale_id, product_id, product_name, quantity, {sql_cents('subtotal')}
+                FROM {db}.sale_items WHERE sale_id IN ({month_sales.format(db=db)})
+            """ for db in sources) + " ORDER BY sale_id", params * len(sources)).fetchall()
+        finally:
+            if archived:
+                conn.execute("DETACH DATABASE archived")
+
+        directory = f"{month}.r{revision}"
+        if os.path.exists(os.path.join(self.root, directory)):
+            shutil.rmtree(os.path.join(self.root, directory))  # left by a crashed rebuild
+        buffers = self._encode(manifest, sales, [item[1:] for item in items])
+        for table, columns in COLUMNS.items():
+            empty = {column: array(typecode) for column, typecode in columns.items()}
+            self._write_columns(directory, table, buffers.get((month, table), empty), "wb")
+        manifest["partitions"][month] = {"sales": len(sales), "items": len(items), "dir": directory}
+        logger.info(f"Analytics store: re-exported {len(sales)} sales of {month} changed by replication.")
+
+    def _export_batch(self, conn, db_path, manifest, batch):
+        """
+        Exports the next `batch` sales after the last exported sale_id, from the live tables and
+        from every archived month that still holds newer sale_ids (the exporter fell behind the
+        archiver, or the store is being rebuilt). Those are read in chunks of attached databases.
+        """
+        last_sale_id = manifest["last_sale_id"]
+        base_dir = os.path.dirname(os.path.abspath(db_path))
+        archived = conn.execute("SELECT month, path FROM sales_partitions WHERE last_sale_id > ? ORDER BY month",
+                                (last_sale_id,)).fetchall()
+        sources = [("main", None)] + [("archived_" + month.replace("-", "_"), os.path.join(base_dir, path))
+                                      for month, path in archived]
+        chunks = [sources[i:i + MAX_ATTACHED_PARTITIONS] for i in range(0, len(sources), MAX_ATTACHED_PARTITIONS)]
+
+        # UNION keeps a sale found in both databases (an interrupted archive run) once
+        sales = set()
+        for chunk in chunks:
+            sales.update(self._query_chunk(conn, chunk, f"""
+                SELECT sale_id, sale_date, cashier_id, payment_method, {sql_cents('total_amount')}
+                FROM {{db}}.sales WHERE sale_id > ?
+            """, "ORDER BY sale_id LIMIT ?", (last_sale_id,), (batch,)))
+        sales = sorted(sales)[:batch]
+        if not sales:
+            return 0
+        items = set()
+        for chunk in chunks:
+            items.update(self._query_chunk(conn, chunk, f"""
+                SELECT sale_id, item_id, product_id, product_name, quantity, {sql_cents('subtotal')}
+                FROM {{db}}.sale_items WHERE sale_id > ? AND sale_id <= ?
+            """, "", (last_sale_id, sales[-1][0])))
+        items = [item[:1] + item[2:] for item in sorted(items)]
+
+        for (month, table), columns in self._encode(manifest, sales, items).items():
+            counts = manifest["partitions"].setdefault(month, {"sales": 0, "items": 0})
+            self._write_columns(_partition_dir(month, counts), table, columns, "ab")
+            counts[table] += len(columns["sale_id"])
+        manifest["last_sale_id"] = sales[-1][0]
+        self._write_manifest(manifest)
+        logger.debug("Analytics store: exported sales %s..%s (%d items).", sales[0][0], sales[-1][0], len(items))
+        return len(sales)
+
+    def _query_chunk(self, conn, chunk, arm, tail, params, tail_params=()):
+        """Runs `arm` (with {db} for the schema) over every database of the chunk, attached for the query."""
+        attached = []
+        try:
+            for schema, path in chunk:
+                if path:
+                    conn.execute(f"ATTACH DATABASE ? AS {schema}", ("file:" + pathname2url(path) + "?mode=ro",))
+                    attached.append(schema)
+            query = " UNION ".join(arm.format(db=schema) for schema, _ in chunk) + " " + tail
+            return conn.execute(query, params * len(chunk) + tail_params).fetchall()
+        finally:
+            for schema in attached:
+                conn.execute(f"DETACH DATABASE {schema}")
+
+    def _encode(self, manifest, sales, items):
+        """
+        Turns sales and their items into column arrays, extending the manifest's dictionaries.
+        :return: {(month, table): {column: array}}
+        """
+        dictionaries = manifest["dictionaries"]
+        codes = {name: {value: code for code, value in enumerate(dictionaries[name])}
+                 for name in ("product", "cashier", "payment_method")}
+
+        def code_for(name, value):
+            code = codes[name].get(value)
+            if code is None:
+                code = codes[name][value] = len(dictionaries[name])
+                dictionaries[name].append(value)
+                if name == "product":
+                    dictionaries["product_name"].append(None)
+            return code
+
+        buffers = {}  # (month, table) -> {column: array}
+
+        def buffer_for(month, table):
+            if (month, table) not in buffers:
+                buffers[(month, table)] = {column: array(typecode) for column, typecode in COLUMNS[table].items()}
+            return buffers[(month, table)]
+
+        sale_info = {}
+        for sale_id, sale_date, cashier_id, payment_method, total_cents in sales:
+            ts = _ts_int(sale_date)
+            cashier = code_for("cashier", cashier_id)
+            month = sale_date[:7]
+            sale_info[sale_id] = (ts, cashier, month)
+            columns = buffer_for(month, "sales")
+            columns["sale_id"].append(sale_id)
+            columns["ts"].append(ts)
+            columns["cashier"].append(cashier)
+            columns["payment_method"].append(code_for("payment_method", payment_method))
+            columns["total"].append(total_cents)
+        for sale_id, product_id, product_name, quantity, amount_cents in items:
+            ts, cashier, month = sale_info[sale_id]
+            product = code_for("product", product_id)
+            dictionaries["product_name"][product] = product_name  # latest name wins
+            columns = buffer_for(month, "items")
+            columns["sale_id"].append(sale_id)
+            columns["ts"].append(ts)
+            columns["cashier"].append(cashier)
+            columns["product"].append(product)
+            columns["quantity"].append(quantity)
+            columns["amount"].append(amount_cents)
+        return buffers
+
+    def _write_columns(self, directory, table, columns, mode):
+        os.makedirs(os.path.join(self.root, directory), exist_ok=True)
+        for column, values in columns.items():
+            with open(_column_path(self.root, directory, table, column), mode) as f:
+                values.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+    # --- Queries ---
+    def _load(self, directory, table, column, rows):
+        path = _column_path(self.root, directory, table, column)
+        typecode = COLUMNS[table][column]
+        if numpy is not None:
+            return numpy.memmap(path, dtype=_NUMPY_DTYPES[typecode], mode="r", shape=(rows,))
+        values = array(typecode)
+        with open(path, "rb") as f:
+            values.fromfile(f, rows)
+        return values
+
+    def revenue_by(self, dimension, start=None, end=None):
+        """
+        Revenue grouped by one dimension.
+        :param dimension: 'hour', 'day', 'month', 'cashier' or 'payment_method' (sale totals,
+                          after discounts), or 'product' (item subtotals, before discounts).
+        :param start: Optional 'YYYY-MM-DD[ HH:MM:SS]' lower bound (inclusive).
+        :param end: Optional 'YYYY-MM-DD[ HH:MM:SS]' upper bound (inclusive; a bare date covers the whole day).
+        :return: List of (key, revenue, count): count is the number of sales, or units sold
+                 for 'product'. Time dimensions are ordered by key, the others by revenue.
+                 For 'product' the key is (product_id, product_name).
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension {dimension!r}; expected one of {', '.join(DIMENSIONS)}.")
+        table, column = DIMENSIONS[dimension]
+        low = _ts_int(start) if start else None
+        high = (_ts_int(end) if len(end) > 10 else _ts_int(end) + 235959) if end else None
+        manifest = self.manifest()
+        revenue, counts = {}, {}
+
+        for month, partition in sorted(manifest["partitions"].items()):
+            rows, directory = partition[table], _partition_dir(month, partition)
+            month_ts = int(month.replace("-", "")) * 100000000
+            if not rows or (low and month_ts + 99999999 < low) or (high and month_ts > high):
+                continue  # partition pruning: the month is outside [start, end]
+            ts = self._load(directory, table, "ts", rows)
+            amounts = self._load(directory, table, "total" if table == "sales" else "amount", rows)
+            weights = self._load(directory, table, "quantity", rows) if table == "items" else None
+            keys = ts if column == "ts" else self._load(directory, table, column, rows)
+            if numpy is not None:
+                _group_numpy(dimension, month, ts, keys, amounts, weights, low, high, revenue, counts)
+            else:
+                _group_python(dimension, month, ts, keys, amounts, weights, low, high, revenue, counts)
+
+        dictionaries = manifest["dictionaries"]
+        if dimension == "product":
+            label = lambda code: (dictionaries["product"][code], dictionaries["product_name"][code])
+        elif dimension in ("cashier", "payment_method"):
+            label = lambda code: dictionaries[dimension][code]
+        else:
+            label = lambda key: key
+        result = [(label(key), from_cents(revenue[key]), counts[key]) for key in revenue if counts[key]]
+        if dimension in ("hour", "day", "month"):
+            return sorted(result, key=lambda r: r[0])
+        return sorted(result, key=lambda r: (-r[1], str(r[0])))
+
+
+def _time_key(dimension, month, ts):
+    if dimension == "hour":
+        return ts // 10000 % 100
+    if dimension == "day":
+        return ts // 1000000 % 100  # day of month; labelled with the month below
+    return 0
+
+
+def _group_numpy(dimension, month, ts, keys, amounts, weights, low, high, revenue, counts):
+    time_keyed = keys is ts
+    mask = None
+    if low:
+        mask = ts >= low
+    if high:
+        mask = (ts <= high) if mask is None else mask & (ts <= high)
+    if mask is not None:
+        if not mask.any():
+            return
+        ts, keys, amounts = ts[mask], keys[mask], amounts[mask]
+        weights = weights[mask] if weights is not None else None
+    if time_keyed:
+        keys = _time_key(dimension, month, ts) if dimension != "month" else numpy.zeros(len(ts), dtype="=i8")
+    # float64 sums of integer cents are exact below 2**53 cents
+    sums = numpy.bincount(keys, weights=amounts)
+    totals = numpy.bincount(keys, weights=weights) if weights is not None else numpy.bincount(keys)
+    present = numpy.flatnonzero(totals)
+    for key, cents, count in zip(present.tolist(), numpy.rint(sums[present]).astype("=i8").tolist(),
+                                 totals[present].astype("=i8").tolist()):
+        label = _label(dimension, month, key)
+        revenue[label] = revenue.get(label, 0) + cents
+        counts[label] = counts.get(label, 0) + count
+
+
+def _group_python(dimension, month, ts, keys, amounts, weights, low, high, revenue, counts):
+    time_keyed = keys is ts
+    for i, t in enumerate(ts):
+        if (low and t < low) or (high and t > high):
+            continue
+        key = _time_key(dimension, month, t) if time_keyed else keys[i]
+        label = _label(dimension, month, key)
+        revenue[label] = revenue.get(label, 0) + amounts[i]
+        counts[label] = counts.get(label, 0) + (weights[i] if weights is not None else 1)
+
+
+def _label(dimension, month, key):
+    if dimension == "day":
+        return f"{month}-{key:02d}"
+    if dimension == "month":
+        return month
+    return key
+
+
+class AnalyticsExporter:
+    """Background thread that keeps a ColumnarSalesStore up to date with the database."""
+
+    def __init__(self, store, db_path, interval=DEFAULT_EXPORT_INTERVAL):
+        self.store = store
+        self.db_path = db_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="analytics-exporter", daemon=True)
+        self._thread.start()
+        logger.info(f"Analytics exporter started ({self.store.root}, every {self.interval:g}s).")
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                exported = self.store.export(self.db_path)
+                if exported:
+                    logger.info(f"Analytics exporter: {exported} new sales exported.")
+            except (sqlite3.Error, OSError, ValueError) as e:
+                logger.error(f"Analytics export failed: {e}")
+            if self._stop.wait(self.interval):
+                break
+
+
+if __name__ == "__main__":
+    # One-off export and query: python analytics_store.py <db> <store dir> [dimension [start [end]]]
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    store = ColumnarSalesStore(sys.argv[2])
+    print(f"Exported {store.export(sys.argv[1])} sales.")
+    if len(sys.argv) > 3:
+        for row in store.revenue_by(sys.argv[3], *sys.argv[4:6]):
+            print(*row, sep="\t")
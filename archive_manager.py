@@ -0,0 +1,252 @@
+"""
+Monthly archiving of closed sales out of the live database.
+
+Every month older than the POS_ARCHIVE_KEEP_MONTHS most recent ones (default 3, the
+current month included) is moved, with its sale_items and sale_discounts, into its own
+database file, sales_archive/sales-YYYY-MM.db next to the live database (POS_ARCHIVE_DIR
+overrides the directory). The live file then only holds recent sales, so its indexes,
+backups and VACUUM stay small. The archived months are listed in sales_partitions and
+SalesManager's reports ATTACH the ones a requested period overlaps (see sales_manager.py),
+so history stays queryable through the same methods and endpoints.
+
+A month is moved in one transaction spanning the live database and the attached partition
+file: its rows are copied into the partition (replacing earlier copies, so a month that gets
+late sales, e.g. replicated ones, is simply archived again), deleted from the live tables
+and registered in sales_partitions. With the live database in rollback-journal mode SQLite
+commits both files atomically (through a super-journal), so no reader or crash ever sees a
+sale in both or in neither. On a replicating terminal, a month is only archived once all
+its sales have been pushed (see replication.py); archived sales are not replicated.
+
+    python archive_manager.py [pos_database.db] [--keep-months 3] [--vacuum] [--list]
+"""
+import logging
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+from db_manager import DBManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEEP_MONTHS = int(os.environ.get("POS_ARCHIVE_KEEP_MONTHS", "3"))
+ARCHIVE_DIR = os.environ.get("POS_ARCHIVE_DIR")
+
+# The live schema without AUTOINCREMENT and foreign keys (ids come from the live database,
+# products stay there), with the indexes the report queries use
+PARTITION_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS sales (
+        sale_id INTEGER PRIMARY KEY,
+        total_amount REAL NOT NULL,
+        payment_method TEXT NOT NULL,
+        sale_date TEXT NOT NULL,
+        cashier_id TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sale_items (
+        item_id INTEGER PRIMARY KEY,
+        sale_id INTEGER NOT NULL,
+        product_id TEXT NOT NULL,
+        product_name TEXT NOT NULL,
+        price_at_sale REAL NOT NULL,
+        quantity INTEGER NOT NULL,
+        subtotal REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sale_discounts (
+        sale_id INTEGER NOT NULL,
+        promotion_id INTEGER NOT NULL,
+        promotion_name TEXT NOT NULL,
+        amount REAL NOT NULL,
+        PRIMARY KEY (sale_id, promotion_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_sales_date_payment_total ON sales (sale_date, payment_method, total_amount)",
+    "CREATE INDEX IF NOT EXISTS idx_sale_items_sale_id ON sale_items (sale_id)",
+)
+
+
+def month_start(month):
+    """'YYYY-MM' -> ('YYYY-MM-01 00:00:00', first instant of the next month)."""
+    first = datetime.strptime(month, "%Y-%m")
+    following = (first + timedelta(days=32)).replace(day=1)
+    return first.strftime("%Y-%m-%d %H:%M:%S"), following.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def archive_cutoff(keep_months, today=None):
+    """:return: First day ('YYYY-MM-01') of the oldest month kept live."""
+    if keep_months < 1:
+        raise ValueError("keep_months must be at least 1 (the current month is never archived)")
+    first = (today or datetime.now().date()).replace(day=1)
+    for _ in range(keep_months - 1):
+        first = (first - timedelta(days=1)).replace(day=1)
+    return first.isoformat()
+
+
+class ArchiveManager:
+    def __init__(self, db_manager, archive_dir=None):
+        self.db_manager = db_manager
+        self.conn = self.db_manager.get_connection()
+        self.cursor = self.db_manager.get_cursor()
+        self.base_dir = os.path.dirname(os.path.abspath(self.db_manager.db_name))
+        self.archive_dir = os.path.join(self.base_dir, archive_dir or ARCHIVE_DIR or "sales_archive")
+
+    def partition_path(self, month):
+        return os.path.join(self.archive_dir, f"sales-{month}.db")
+
+    def get_months_to_archive(self, keep_months=DEFAULT_KEEP_MONTHS, today=None):
+        """:return: Months ('YYYY-MM') with sales in the live tables older than the kept ones, oldest first."""
+        self.cursor.execute("SELECT DISTINCT substr(sale_date, 1, 7) FROM sales WHERE sale_date < ? ORDER BY 1",
+                            (archive_cutoff(keep_months, today) + " 00:00:00",))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def _create_partition(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path)
+        try:
+            for statement in PARTITION_SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def archive_month(self, month):
+        """
+        Moves one month of sales (with their items and discounts) into its partition file.
+        :param month: 'YYYY-MM'.
+        :return: Number of sales moved (0 if the month still has sales waiting to be pushed to
+                 a replication peer), or None on error.
+        """
+        schema = "sales_" + month.replace("-", "_")
+        path = self.partition_path(month)
+        try:
+            bounds = month_start(month)
+            self.cursor.execute("""
+                SELECT COUNT(*) FROM change_log c
+                JOIN sales s ON s.sale_id = CAST(c.row_key AS INTEGER)
+                WHERE c.table_name = 'sales' AND c.seq > (SELECT MIN(pushed_seq) FROM sync_peers)
+                  AND s.sale_date >= ? AND s.sale_date < ?
+            """, bounds)
+            unpushed = self.cursor.fetchone()[0]
+            if unpushed:
+                logger.warning(f"Not archiving {month}: {unpushed} of its sales have not been pushed to head office yet.")
+                return 0
+
+            self._create_partition(path)
+            # ATTACH cannot run inside a transaction
+            self.db_manager.attach(schema, path)
+            month_sales = "SELECT sale_id FROM main.sales WHERE sale_date >= ? AND sale_date < ?"
+
+            self.conn.execute("BEGIN IMMEDIATE")
+            # Copy, replacing earlier copies of the same sales
+            for table in ("sale_items", "sale_discounts"):
+                self.cursor.execute(f"DELETE FROM {schema}.{table} WHERE sale_id IN ({month_sales})", bounds)
+            self.cursor.execute(f"""
+                INSERT OR REPLACE INTO {schema}.sales (sale_id, total_amount, payment_method, sale_date, cashier_id)
+                SELECT sale_id, total_amount, payment_method, sale_date, cashier_id
+                FROM main.sales WHERE sale_date >= ? AND sale_date < ?
+            """, bounds)
+            moved = self.cursor.rowcount
+            self.cursor.execute(f"""
+                INSERT INTO {schema}.sale_items (item_id, sale_id, product_id, product_name, price_at_sale, quantity, subtotal)
+                SELECT item_id, sale_id, product_id, product_name, price_at_sale, quantity, subtotal
+                FROM main.sale_items WHERE sale_id IN ({month_sales})
+            """, bounds)
+            self.cursor.execute(f"""
+                INSERT INTO {schema}.sale_discounts (sale_id, promotion_id, promotion_name, amount)
+                SELECT sale_id, promotion_id, promotion_name, amount
+                FROM main.sale_discounts WHERE sale_id IN ({month_sales})
+            """, bounds)
+
+            # Delete what was copied and register the partition. Replication triggers are
+            # muted: archiving is not a deletion to replicate
+            self.cursor.execute("UPDATE sync_state SET applying = 1 WHERE id = 1")
+            self.cursor.execute(f"""
+                DELETE FROM main.change_log
+                WHERE table_name = 'sales' AND row_key IN (SELECT CAST(sale_id AS TEXT) FROM ({month_sales}))
+            """, bounds)
+            for table in ("sale_discounts", "sale_items"):
+                self.cursor.execute(f"DELETE FROM main.{table} WHERE sale_id IN ({month_sales})", bounds)
+            self.cursor.execute("DELETE FROM main.sales WHERE sale_date >= ? AND sale_date < ?", bounds)
+            self.cursor.execute("UPDATE sync_state SET applying = 0 WHERE id = 1")
+            self.cursor.execute(f"""
+                INSERT OR REPLACE INTO sales_partitions (month, path, sales, items, first_sale_id, last_sale_id, archived_at)
+                SELECT ?, ?, COUNT(*), (SELECT COUNT(*) FROM {schema}.sale_items), MIN(sale_id), MAX(sale_id), ?
+                FROM {schema}.sales
+            """, (month, os.path.relpath(path, self.base_dir), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            self.conn.commit()
+            self.db_manager.detach(schema)
+            logger.info(f"Archived {moved} sales of {month} to {path}.")
+            return moved
+        except (sqlite3.Error, OSError, ValueError) as e:
+            self.conn.rollback()
+            logger.error(f"Error archiving sales of {month}: {e}")
+            return None
+
+    def archive_closed_months(self, keep_months=DEFAULT_KEEP_MONTHS, today=None):
+        """
+        Archives every month older than the `keep_months` most recent ones.
+        :return: List of (month, sales moved), or None on error (months archived before it stay archived).
+        """
+        try:
+            months = self.get_months_to_archive(keep_months, today)
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error listing months to archive: {e}")
+            return None
+        archived = []
+        for month in months:
+            moved = self.archive_month(month)
+            if moved is None:
+                return None
+            archived.append((month, moved))
+        return archived
+
+    def get_partitions(self):
+        """:return: List of (month, path, sales, items, first_sale_id, last_sale_id, archived_at), newest first."""
+        try:
+            self.cursor.execute("""
+                SELECT month, path, sales, items, first_sale_id, last_sale_id, archived_at
+                FROM sales_partitions ORDER BY month DESC
+            """)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error listing sales partitions: {e}")
+            return []
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move closed months of sales into monthly archive databases.")
+    parser.add_argument("database", nargs="?", default="pos_database.db")
+    parser.add_argument("--keep-months", type=int, default=DEFAULT_KEEP_MONTHS,
+                        help="Most recent months kept live, the current one included.")
+    parser.add_argument("--archive-dir", help="Directory for the partition files (default: sales_archive next to the database).")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the live database afterwards to shrink the file.")
+    parser.add_argument("--list", action="store_true", help="Only list the archived months.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    db_manager = DBManager(args.database)
+    db_manager.create_tables()
+    try:
+        archive_manager = ArchiveManager(db_manager, args.archive_dir)
+        if not args.list:
+            archived = archive_manager.archive_closed_months(args.keep_months)
+            if archived is None:
+                return 1
+            print(f"Archived {sum(moved for _, moved in archived)} sales from {len(archived)} months.")
+            if args.vacuum:
+                db_manager.get_connection().execute("VACUUM")
+        for month, path, sales, items, _, _, archived_at in archive_manager.get_partitions():
+            print(f"{month}  {sales:>8} sales  {items:>9} items  {path}  (archived {archived_at})")
+    finally:
+        db_manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+"""
+Benchmarks for the manager hot paths and an end-to-end API load generator.
+
+    python -m benchmarks.datagen --scale full          # fresh bench_pos_database.db
+    python -m benchmarks.manager_bench --output before.json
+    python -m benchmarks.manager_bench --output after.json --compare before.json
+    python -m benchmarks.loadgen --in-process --db bench_pos_database.db --lanes 8
+    python -m benchmarks.stress_checkout --mode processes --workers 8
+    python -m benchmarks.promotions_bench              # 1,000 rules x 50-line baskets
+    python -m benchmarks.analytics_bench               # columnar store vs SQLite GROUP BY
+    python -m benchmarks.consolidation_bench --branches 8   # chain reports, 1..N worker processes
+
+Run from the repository root so the manager modules are importable.
+"""
@@ -0,0 +1,78 @@
+"""
+Benchmark for the columnar analytics store: every revenue_by() dimension against the
+equivalent GROUP BY on the row-oriented sales tables. The store is exported into a
+temporary directory first (the export time is reported too) and each dimension is
+checked to give the same totals as SQLite.
+
+    python -m benchmarks.datagen --scale full
+    python -m benchmarks.analytics_bench --db bench_pos_database.db
+
+Install NumPy to measure the vectorized path; without it the pure-Python fallback is timed.
+"""
+import argparse
+import json
+import logging
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from analytics_store import ColumnarSalesStore, numpy
+from money import sql_cents
+from benchmarks.datagen import DEFAULT_DB
+from benchmarks.manager_bench import run_case
+
+SQL_GROUP_BY = {
+    "hour": f"SELECT CAST(strftime('%H', sale_date) AS INTEGER), SUM({sql_cents('total_amount')}), COUNT(*) FROM sales GROUP BY 1",
+    "day": f"SELECT substr(sale_date, 1, 10), SUM({sql_cents('total_amount')}), COUNT(*) FROM sales GROUP BY 1",
+    "month": f"SELECT substr(sale_date, 1, 7), SUM({sql_cents('total_amount')}), COUNT(*) FROM sales GROUP BY 1",
+    "cashier": f"SELECT cashier_id, SUM({sql_cents('total_amount')}), COUNT(*) FROM sales GROUP BY 1",
+    "payment_method": f"SELECT payment_method, SUM({sql_cents('total_amount')}), COUNT(*) FROM sales GROUP BY 1",
+    "product": f"SELECT product_id, SUM({sql_cents('subtotal')}), SUM(quantity) FROM sale_items GROUP BY 1",
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark columnar analytics against SQLite GROUP BY.")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="Write results JSON here.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    workdir = tempfile.mkdtemp(prefix="pos_analytics_")
+    try:
+        store = ColumnarSalesStore(workdir)
+        start = time.perf_counter()
+        exported = store.export(args.db)
+        export_ms = (time.perf_counter() - start) * 1000
+        conn = sqlite3.connect(args.db)
+
+        results = {"export": {"runs": 1, "median_ms": round(export_ms, 4)}}
+        for dimension, sql in SQL_GROUP_BY.items():
+            expected = {str(key): (cents, count) for key, cents, count in conn.execute(sql)}
+            actual = {str(key[0] if dimension == "product" else key): (round(revenue * 100), count)
+                      for key, revenue, count in store.revenue_by(dimension)}
+            if actual != expected:
+                sys.exit(f"Columnar and SQLite results differ for {dimension!r}")
+            results[f"columnar.{dimension}"] = run_case(lambda: store.revenue_by(dimension), args.repeat)
+            results[f"sqlite.{dimension}"] = run_case(lambda: conn.execute(sql).fetchall(), max(args.repeat // 4, 3))
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{exported} sales exported ({'NumPy' if numpy is not None else 'pure Python, NumPy not installed'})")
+    for name, r in results.items():
+        p95 = f"   p95 {r['p95_ms']:>10.3f} ms" if "p95_ms" in r else ""
+        print(f"{name:<45} median {r['median_ms']:>10.3f} ms{p95}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
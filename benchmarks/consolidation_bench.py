@@ -0,0 +1,84 @@
+"""
+Benchmark for consolidation.py: chain-wide reports over N branch databases with 1, 2, 4, ...
+worker processes up to the core count. The branches are hard links to one datagen database
+(copies where links are not possible), so the timings measure CPU scaling with a warm page
+cache. Every run is checked to give the same report as the single-process run.
+
+    python -m benchmarks.datagen --scale full
+    python -m benchmarks.consolidation_bench --db bench_pos_database.db --branches 8
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from consolidation import consolidate
+from benchmarks.datagen import DEFAULT_DB
+from benchmarks.manager_bench import run_case
+
+
+def _branch_files(source, workdir, count):
+    branches = []
+    for i in range(count):
+        path = os.path.join(workdir, f"branch-{i + 1:02d}.db")
+        try:
+            os.link(source, path)
+        except OSError:
+            shutil.copyfile(source, path)
+        branches.append((f"branch-{i + 1:02d}", path))
+    return branches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark multi-branch consolidation.")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--branches", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write results JSON here.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    conn = sqlite3.connect(args.db)
+    first, last = conn.execute("SELECT substr(MIN(sale_date), 1, 10), substr(MAX(sale_date), 1, 10) FROM sales").fetchone()
+    conn.close()
+
+    workdir = tempfile.mkdtemp(prefix="pos_branches_")
+    try:
+        branches = _branch_files(args.db, workdir, args.branches)
+        expected = consolidate(branches, first, last, workers=1)
+        if expected["failed"]:
+            sys.exit(f"Branches failed: {expected['failed']}")
+
+        worker_counts, workers = [], 1
+        while workers < min(os.cpu_count() or 1, args.branches):
+            worker_counts.append(workers)
+            workers *= 2
+        worker_counts.append(min(os.cpu_count() or 1, args.branches))
+
+        results = {}
+        for workers in worker_counts:
+            if consolidate(branches, first, last, workers=workers) != expected:
+                sys.exit(f"Report with {workers} workers differs from the single-process report")
+            results[f"consolidate.{args.branches}_branches.{workers}_workers"] = run_case(
+                lambda: consolidate(branches, first, last, workers=workers), args.repeat, warmup=0)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.branches} branches, {first} to {last}, {os.cpu_count()} cores")
+    baseline = results[f"consolidate.{args.branches}_branches.1_workers"]["median_ms"]
+    for name, r in results.items():
+        print(f"{name:<45} median {r['median_ms']:>10.3f} ms   speedup {baseline / r['median_ms']:>5.2f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Deterministic synthetic data for benchmarks: the same seed and sizes always produce
+the same products, sales and sale_items, in a fresh database with the normal schema.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from db_manager import DBManager
+from user_manager import UserManager
+
+DEFAULT_DB = "bench_pos_database.db"
+DEFAULT_SEED = 20240601
+
+# products, sales, max items per sale (avg ~ (1 + max) / 2 items), days of history
+SCALES = {
+    "small": (10_000, 100_000, 9, 90),
+    "medium": (50_000, 1_000_000, 9, 365),
+    "full": (100_000, 2_000_000, 9, 730),  # ~10M sale_items
+}
+
+PAYMENT_METHODS = (("Cash", 55), ("M-Pesa", 35), ("Card", 10))
+CASHIER_COUNT = 20
+BATCH_SIZE = 50_000
+
+_WORDS = ("Coca-Cola", "Dairyland", "Broadways", "Blue Band", "Kimbo", "Omo", "Colgate", "Geisha",
+          "Salt", "Sugar", "Tea", "Unga", "Rice", "Baraka", "Exe", "Ketepa", "Menengai", "Brookside",
+          "Festive", "Royco", "Ariel", "Jogoo", "Pembe", "Daawat", "Tuskys", "Elianto", "Fresh Fri")
+_SIZES = ("100g", "250g", "500g", "1kg", "2kg", "500ml", "1L", "2L", "5L", "Pack of 6")
+
+
+def product_id_for(index):
+    return f"B{index:06d}"
+
+
+def _products(rng, count):
+    for i in range(count):
+        name = f"{rng.choice(_WORDS)} {rng.choice(_WORDS)} ({rng.choice(_SIZES)}) #{i}"
+        price = round(rng.uniform(20, 2500), 2)
+        stock = rng.randint(50, 5000)
+        yield (product_id_for(i), name, price, stock)
+
+
+def generate(db_path, products, sales, max_items, days, seed=DEFAULT_SEED, end_date=None):
+    """
+    Builds the benchmark database. Product popularity is skewed (a few hundred SKUs
+    account for most sales) and sales are spread evenly over `days` up to `end_date`.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    db_manager = DBManager(db_path)
+    db_manager.create_tables()
+    user_manager = UserManager(db_manager)
+    user_manager.create_users_table()
+    user_manager.add_default_admin_if_empty()
+    conn = db_manager.get_connection()
+    # Bulk load only: no rollback journal, no fsync
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    started = time.perf_counter()
+    catalog = list(_products(rng, products))
+    conn.executemany("INSERT INTO products (product_id, name, price, stock) VALUES (?, ?, ?, ?)", catalog)
+    conn.commit()
+    db_manager.create_tables()  # books the bulk-loaded stock as opening balances in the stock ledger
+    print(f"  {products:,} products ({time.perf_counter() - started:.1f}s)")
+
+    end_date = end_date or datetime(2025, 1, 1)
+    start_ts = end_date - timedelta(days=days)
+    step = (days * 86400) / max(sales, 1)
+    methods = [m for m, _ in PAYMENT_METHODS]
+    weights = [w for _, w in PAYMENT_METHODS]
+    cashiers = [f"cashier{i:02d}" for i in range(CASHIER_COUNT)]
+
+    sale_rows, item_rows = [], []
+    item_count = 0
+    for sale_id in range(1, sales + 1):
+        sale_date = (start_ts + timedelta(seconds=int(sale_id * step))).strftime("%Y-%m-%d %H:%M:%S")
+        total = 0.0
+        for _ in range(rng.randint(1, max_items)):
+            # Pareto popularity: ~50% of lines hit the top 50 SKUs, ~90% the top 500
+            index = min(int((rng.paretovariate(1.0) - 1) * 50), products - 1)
+            index = (index * 7919) % products  # spread hot SKUs across the id space
+            product_id, name, price, _ = catalog[index]
+            qty = rng.randint(1, 5)
+            subtotal = round(price * qty, 2)
+            total += subtotal
+            item_rows.append((sale_id, product_id, name, price, qty, subtotal))
+        sale_rows.append((sale_id, round(total, 2), rng.choices(methods, weights)[0], sale_date, rng.choice(cashiers)))
+
+        if len(sale_rows) >= BATCH_SIZE:
+            item_count += _flush(conn, sale_rows, item_rows)
+            sale_rows, item_rows = [], []
+            print(f"  {sale_id:,}/{sales:,} sales, {item_count:,} items ({time.perf_counter() - started:.1f}s)", end="\r")
+    item_count += _flush(conn, sale_rows, item_rows)
+    print(f"  {sales:,} sales, {item_count:,} sale items ({time.perf_counter() - started:.1f}s)      ")
+
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute("ANALYZE")
+    conn.commit()
+    db_manager.close()
+    return item_count
+
+
+def _flush(conn, sale_rows, item_rows):
+    conn.executemany("INSERT INTO sales (sale_id, total_amount, payment_method, sale_date, cashier_id) "
+                     "VALUES (?, ?, ?, ?, ?)", sale_rows)
+    conn.executemany("INSERT INTO sale_items (sale_id, product_id, product_name, price_at_sale, quantity, subtotal) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", item_rows)
+    conn.commit()
+    return len(item_rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a deterministic benchmark database.")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--products", type=int, help="Override the scale's product count.")
+    parser.add_argument("--sales", type=int, help="Override the scale's sale count.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    products, sales, max_items, days = SCALES[args.scale]
+    products = args.products or products
+    sales = args.sales or sales
+    print(f"Generating {args.db} (scale={args.scale}, seed={args.seed})")
+    generate(args.db, products, sales, max_items, days, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+Multi-lane load generator for the Flask API. Each lane is one simulated cashier that
+logs in, fetches the catalog, then serves customers in a loop: a few searches, a
+checkout of random basket size, and now and then a manager report query.
+
+Against a running server (serve.py, or `python pos_app.py`):
+
+    python -m benchmarks.loadgen --url http://127.0.0.1:5000 --lanes 16 --duration 60
+
+Or in-process through Flask's test client, no sockets involved:
+
+    python -m benchmarks.loadgen --in-process --db bench_pos_database.db --lanes 8
+
+At the end it prints throughput, latency percentiles per operation, errors by kind
+and a stock consistency check: every product's final stock must equal its starting
+stock minus the quantities of the checkouts the API confirmed, and must never go
+negative. The consistency check assumes nothing else writes to the database during
+the run.
+"""
+import argparse
+import http.client
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+PAYMENT_METHODS = ("Cash", "M-Pesa", "Card")
+SEARCH_TERMS = ("Coca", "Milk", "Bread", "Oil", "Soap", "Sugar", "Tea", "Unga", "Rice", "Kimbo", "1kg", "500ml")
+
+
+class HttpTransport:
+    """One keep-alive HTTP connection per lane thread."""
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Accept": "application/json"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        conn = self._connection()
+        try:
+            conn.request(method, path, payload, headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection; the next request reconnects
+            conn.close()
+            self._local.conn = None
+            raise
+        return response.status, _decode(data)
+
+
+class WsgiTransport:
+    """Calls pos_app through Flask's test client (one client per lane thread)."""
+
+    def __init__(self, db_path):
+        import pos_app
+        if db_path:
+            pos_app.DATABASE_NAME = db_path
+        pos_app.setup_database_once()
+        self.app = pos_app.app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, _decode(response.get_data())
+
+
+def _decode(data):
+    try:
+        return json.loads(data) if data else None
+    except ValueError:
+        return None
+
+
+class LoadStats:
+    """Latencies per operation, outcome counters and confirmed sold quantities, shared by all lanes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.outcomes = Counter()
+        self.sold = Counter()
+        self.checkouts = 0
+
+    def record(self, operation, seconds, outcome):
+        with self._lock:
+            self.latencies[operation].append(seconds)
+            self.outcomes[(operation, outcome)] += 1
+
+    def record_sale(self, cart):
+        with self._lock:
+            self.checkouts += 1
+            for item in cart:
+                self.sold[item["product_id"]] += item["qty"]
+
+
+def classify(status, body):
+    """Maps a response to an outcome name for the error table."""
+    if 200 <= status < 300:
+        return "ok"
+    message = (body or {}).get("message", "") if isinstance(body, dict) else ""
+    if status == 400 and "Insufficient stock" in message:
+        return "out_of_stock"
+    if "Failed to update stock" in message:
+        return "stock_conflict"  # the conditional UPDATE failed with enough stock on hand (lock contention)
+    if "locked" in message.lower() or "busy" in message.lower():
+        return "db_locked"
+    if status == 503:
+        return "busy"
+    return f"http_{status}"
+
+
+class Lane(threading.Thread):
+    def __init__(self, number, transport, stats, args, start_barrier, stop_at):
+        super().__init__(name=f"lane-{number}", daemon=True)
+        self.number = number
+        self.transport = transport
+        self.stats = stats
+        self.args = args
+        self.start_barrier = start_barrier
+        self.stop_at = stop_at
+        self.rng = random.Random(args.seed * 1000 + number)
+        self.token = None
+        self.catalog = []
+
+    def call(self, operation, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            status, data = self.transport.request(method, path, body, self.token)
+        except Exception as e:
+            self.stats.record(operation, time.perf_counter() - start, f"transport:{type(e).__name__}")
+            return None, None
+        outcome = classify(status, data)
+        self.stats.record(operation, time.perf_counter() - start, outcome)
+        return outcome, data
+
+    def run(self):
+        self.start_barrier.wait()
+        outcome, data = self.call("login", "POST", "/login",
+                                  {"username": self.args.username, "password": self.args.password})
+        if outcome != "ok":
+            logging.error(f"{self.name}: login failed ({outcome}); lane stopped.")
+            return
+        self.token = data["token"]
+        self.refresh_catalog()
+
+        customers = 0
+        while time.monotonic() < self.stop_at:
+            for _ in range(self.rng.randint(0, self.args.max_searches)):
+                self.call("search", "GET", "/products/search?" + urlencode({"q": self.rng.choice(SEARCH_TERMS)}))
+            self.checkout()
+            customers += 1
+            if self.rng.random() < self.args.report_ratio:
+                self.report()
+            if customers % self.args.catalog_every == 0:
+                self.refresh_catalog()
+            if self.args.think_ms:
+                time.sleep(self.rng.uniform(0, 2 * self.args.think_ms) / 1000)
+
+    def refresh_catalog(self):
+        outcome, data = self.call("catalog", "GET", "/products")
+        if outcome == "ok" and data:
+            self.catalog = data
+
+    def pick_product(self):
+        # Skewed towards the first SKUs so lanes contend for the same rows, like best sellers
+        index = int((self.rng.paretovariate(1.0) - 1) * self.args.hot_skus)
+        return self.catalog[index % len(self.catalog)]
+
+    def checkout(self):
+        if not self.catalog:
+            return
+        basket = {}
+        for _ in range(self.rng.randint(1, self.args.max_basket)):
+            product = self.pick_product()
+            entry = basket.setdefault(product["product_id"], {
+                "product_id": product["product_id"], "name": product["name"], "price": product["price"], "qty": 0})
+            entry["qty"] += self.rng.randint(1, 3)
+        cart = list(basket.values())
+        total = 0.0
+        for item in cart:
+            item["total"] = round(item["price"] * item["qty"], 2)
+            total += item["total"]
+        tendered = float(int(total) + 100)
+        outcome, data = self.call("checkout", "POST", "/sales/checkout", {
+            "cart_items": cart,
+            "payment_method": self.rng.choice(PAYMENT_METHODS),
+            "amount_tendered": tendered,
+            "change_due": round(tendered - total, 2),
+        })
+        if outcome == "ok":
+            self.stats.record_sale(cart)
+
+    def report(self):
+        today = datetime.now()
+        kind = self.rng.randrange(3)
+        if kind == 0:
+            self.call("report.daily_sales", "GET", "/reports/daily_sales")
+        elif kind == 1:
+            start = (today - timedelta(days=self.rng.choice((1, 7)))).strftime("%Y-%m-%d")
+            self.call("report.sales_history", "GET", "/reports/sales_history?" + urlencode({"start_date": start}))
+        else:
+            self.call("report.top_products", "GET", "/reports/top_products")
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def stock_snapshot(transport, token):
+    status, data = transport.request("GET", "/products", token=token)
+    if status != 200:
+        raise RuntimeError(f"GET /products returned {status}")
+    return {p["product_id"]: p["stock"] for p in data}
+
+
+def check_consistency(before, after, sold):
+    """:return: (list of mismatch descriptions, list of product ids with negative stock)"""
+    mismatches, negative = [], []
+    for product_id, start_stock in before.items():
+        final = after.get(product_id)
+        expected = start_stock - sold.get(product_id, 0)
+        if final is None:
+            mismatches.append(f"{product_id}: missing after run")
+        elif final != expected:
+            mismatches.append(f"{product_id}: expected {expected}, found {final}")
+        if final is not None and final < 0:
+            negative.append(product_id)
+    return mismatches, negative
+
+
+def summarize(stats, elapsed, lanes, mismatches, negative):
+    operations = {}
+    for operation, values in sorted(stats.latencies.items()):
+        values.sort()
+        outcomes = {o: n for (op, o), n in stats.outcomes.items() if op == operation}
+        operations[operation] = {
+            "count": len(values),
+            "per_second": round(len(values) / elapsed, 2),
+            "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+            "outcomes": outcomes,
+        }
+    total_requests = sum(len(v) for v in stats.latencies.values())
+    errors = sum(n for (_, o), n in stats.outcomes.items() if o not in ("ok", "out_of_stock"))
+    return {
+        "lanes": lanes,
+        "elapsed_s": round(elapsed, 2),
+        "requests": total_requests,
+        "requests_per_second": round(total_requests / elapsed, 2),
+        "checkouts": stats.checkouts,
+        "checkouts_per_second": round(stats.checkouts / elapsed, 2),
+        "error_rate": round(errors / total_requests, 4) if total_requests else 0.0,
+        "operations": operations,
+        "stock_consistent": not mismatches and not negative,
+        "stock_mismatches": mismatches[:50],
+        "oversold_products": negative,
+    }
+
+
+def print_summary(summary):
+    print(f"\n{summary['lanes']} lanes, {summary['elapsed_s']}s: {summary['requests']} requests "
+          f"({summary['requests_per_second']}/s), {summary['checkouts']} checkouts "
+          f"({summary['checkouts_per_second']}/s), error rate {summary['error_rate']:.2%}")
+    print(f"{'operation':<22}{'count':>8}{'/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}  outcomes")
+    for name, op in summary["operations"].items():
+        outcomes = ", ".join(f"{k}={v}" for k, v in sorted(op["outcomes"].items()))
+        print(f"{name:<22}{op['count']:>8}{op['per_second']:>9}{op['p50_ms']:>10}{op['p95_ms']:>10}"
+              f"{op['p99_ms']:>10}{op['max_ms']:>10}  {outcomes}")
+    if summary["stock_consistent"]:
+        print("Stock consistency: OK")
+    else:
+        print(f"Stock consistency: FAILED ({len(summary['stock_mismatches'])} mismatches, "
+              f"{len(summary['oversold_products'])} oversold products)")
+        for line in summary["stock_mismatches"][:10]:
+            print(f"  {line}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent cashiers against the POS API.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running server, e.g. http://127.0.0.1:5000")
+    target.add_argument("--in-process", action="store_true", help="Drive pos_app through Flask's test client.")
+    parser.add_argument("--db", help="Database file for --in-process (default: pos_app.DATABASE_NAME).")
+    parser.add_argument("--lanes", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run.")
+    parser.add_argument("--max-basket", type=int, default=12)
+    parser.add_argument("--max-searches", type=int, default=2, help="Searches per customer, 0..N.")
+    parser.add_argument("--report-ratio", type=float, default=0.05, help="Chance of a report query per customer.")
+    parser.add_argument("--catalog-every", type=int, default=50, help="Refetch the catalog every N customers.")
+    parser.add_argument("--hot-skus", type=int, default=20, help="Popularity skew: ~half the lines hit this many SKUs.")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between customers.")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="adminpass")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the summary as JSON here.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    transport = WsgiTransport(args.db) if args.in_process else HttpTransport(args.url)
+
+    status, data = transport.request("POST", "/login", {"username": args.username, "password": args.password})
+    if status != 200:
+        sys.exit(f"Login as {args.username!r} failed with HTTP {status}.")
+    admin_token = data["token"]
+    before = stock_snapshot(transport, admin_token)
+
+    stats = LoadStats()
+    barrier = threading.Barrier(args.lanes + 1)
+    started = time.monotonic()
+    lanes = [Lane(i, transport, stats, args, barrier, started + args.duration) for i in range(args.lanes)]
+    for lane in lanes:
+        lane.start()
+    barrier.wait()
+    started = time.monotonic()
+    for lane in lanes:
+        lane.join()
+    elapsed = time.monotonic() - started
+
+    after = stock_snapshot(transport, admin_token)
+    mismatches, negative = check_consistency(before, after, stats.sold)
+    summary = summarize(stats, elapsed, args.lanes, mismatches, negative)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0 if summary["stock_consistent"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
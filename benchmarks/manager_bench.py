@@ -0,0 +1,199 @@
+"""
+Micro-benchmarks for ProductManager and SalesManager against a database built by
+benchmarks.datagen. Results are written as JSON so runs on different commits can be
+compared with --compare.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from db_manager import DBManager
+from product_manager import ProductManager
+from sales_manager import SalesManager
+from price_manager import PriceManager
+from money import cart_totals, from_cents
+from benchmarks.datagen import DEFAULT_DB, product_id_for
+
+DEFAULT_REPEAT = 30
+REGRESSION_THRESHOLD = 0.10  # flag changes of more than 10% in the median
+
+
+class BenchContext:
+    """Managers plus facts about the benchmark data that the cases need (ids, date range)."""
+
+    def __init__(self, db_path, seed):
+        self.db_manager = DBManager(db_path)
+        self.product_manager = ProductManager(self.db_manager)
+        self.sales_manager = SalesManager(self.db_manager)
+        self.price_manager = PriceManager(self.db_manager)
+        self.rng = random.Random(seed)
+        cursor = self.db_manager.get_cursor()
+        cursor.execute("SELECT COUNT(*) FROM products")
+        self.product_count = cursor.fetchone()[0]
+        cursor.execute("SELECT MIN(sale_id), MAX(sale_id), MAX(sale_date) FROM sales")
+        self.min_sale_id, self.max_sale_id, last_sale = cursor.fetchone()
+        self.last_day = datetime.strptime(last_sale[:10], "%Y-%m-%d") if last_sale else datetime.now()
+
+    def random_product_id(self):
+        return product_id_for(self.rng.randrange(self.product_count))
+
+    def day(self, days_back=0):
+        return (self.last_day - timedelta(days=days_back)).strftime("%Y-%m-%d")
+
+
+def checkout(ctx, basket_size):
+    """
+    The manager calls made by pos_app.process_checkout. Rolled back at the end so the
+    benchmark database (stock, sale ids, date range) is identical for every run; the
+    commit/fsync cost is therefore not included.
+    """
+    conn = ctx.db_manager.get_connection()
+    prices = ctx.price_manager.current_prices_cents()
+    product_ids = [ctx.random_product_id() for _ in range(basket_size)]
+    conn.execute("BEGIN TRANSACTION")
+    for product_id in product_ids:
+        if not ctx.product_manager.decrease_product_stock(product_id, 1):
+            conn.rollback()
+            return
+    totals = cart_totals([prices[product_id] for product_id in product_ids], [1] * basket_size)
+    sale_id = ctx.sales_manager.record_sale(from_cents(totals["total"]), "Cash", "bench")
+    for product_id, line_total in zip(product_ids, totals["line_totals"]):
+        ctx.sales_manager.record_sale_item(sale_id, product_id, product_id, from_cents(prices[product_id]), 1,
+                                           from_cents(line_total))
+    conn.rollback()
+
+
+def benchmark_cases(ctx):
+    """name -> zero-argument callable. Every SalesManager report method is covered."""
+    pm, sm = ctx.product_manager, ctx.sales_manager
+    return {
+        "product.get_all_products": lambda: pm.get_all_products(),
+        "product.search_products.name": lambda: pm.search_products("Kimbo"),
+        "product.search_products.rare": lambda: pm.search_products("#9999"),
+        "product.get_product_by_id": lambda: pm.get_product_by_id(ctx.random_product_id()),
+        "price.get_price_as_of": lambda: ctx.price_manager.get_price_as_of(ctx.random_product_id(), ctx.day(30)),
+        "checkout.basket_1": lambda: checkout(ctx, 1),
+        "checkout.basket_10": lambda: checkout(ctx, 10),
+        "sales.get_sale_details": lambda: sm.get_sale_details(ctx.rng.randint(ctx.min_sale_id, ctx.max_sale_id)),
+        "sales.get_sales_report.1_day": lambda: sm.get_sales_report(ctx.day() + " 00:00:00", ctx.day() + " 23:59:59"),
+        "sales.get_sales_report.7_days": lambda: sm.get_sales_report(ctx.day(7) + " 00:00:00", ctx.day() + " 23:59:59"),
+        "sales.get_top_selling_products.30_days": lambda: sm.get_top_selling_products(10, ctx.day(30), ctx.day()),
+        "sales.get_top_selling_products.all_time": lambda: sm.get_top_selling_products(10),
+        "sales.get_daily_sales_summary": lambda: sm.get_daily_sales_summary(ctx.day(1)),
+        "sales.generate_z_report": lambda: sm.generate_z_report(ctx.day(1)),
+        "sales.get_z_report": lambda: sm.get_z_report(ctx.day(1)),
+        # The public methods cache closed periods; the uncached cases time the query itself
+        "sales.get_top_selling_products.30_days.uncached": lambda: sm._top_selling_products(10, ctx.day(30), ctx.day()),
+        "sales.get_sales_timeseries.30_days_daily": lambda: sm.get_sales_timeseries(ctx.day(30), ctx.day()),
+        "sales.get_sales_timeseries.30_days_daily.uncached": lambda: sm._sales_timeseries(ctx.day(30), ctx.day(), "day"),
+        "sales.get_sales_timeseries.7_days_hourly.uncached": lambda: sm._sales_timeseries(ctx.day(7), ctx.day(), "hour"),
+        "sales.get_sales_heatmap.30_days.uncached": lambda: sm._sales_heatmap(ctx.day(30), ctx.day(), None),
+        "sales.get_cashier_summary.30_days.uncached": lambda: sm._cashier_summary(ctx.day(30), ctx.day()),
+    }
+
+
+def run_case(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    regressions = 0
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            print(f"  {name:<45} new")
+            continue
+        change = (result["median_ms"] - old["median_ms"]) / old["median_ms"] if old["median_ms"] else 0.0
+        flag = ""
+        if change > REGRESSION_THRESHOLD:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -REGRESSION_THRESHOLD:
+            flag = "  improved"
+        print(f"  {name:<45} {old['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms ({change:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark manager hot paths.")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--only", help="Run only cases whose name contains this text.")
+    parser.add_argument("--output", help="Write results JSON here.")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against.")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        sys.exit(f"{args.db} not found; create it with: python -m benchmarks.datagen")
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    ctx = BenchContext(args.db, args.seed)
+    results = {}
+    for name, fn in benchmark_cases(ctx).items():
+        if args.only and args.only not in name:
+            continue
+        results[name] = run_case(fn, args.repeat)
+        r = results[name]
+        print(f"{name:<45} median {r['median_ms']:>10.3f} ms   p95 {r['p95_ms']:>10.3f} ms")
+    ctx.db_manager.close()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "db": os.path.abspath(args.db),
+            "products": ctx.product_count,
+            "sales": ctx.max_sale_id,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        return 1 if compare(report, args.compare) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+Query-plan regression check for the manager SQL.
+
+Every public ProductManager, SalesManager, UserManager, InventoryManager,
+PriceManager, PromotionManager, ReorderManager, ReplicationManager and ArchiveManager method is run against a populated copy of the
+schema while the connection's trace callback records the statements it issues, so
+new or edited queries are picked up without listing them here. Each statement is
+then explained with EXPLAIN QUERY PLAN and
+
+  - any full SCAN of a large table fails, unless the case is listed in ALLOWED_SCANS
+    with the reason the scan is inherent;
+  - any plan that differs from the recorded one in query_plans.json fails with a diff.
+
+    python -m benchmarks.query_plans              # check, exit status 1 on failure
+    python -m benchmarks.query_plans --update     # accept the current plans
+
+By default a small database is generated with benchmarks.datagen, which is what the
+recorded plans describe. --db checks a copy of an existing database instead (the
+original is never modified); plans there depend on its statistics, so only the
+full-scan rule is applied.
+"""
+import argparse
+import difflib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from db_manager import DBManager
+from product_manager import ProductManager
+from sales_manager import SalesManager
+from user_manager import UserManager
+from inventory_manager import InventoryManager
+from price_manager import PriceManager
+from promotion_manager import PromotionManager
+from reorder_manager import ReorderManager
+from replication import ReplicationManager
+from archive_manager import ArchiveManager
+from sql_trace import normalize_sql
+from benchmarks import datagen
+
+EXPECTED_PLANS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_plans.json")
+LARGE_TABLES = {"products", "sales", "sale_items"}
+
+# case name -> why a full scan is expected there
+ALLOWED_SCANS = {
+    "product.get_all_products": "returns the whole catalog",
+    "product.search_products": "substring LIKE '%q%' cannot use a b-tree index",
+    "sales.get_sales_report.all": "no date filter: reads every sale",
+    "sales.iter_sales_report.all": "no date filter: reads every sale",
+    "sales.get_top_selling_products.all_time": "no date filter: aggregates every sale item",
+    "inventory.take_snapshot": "visits every product once; per-product lookups use the ledger indexes",
+    "inventory.verify_stock_cache": "audits every product against the ledger",
+    "inventory.rebuild_stock_cache": "audits every product against the ledger",
+    "price.current_prices": "loads the whole price map (only after a price change)",
+    "price.get_prices_as_of": "prices every product; per-product lookups use the price_history key",
+    "reorder.compute_suggestions": "recomputes a suggestion for every product",
+    "reorder.get_reorder_suggestions.all": "lists every product's suggestion",
+    "inventory.set_thresholds_from_reorder_points": "sets a threshold for every product with a reorder point",
+    "archive.archive_month": "counts the rows of the month's partition file, not the live tables",
+}
+
+_STATEMENT_KINDS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+_SCAN = re.compile(r"^SCAN (\w+)")
+_TABLE_ALIAS = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+
+
+def manager_cases(pm, sm, um, im, prm, prom, rom, rpm, am, ids):
+    """name -> callable exercising one manager method with realistic arguments."""
+    day = ids["last_day"]
+    return {
+        "product.add_product": lambda: pm.add_product("QP-NEW-1", "Query plan product", 10.0, 5),
+        "product.get_all_products": lambda: pm.get_all_products(),
+        "product.get_product_by_id": lambda: pm.get_product_by_id(ids["product_id"]),
+        "product.search_products": lambda: pm.search_products("Kimbo"),
+        "product.update_product": lambda: pm.update_product("QP-NEW-1", "Query plan product", 11.0, 5),
+        "product.decrease_product_stock": lambda: pm.decrease_product_stock("QP-NEW-1", 1),
+        "product.delete_product": lambda: pm.delete_product("QP-NEW-1"),
+        "sales.record_sale": lambda: sm.record_sale(10.0, "Cash", "qp"),
+        "sales.record_sale_item": lambda: sm.record_sale_item(ids["sale_id"], ids["product_id"], "x", 1.0, 1, 1.0),
+        "sales.record_sale_discounts": lambda: sm.record_sale_discounts(ids["sale_id"], [{"promotion_id": 1, "name": "x", "amount_cents": 100}]),
+        "sales.get_sale_details": lambda: sm.get_sale_details(ids["sale_id"]),
+        "sales.get_sales_report.range": lambda: sm.get_sales_report(day + " 00:00:00", day + " 23:59:59"),
+        "sales.get_sales_report.all": lambda: sm.get_sales_report(),
+        "sales.iter_sales_report.range": lambda: list(sm.iter_sales_report(day + " 00:00:00", day + " 23:59:59")),
+        "sales.iter_sales_report.all": lambda: list(sm.iter_sales_report()),
+        "sales.get_top_selling_products.range": lambda: sm._top_selling_products(10, day, day),
+        "sales.get_top_selling_products.all_time": lambda: sm.get_top_selling_products(10),
+        "sales.get_daily_sales_summary": lambda: sm.get_daily_sales_summary(day),
+        "sales.get_sales_timeseries": lambda: sm._sales_timeseries(day, day, "hour"),
+        "sales.get_sales_heatmap": lambda: sm._sales_heatmap(day, day, "Cash"),
+        "sales.get_cashier_summary": lambda: sm._cashier_summary(day, day),
+        "sales.generate_z_report": lambda: sm.generate_z_report(day),
+        "sales.get_z_report": lambda: sm.get_z_report(day),
+        "users.get_all_users": lambda: um.get_all_users(),
+        "users.verify_user": lambda: um.verify_user("admin", "adminpass"),
+        "users.add_default_admin_if_empty": lambda: um.add_default_admin_if_empty(),
+        "inventory.record_movement": lambda: im.record_movement(ids["product_id"], 1, "adjustment"),
+        "inventory.receive_stock": lambda: im.receive_stock(ids["product_id"], 1, "qp"),
+        "inventory.get_movements": lambda: im.get_movements(ids["product_id"], end=day),
+        "inventory.get_stock_as_of": lambda: im.get_stock_as_of(ids["product_id"], day),
+        "inventory.take_snapshot": lambda: im.take_snapshot(),
+        "inventory.verify_stock_cache": lambda: im.verify_stock_cache(),
+        "inventory.rebuild_stock_cache": lambda: im.rebuild_stock_cache(),
+        "inventory.set_reorder_threshold": lambda: im.set_reorder_threshold(ids["product_id"], 10**6),
+        "inventory.set_thresholds_from_reorder_points": lambda: im.set_thresholds_from_reorder_points(),
+        "inventory.get_low_stock_products": lambda: im.get_low_stock_products(),
+        "inventory.get_stock_alerts": lambda: im.get_stock_alerts(0),
+        "price.current_prices": lambda: prm.current_prices(),
+        "price.get_price_as_of": lambda: prm.get_price_as_of(ids["product_id"], day),
+        "price.get_prices_as_of": lambda: prm.get_prices_as_of(day),
+        "price.get_price_history": lambda: prm.get_price_history(ids["product_id"]),
+        "promotions.add_promotion": lambda: prom.add_promotion("qp", "percent_off", {"product_ids": [ids["product_id"]], "percent": 10}),
+        "promotions.set_promotion_active": lambda: prom.set_promotion_active(1, False),
+        "promotions.get_promotions": lambda: prom.get_promotions(),
+        "promotions.get_engine": lambda: prom.get_engine(),
+        "reorder.roll_up_daily_sales": lambda: rom.roll_up_daily_sales(),
+        "reorder.compute_suggestions": lambda: rom.compute_suggestions(),
+        "reorder.get_reorder_suggestions": lambda: rom.get_reorder_suggestions(limit=50),
+        "reorder.get_reorder_suggestions.all": lambda: rom.get_reorder_suggestions(only_due=False),
+        "reorder.get_reorder_status": lambda: rom.get_reorder_status(),
+        # Moves the oldest month out, so the cases from here on read across a partition
+        "archive.get_months_to_archive": lambda: am.get_months_to_archive(keep_months=1),
+        "archive.archive_month": lambda: am.archive_month(ids["first_month"]),
+        "sales.get_sales_timeseries.archived": lambda: sm._sales_timeseries(ids["first_month"] + "-01", ids["last_day"], "day"),
+        "sales.get_top_selling_products.archived": lambda: sm._top_selling_products(10, ids["first_month"] + "-01", ids["last_day"]),
+        "sales.get_sale_details.archived": lambda: sm.get_sale_details(ids["first_sale_id"]),
+        "replication.changes_since": lambda: rpm.changes_since(0),
+        "replication.apply_changes": lambda: rpm.apply_changes("plan-peer", {
+            "last_seq": 1, "columns": ["product_id", "name", "price"],
+            "rows": [[ids["product_id"], "Plan product", 1.0]], "deleted": ["NO-SUCH-PRODUCT"]}),
+        "replication.sales_since": lambda: rpm.sales_since(0),
+        "replication.apply_sales": lambda: rpm.apply_sales("plan-origin", [
+            [1, 10.0, "Cash", f"{ids['last_day']} 12:00:00", "plan", [[ids["product_id"], "Plan product", 10.0, 1, 10.0]]]
+        ], [2]),
+        "replication.acknowledge_push": lambda: rpm.acknowledge_push("plan-peer", 1),
+        "replication.get_sync_status": lambda: rpm.get_sync_status(),
+    }
+
+
+def capture_statements(conn, fn):
+    """Runs fn and returns the data statements it executed, with bound values expanded."""
+    statements = []
+
+    def _trace(sql):
+        # Each trigger statement is reported again as the triggering statement; skip the echoes
+        if sql.lstrip().upper().startswith(_STATEMENT_KINDS + ("ATTACH",)) and (not statements or statements[-1] != sql):
+            statements.append(sql)
+
+    conn.set_trace_callback(_trace)
+    try:
+        fn()
+    finally:
+        conn.set_trace_callback(None)
+        if conn.in_transaction:
+            conn.rollback()
+    return statements
+
+
+def explain(conn, sql):
+    """:return: EXPLAIN QUERY PLAN as indented lines, with version differences normalized."""
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        detail = detail.replace("SCAN TABLE ", "SCAN ").replace("SEARCH TABLE ", "SEARCH ")
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def large_table_scans(sql, plan):
+    aliases = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.upper() not in ("WHERE", "ON", "GROUP", "ORDER", "LIMIT", "JOIN", "LEFT", "INNER"):
+            aliases[alias.lower()] = table.lower()
+    scans = []
+    for line in plan:
+        match = _SCAN.match(line.strip())
+        if match and aliases.get(match.group(1).lower(), match.group(1).lower()) in LARGE_TABLES:
+            scans.append(line.strip())
+    return scans
+
+
+def collect_plans(db_path):
+    db_manager = DBManager(db_path, trace=False)
+    pm, sm, um = ProductManager(db_manager), SalesManager(db_manager), UserManager(db_manager)
+    im, prm, prom = InventoryManager(db_manager), PriceManager(db_manager), PromotionManager(db_manager)
+    rom, rpm, am = ReorderManager(db_manager), ReplicationManager(db_manager), ArchiveManager(db_manager)
+    conn = db_manager.get_connection()
+    plain = sqlite3.connect(db_path)
+
+    sale_id, last_sale, first_sale_id, first_sale = conn.execute(
+        "SELECT MAX(sale_id), MAX(sale_date), MIN(sale_id), MIN(sale_date) FROM sales").fetchone()
+    ids = {
+        "product_id": conn.execute("SELECT MIN(product_id) FROM products").fetchone()[0],
+        "sale_id": sale_id,
+        "last_day": last_sale[:10],
+        "first_sale_id": first_sale_id,
+        "first_month": first_sale[:7],
+    }
+
+    plans = {}
+    for name, fn in manager_cases(pm, sm, um, im, prm, prom, rom, rpm, am, ids).items():
+        entries = []
+        seen = set()
+        for sql in capture_statements(conn, fn):
+            if sql.lstrip().upper().startswith("ATTACH"):
+                # Archived sales partitions the case reads are needed to explain its statements
+                if not plain.in_transaction:
+                    try:
+                        plain.execute(sql)
+                    except sqlite3.OperationalError:
+                        pass  # attached by an earlier case
+                continue
+            normalized = normalize_sql(sql)
+            if normalized in seen:
+                continue  # executemany() reports every row; one plan per distinct statement
+            seen.add(normalized)
+            entries.append({"sql": normalized, "plan": explain(plain, sql), "raw": sql})
+        plans[name] = entries
+    plain.close()
+    db_manager.close()
+    return plans
+
+
+def check(plans, expected=None):
+    """Scan violations always; plan diffs only when `expected` (recorded plans) is given."""
+    failures = []
+    for name, entries in plans.items():
+        problems = []
+        for entry in entries:
+            scans = large_table_scans(entry["raw"], entry["plan"])
+            if scans and name not in ALLOWED_SCANS:
+                problems.append(f"full scan of a large table: {'; '.join(scans)}\n      in: {entry['sql']}")
+        current = _render(entries)
+        if expected is None:
+            pass
+        elif name in expected and expected[name] != current:
+            diff = difflib.unified_diff(expected[name], current, "expected", "current", lineterm="", n=2)
+            problems.append("plan changed:\n" + "\n".join("      " + line for line in diff))
+        elif name not in expected:
+            problems.append("no recorded plan (run with --update to record it)")
+        if problems:
+            failures.append((name, problems))
+    for name in sorted(set(expected or ()) - set(plans)):
+        failures.append((name, ["recorded plan has no matching case any more (run with --update)"]))
+    return failures
+
+
+def _render(entries):
+    lines = []
+    for entry in entries:
+        lines.append(entry["sql"])
+        lines.extend("  " + line for line in entry["plan"])
+    return lines
+
+
+def _prepare_database(source, workdir):
+    db_path = os.path.join(workdir, "plans.db")
+    if source:
+        src, dst = sqlite3.connect(source), sqlite3.connect(db_path)
+        src.backup(dst)
+        src.close()
+        dst.close()
+        # The copy may predate newer indexes; add them as the app would on startup
+        db_manager = DBManager(db_path, trace=False)
+        db_manager.create_tables()
+        db_manager.close()
+    else:
+        datagen.generate(db_path, products=5000, sales=20000, max_items=9, days=90)
+    return db_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check manager query plans for regressions.")
+    parser.add_argument("--db", help="Check against a copy of this database instead of generated data.")
+    parser.add_argument("--update", action="store_true", help=f"Record the current plans in {EXPECTED_PLANS}.")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Print every plan.")
+    args = parser.parse_args(argv)
+    if args.update and args.db:
+        parser.error("--update records plans for the generated data; it cannot be combined with --db")
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    workdir = tempfile.mkdtemp(prefix="pos_query_plans_")
+    try:
+        plans = collect_plans(_prepare_database(args.db, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.verbose:
+        for name, entries in plans.items():
+            print(f"{name}:")
+            print("\n".join("  " + line for line in _render(entries)))
+
+    expected = None
+    if args.update:
+        with open(EXPECTED_PLANS, "w", encoding="utf-8") as f:
+            json.dump({name: _render(entries) for name, entries in plans.items()}, f, indent=2)
+            f.write("\n")
+        print(f"Recorded {len(plans)} cases in {EXPECTED_PLANS}")
+    elif not args.db:
+        expected = {}
+        if os.path.exists(EXPECTED_PLANS):
+            with open(EXPECTED_PLANS, encoding="utf-8") as f:
+                expected = json.load(f)
+
+    failures = check(plans, expected)
+    for name, problems in failures:
+        print(f"FAIL {name}")
+        for problem in problems:
+            print(f"    {problem}")
+    print(f"{len(plans) - len(failures)}/{len(plans)} cases OK (SQLite {sqlite3.sqlite_version})")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Oversell stress test: thousands of parallel checkouts against a handful of hot SKUs
+with limited stock, then a consistency audit of the database.
+
+    python -m benchmarks.stress_checkout --mode threads --workers 16
+    python -m benchmarks.stress_checkout --mode processes --workers 8
+    python -m benchmarks.stress_checkout --mode api-in-process --workers 16
+    python -m benchmarks.stress_checkout --mode api --url http://127.0.0.1:5000 --db pos_database.db
+
+'threads' and 'processes' run the checkout sequence through the managers directly (the
+same calls pos_app.process_checkout makes, each worker with its own connection); the
+api modes go through POST /sales/checkout. After the run it checks that
+
+  - no hot SKU has negative stock,
+  - each SKU's stock delta equals the quantity recorded in sale_items,
+  - the recorded quantities equal what the workers were told was sold,
+  - the stock ledger (stock_movements) sums to each SKU's products.stock,
+  - every new sale has items and its total matches its item subtotals less its discounts
+    to the cent,
+  - the number of new sales equals the number of successful checkouts.
+
+Exit status is 1 if any check fails. In 'api' mode the database checks need --db
+pointing at the server's database file; without it only the stock checks are made.
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from db_manager import DBManager
+from product_manager import ProductManager
+from sales_manager import SalesManager
+from price_manager import PriceManager
+from money import cart_totals, from_cents, sql_cents
+
+MODES = ("threads", "processes", "api", "api-in-process")
+
+
+def manager_checkout(db_manager, product_manager, sales_manager, price_manager, cart):
+    """
+    The checkout sequence of pos_app.process_checkout on the manager layer.
+    :param cart: list of (product_id, qty)
+    :return: outcome name
+    """
+    prices = price_manager.current_prices_cents()
+    conn = db_manager.get_connection()
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        for product_id, qty in cart:
+            if product_id not in prices:
+                conn.rollback()
+                return "read_failed"
+            # The managers swallow sqlite errors, so the product is read back to tell
+            # a lost stock race from a failed write
+            if not product_manager.decrease_product_stock(product_id, qty):
+                product = product_manager.get_product_by_id(product_id)
+                conn.rollback()
+                return "out_of_stock" if product and qty > product[3] else "update_failed"
+        totals = cart_totals([prices[product_id] for product_id, _ in cart], [qty for _, qty in cart])
+        sale_id = sales_manager.record_sale(from_cents(totals["total"]), "Cash", "stress")
+        if sale_id is None:
+            conn.rollback()
+            return "insert_failed"
+        for (product_id, qty), line_total in zip(cart, totals["line_totals"]):
+            if not sales_manager.record_sale_item(sale_id, product_id, product_id, from_cents(prices[product_id]), qty,
+                                                  from_cents(line_total)):
+                conn.rollback()
+                return "insert_failed"
+        conn.commit()
+        return "ok"
+    except sqlite3.Error as e:
+        conn.rollback()
+        return "db_locked" if "locked" in str(e) else "db_error"
+
+
+def random_cart(rng, hot_ids, max_lines, max_qty):
+    ids = rng.sample(hot_ids, rng.randint(1, min(max_lines, len(hot_ids))))
+    return [(product_id, rng.randint(1, max_qty)) for product_id in ids]
+
+
+def manager_worker(db_path, hot_ids, attempts, seed, max_lines, max_qty):
+    """Runs in a thread or a child process; returns plain data so it pickles."""
+    logging.basicConfig(level=logging.CRITICAL)
+    rng = random.Random(seed)
+    db_manager = DBManager(db_path, trace=False)
+    product_manager, sales_manager = ProductManager(db_manager), SalesManager(db_manager)
+    price_manager = PriceManager(db_manager)
+    outcomes, sold, latencies = Counter(), Counter(), []
+    for _ in range(attempts):
+        cart = random_cart(rng, hot_ids, max_lines, max_qty)
+        start = time.perf_counter()
+        outcome = manager_checkout(db_manager, product_manager, sales_manager, price_manager, cart)
+        latencies.append(time.perf_counter() - start)
+        outcomes[outcome] += 1
+        if outcome == "ok":
+            for product_id, qty in cart:
+                sold[product_id] += qty
+    db_manager.close()
+    return outcomes, sold, latencies
+
+
+def api_worker(transport, username, password, catalog, attempts, seed, max_lines, max_qty):
+    from benchmarks.loadgen import classify
+    rng = random.Random(seed)
+    outcomes, sold, latencies = Counter(), Counter(), []
+    status, data = transport.request("POST", "/login", {"username": username, "password": password})
+    if status != 200:
+        outcomes[f"login_http_{status}"] += attempts
+        return outcomes, sold, latencies
+    token = data["token"]
+    for _ in range(attempts):
+        cart = random_cart(rng, sorted(catalog), max_lines, max_qty)
+        items = [{"product_id": pid, "name": catalog[pid]["name"], "price": catalog[pid]["price"], "qty": qty,
+                  "total": round(catalog[pid]["price"] * qty, 2)} for pid, qty in cart]
+        total = sum(item["total"] for item in items)
+        body = {"cart_items": items, "payment_method": "Cash", "amount_tendered": total, "change_due": 0}
+        start = time.perf_counter()
+        try:
+            status, data = transport.request("POST", "/sales/checkout", body, token)
+            outcome = classify(status, data)
+        except Exception as e:
+            outcome = f"transport:{type(e).__name__}"
+        latencies.append(time.perf_counter() - start)
+        outcomes[outcome] += 1
+        if outcome == "ok":
+            for product_id, qty in cart:
+                sold[product_id] += qty
+    return outcomes, sold, latencies
+
+
+def create_hot_skus(db_path, count, stock, run_tag):
+    db_manager = DBManager(db_path, trace=False)
+    db_manager.create_tables()
+    product_manager = ProductManager(db_manager)
+    hot_ids = [f"HOT-{run_tag}-{i}" for i in range(count)]
+    for i, product_id in enumerate(hot_ids):
+        product_manager.add_product(product_id, f"Stress item {i}", 10.0 + i, stock)
+    db_manager.close()
+    return hot_ids
+
+
+def max_sale_id(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COALESCE(MAX(sale_id), 0) FROM sales").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def audit_database(db_path, hot_ids, initial_stock, client_sold, ok_count, first_sale_id):
+    """:return: list of violation messages (empty when consistent)"""
+    violations = []
+    conn = sqlite3.connect(db_path)
+    try:
+        placeholders = ",".join("?" * len(hot_ids))
+        final = dict(conn.execute(
+            f"SELECT product_id, stock FROM products WHERE product_id IN ({placeholders})", hot_ids).fetchall())
+        recorded = dict(conn.execute(
+            f"SELECT product_id, SUM(quantity) FROM sale_items WHERE sale_id > ? AND product_id IN ({placeholders}) "
+            "GROUP BY product_id", [first_sale_id] + hot_ids).fetchall())
+        for product_id in hot_ids:
+            delta = initial_stock - final[product_id]
+            if final[product_id] < 0:
+                violations.append(f"{product_id}: negative stock {final[product_id]}")
+            if delta != recorded.get(product_id, 0):
+                violations.append(f"{product_id}: stock fell by {delta} but sale_items record {recorded.get(product_id, 0)}")
+            if recorded.get(product_id, 0) != client_sold.get(product_id, 0):
+                violations.append(f"{product_id}: sale_items record {recorded.get(product_id, 0)} sold, "
+                                  f"workers were told {client_sold.get(product_id, 0)}")
+
+        ledger = dict(conn.execute(
+            f"SELECT product_id, SUM(delta) FROM stock_movements WHERE product_id IN ({placeholders}) "
+            "GROUP BY product_id", hot_ids).fetchall())
+        for product_id in hot_ids:
+            if ledger.get(product_id) != final[product_id]:
+                violations.append(f"{product_id}: stock ledger sums to {ledger.get(product_id)}, "
+                                  f"products.stock is {final[product_id]}")
+
+        # Compared as integer cents: checkout does its money arithmetic exactly
+        sales = conn.execute(f"""
+            SELECT s.sale_id, {sql_cents('s.total_amount')},
+                   COALESCE(SUM({sql_cents('si.subtotal')}), 0)
+                   - (SELECT COALESCE(SUM({sql_cents('d.amount')}), 0) FROM sale_discounts d WHERE d.sale_id = s.sale_id),
+                   COUNT(si.item_id)
+            FROM sales s LEFT JOIN sale_items si ON si.sale_id = s.sale_id
+            WHERE s.sale_id > ?
+            GROUP BY s.sale_id
+        """, (first_sale_id,)).fetchall()
+        if len(sales) != ok_count:
+            violations.append(f"{len(sales)} new sales recorded for {ok_count} successful checkouts")
+        for sale_id, total, items_total, item_count in sales:
+            if item_count == 0:
+                violations.append(f"sale {sale_id} has no items")
+            elif total != items_total:
+                violations.append(f"sale {sale_id}: total {from_cents(total)} but items less discounts come to {from_cents(items_total)}")
+    finally:
+        conn.close()
+    return violations
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel checkout stress test for oversell and consistency.")
+    parser.add_argument("--mode", choices=MODES, default="threads")
+    parser.add_argument("--url", help="Server base URL for --mode api.")
+    parser.add_argument("--db", help="Database file (default: a fresh temporary one; for --mode api the server's).")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--checkouts", type=int, default=5000, help="Total checkout attempts.")
+    parser.add_argument("--skus", type=int, default=3, help="Number of hot SKUs.")
+    parser.add_argument("--stock", type=int, default=500, help="Starting stock of each hot SKU.")
+    parser.add_argument("--max-lines", type=int, default=3)
+    parser.add_argument("--max-qty", type=int, default=3)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="adminpass")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    if args.mode == "api" and not args.url:
+        parser.error("--mode api needs --url")
+    logging.basicConfig(level=logging.CRITICAL)
+
+    run_tag = uuid.uuid4().hex[:6].upper()
+    db_path = args.db
+    if db_path is None and args.mode != "api":
+        db_path = os.path.join(tempfile.mkdtemp(prefix="pos_stress_"), "stress.db")
+    per_worker = [args.checkouts // args.workers + (1 if i < args.checkouts % args.workers else 0)
+                  for i in range(args.workers)]
+    seeds = [args.seed * 1000 + i for i in range(args.workers)]
+
+    if args.mode in ("threads", "processes"):
+        hot_ids = create_hot_skus(db_path, args.skus, args.stock, run_tag)
+        first_sale_id = max_sale_id(db_path)
+        executor_cls = ThreadPoolExecutor if args.mode == "threads" else ProcessPoolExecutor
+        submit_args = [(db_path, hot_ids, n, seed, args.max_lines, args.max_qty) for n, seed in zip(per_worker, seeds)]
+        worker = manager_worker
+    else:
+        from benchmarks.loadgen import HttpTransport, WsgiTransport
+        transport = HttpTransport(args.url) if args.mode == "api" else WsgiTransport(db_path)
+        status, data = transport.request("POST", "/login", {"username": args.username, "password": args.password})
+        if status != 200:
+            sys.exit(f"Login as {args.username!r} failed with HTTP {status}.")
+        hot_ids = []
+        for i in range(args.skus):
+            product_id = f"HOT-{run_tag}-{i}"
+            status, _ = transport.request("POST", "/products", {"product_id": product_id, "name": f"Stress item {i}",
+                                                                "price": 10.0 + i, "stock": args.stock}, data["token"])
+            if status != 201:
+                sys.exit(f"Creating {product_id} failed with HTTP {status}.")
+            hot_ids.append(product_id)
+        status, products = transport.request("GET", "/products", token=data["token"])
+        catalog = {p["product_id"]: p for p in products if p["product_id"] in hot_ids}
+        first_sale_id = max_sale_id(db_path) if db_path else None
+        executor_cls = ThreadPoolExecutor
+        submit_args = [(transport, args.username, args.password, catalog, n, seed, args.max_lines, args.max_qty)
+                       for n, seed in zip(per_worker, seeds)]
+        worker = api_worker
+
+    print(f"{args.mode}: {args.checkouts} checkouts from {args.workers} workers on {args.skus} SKUs "
+          f"x {args.stock} stock ({db_path or args.url})")
+    outcomes, sold, latencies = Counter(), Counter(), []
+    started = time.perf_counter()
+    with executor_cls(max_workers=args.workers) as executor:
+        futures = [executor.submit(worker, *a) for a in submit_args]
+        for future in futures:
+            worker_outcomes, worker_sold, worker_latencies = future.result()
+            outcomes.update(worker_outcomes)
+            sold.update(worker_sold)
+            latencies.extend(worker_latencies)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    attempts = sum(outcomes.values())
+    print(f"{attempts} attempts in {elapsed:.2f}s: {attempts / elapsed:.0f} attempts/s, "
+          f"{outcomes['ok'] / elapsed:.0f} sales/s")
+    print(f"latency p50 {_percentile(latencies, 0.5) * 1000:.2f} ms, p95 {_percentile(latencies, 0.95) * 1000:.2f} ms, "
+          f"p99 {_percentile(latencies, 0.99) * 1000:.2f} ms, max {(latencies[-1] if latencies else 0) * 1000:.2f} ms")
+    print("outcomes: " + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())))
+
+    if args.mode == "api-in-process":
+        import pos_app
+        if pos_app.sales_journal is not None:
+            # Journal mode acknowledges before the tables are written; audit what was applied
+            pos_app.sales_journal.wait_applied(timeout=60)
+    if db_path:
+        violations = audit_database(db_path, hot_ids, args.stock, sold, outcomes["ok"], first_sale_id)
+    else:
+        status, products = transport.request("GET", "/products")
+        final = {p["product_id"]: p["stock"] for p in products}
+        violations = [f"{pid}: negative stock {final[pid]}" for pid in hot_ids if final[pid] < 0]
+        violations += [f"{pid}: stock fell by {args.stock - final[pid]}, workers were told {sold[pid]}"
+                       for pid in hot_ids if args.stock - final[pid] != sold[pid]]
+    if violations:
+        print(f"CONSISTENCY FAILED ({len(violations)} problems):")
+        for line in violations[:20]:
+            print(f"  {line}")
+        return 1
+    print("Consistency: OK (no negative stock, stock deltas match sale_items and confirmed sales)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Chain-wide reports consolidated from the branch databases (one pos_database.db per branch).
+
+    python consolidation.py nairobi=branches/nairobi.db branches/wote/pos_database.db ... \\
+        --start-date 2026-10-01 --end-date 2026-10-31 [--report daily --report cashiers] \\
+        [--top 10] [--workers N] [--output chain_report.json]
+
+Every branch is read in its own worker process (one per core by default) through a
+read-only URI connection, with the SalesManager report methods the API uses. Workers
+return partial aggregates and the parent merges them:
+
+  daily         revenue and sales per day and payment method; revenue is carried in
+                integer cents, so the chain totals are exact sums of the branch totals
+  top_products  a branch's top k cannot be merged into the chain's top k (a product that
+                is 11th in every branch can be 1st chain-wide), so every branch returns
+                the units sold of each product it sold and the top k is taken after summing
+  cashiers      cashier ids are only unique within a branch, so rows stay per
+                (branch, cashier) and are ranked chain-wide
+
+Branches are independent, so the run takes about as long as the largest branch once
+there is a core per branch. A branch that cannot be read is reported under "failed"
+and left out of the totals.
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from db_manager import DBManager
+from money import from_cents, to_cents
+from sales_manager import SalesManager
+
+logger = logging.getLogger(__name__)
+
+REPORTS = ("daily", "top_products", "cashiers")
+DEFAULT_TOP = 10
+
+
+def parse_branch(arg):
+    """'name=path' or a bare path; a bare .../<branch>/pos_database.db is named after its directory."""
+    name, sep, path = arg.partition("=")
+    if not sep:
+        path = arg
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = os.path.basename(os.path.dirname(os.path.abspath(path))) if stem == "pos_database" else stem
+    return name, path
+
+
+def branch_partials(branch, db_path, start_date_str, end_date_str, reports):
+    """
+    Runs in a worker process: the partial aggregates of one branch.
+    :return: Dictionary with 'branch' and one entry per requested report.
+    :raises RuntimeError: if a report query fails (ConnectionError if the file cannot be opened).
+    """
+    db_manager = DBManager(db_path, read_only=True)
+    try:
+        # The uncached report queries: each branch is read once per run, and they return
+        # None on error where get_top_selling_products returns []
+        sales_manager = SalesManager(db_manager)
+        partial = {"branch": branch}
+        if "daily" in reports:
+            series = sales_manager._sales_timeseries(start_date_str, end_date_str, "day")
+            if series is None:
+                raise RuntimeError("daily sales query failed")
+            partial["daily"] = [
+                (day, to_cents(revenue), transactions,
+                 {method: (to_cents(r), t) for method, (r, t) in by_method.items()})
+                for day, revenue, transactions, by_method in series
+            ]
+        if "top_products" in reports:
+            # Every product, not just the branch's top k (see the module docstring)
+            products = sales_manager._top_selling_products(-1, start_date_str, end_date_str)
+            if products is None:
+                raise RuntimeError("top products query failed")
+            partial["top_products"] = products
+        if "cashiers" in reports:
+            cashiers = sales_manager._cashier_summary(start_date_str, end_date_str)
+            if cashiers is None:
+                raise RuntimeError("cashier summary query failed")
+            partial["cashiers"] = [(cashier_id, to_cents(revenue), count) for cashier_id, revenue, count in cashiers]
+        return partial
+    finally:
+        db_manager.close()
+
+
+def merge_daily(partials):
+    days = {}
+    for partial in partials:
+        for day, cents, transactions, by_method in partial["daily"]:
+            merged = days.setdefault(day, {"cents": 0, "transactions": 0, "methods": {}, "branches": {}})
+            merged["cents"] += cents
+            merged["transactions"] += transactions
+            merged["branches"][partial["branch"]] = cents
+            for method, (method_cents, method_count) in by_method.items():
+                totals = merged["methods"].setdefault(method, [0, 0])
+                totals[0] += method_cents
+                totals[1] += method_count
+    return [
+        {"date": day, "revenue": from_cents(merged["cents"]), "transactions": merged["transactions"],
+         "payment_methods": {method: {"revenue": from_cents(c), "transactions": t}
+                             for method, (c, t) in sorted(merged["methods"].items())},
+         "branches": {branch: from_cents(c) for branch, c in merged["branches"].items()}}
+        for day, merged in sorted(days.items())
+    ]
+
+
+def merge_top_products(partials, top):
+    units, by_branch = Counter(), {}
+    for partial in partials:
+        for product_name, quantity in partial["top_products"]:
+            units[product_name] += quantity
+            by_branch.setdefault(product_name, {})[partial["branch"]] = quantity
+    ranked = sorted(units.items(), key=lambda item: (-item[1], item[0]))[:top]
+    return [{"product_name": name, "units_sold": quantity, "branches": by_branch[name]} for name, quantity in ranked]
+
+
+def merge_cashiers(partials):
+    rows = [(partial["branch"], cashier_id, cents, count)
+            for partial in partials for cashier_id, cents, count in partial["cashiers"]]
+    rows.sort(key=lambda row: (-row[2], row[0], row[1] or ""))
+    return [{"branch": branch, "cashier_id": cashier_id, "revenue": from_cents(cents), "transactions": count}
+            for branch, cashier_id, cents, count in rows]
+
+
+def consolidate(branches, start_date_str, end_date_str, reports=REPORTS, top=DEFAULT_TOP, workers=None):
+    """
+    :param branches: List of (branch name, database path).
+    :param workers: Worker processes; default one per core, at most one per branch. 1 reads the
+                    branches one after another in this process.
+    :return: Dictionary with the period, the merged branches, 'failed' ({branch: error}) and one
+             entry per requested report.
+    """
+    workers = workers or min(len(branches), os.cpu_count() or 1)
+    results = {}
+    if workers == 1:
+        for name, path in branches:
+            try:
+                results[name] = branch_partials(name, path, start_date_str, end_date_str, reports)
+            except (ConnectionError, RuntimeError, sqlite3.Error) as e:
+                results[name] = e
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {name: pool.submit(branch_partials, name, path, start_date_str, end_date_str, reports)
+                       for name, path in branches}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except (ConnectionError, RuntimeError, sqlite3.Error) as e:
+                    results[name] = e
+
+    partials = [results[name] for name, _ in branches if isinstance(results[name], dict)]
+    failed = {name: str(results[name]) for name, _ in branches if not isinstance(results[name], dict)}
+    for name, error in failed.items():
+        logger.error(f"Consolidation: branch {name} left out: {error}")
+
+    report = {"start_date": start_date_str, "end_date": end_date_str,
+              "branches": [partial["branch"] for partial in partials], "failed": failed}
+    if "daily" in reports:
+        report["daily"] = merge_daily(partials)
+        report["totals"] = {
+            "revenue": from_cents(sum(cents for p in partials for _, cents, _, _ in p["daily"])),
+            "transactions": sum(count for p in partials for _, _, count, _ in p["daily"]),
+        }
+    if "top_products" in reports:
+        report["top_products"] = merge_top_products(partials, top)
+    if "cashiers" in reports:
+        report["cashiers"] = merge_cashiers(partials)
+    logger.info(f"Consolidated {len(partials)} of {len(branches)} branches for {start_date_str} to {end_date_str} "
+                f"({workers} workers).")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chain-wide reports from several branch databases.")
+    parser.add_argument("branches", nargs="+", metavar="[NAME=]DATABASE")
+    parser.add_argument("--start-date", required=True, help="YYYY-MM-DD, first day included.")
+    parser.add_argument("--end-date", required=True, help="YYYY-MM-DD, last day included.")
+    parser.add_argument("--report", action="append", choices=REPORTS,
+                        help="Report to build (repeatable); default all of them.")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP)
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core).")
+    parser.add_argument("--output", help="Write the report JSON here instead of stdout.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    try:
+        if datetime.strptime(args.start_date, "%Y-%m-%d") > datetime.strptime(args.end_date, "%Y-%m-%d"):
+            parser.error("--start-date is after --end-date")
+    except ValueError:
+        parser.error("dates must be YYYY-MM-DD")
+    branches = [parse_branch(arg) for arg in args.branches]
+    names = [name for name, _ in branches]
+    if len(set(names)) != len(names):
+        parser.error("branch names must be unique; name them with NAME=DATABASE")
+    report = consolidate(branches, args.start_date, args.end_date, tuple(args.report or REPORTS),
+                         args.top, args.workers)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,24 @@
 import sqlite3
 import os
 import logging # Add this import
+from urllib.request import pathname2url
+
+from sql_trace import TracingConnection
+
+logger = logging.getLogger(__name__)
+
+# Set POS_SQL_TRACE=1 to time every statement (see sql_trace.py)
+SQL_TRACE_DEFAULT = os.environ.get("POS_SQL_TRACE", "0") == "1"
 
 class DBManager:
-    def __init__(self, db_name="pos_database.db"):
+    def __init__(self, db_name="pos_database.db", trace=None, read_only=False):
+        """
+        :param read_only: Open an existing database through a read-only URI (mode=ro): writes
+                          fail and the file is never created or modified (e.g. branch copies).
+        """
         self.db_name = db_name
+        self.trace = SQL_TRACE_DEFAULT if trace is None else trace
+        self.read_only = read_only
         self.conn = None
         self.cursor = None
         self.connect()
@@ -14,26 +28,55 @@ class DBManager:
     def connect(self):
         try:
             db_exists = os.path.exists(self.db_name)
-            self.conn = sqlite3.connect(self.db_name)
+            target, uri = self.db_name, False
+            if self.read_only:
+                target, uri = "file:" + pathname2url(os.path.abspath(self.db_name)) + "?mode=ro", True
+            if self.trace:
+                self.conn = sqlite3.connect(target, uri=uri, factory=TracingConnection)
+            else:
+                self.conn = sqlite3.connect(target, uri=uri)
             self.cursor = self.conn.cursor()
-            logging.info(f"Connected to database: {self.db_name}")
+            logger.debug("Connected to database: %s", self.db_name)
 
-            if not db_exists:
-                logging.info("Database file did not exist, attempting to create tables.")
+            if not db_exists and not self.read_only:
+                logger.info("Database file did not exist, attempting to create tables.")
                 self.create_tables()
 
         except sqlite3.Error as e:
-            logging.critical(f"Database connection error: {e}") # Log critical error
+            logger.critical(f"Database connection error: {e}") # Log critical error
             raise ConnectionError(f"Failed to connect to database: {e}")
 
     def close(self):
         if self.conn:
             self.conn.close()
-            logging.info("Database connection closed.")
+            logger.debug("Database connection closed.")
 
     def get_connection(self):
         return self.conn
 
+    def attach(self, schema, path):
+        """
+        ATTACHes another database file as `schema` (read-only if this connection is); no-op if
+        it is attached already.
+        :raises sqlite3.OperationalError: if the file does not exist, or no more databases can be attached.
+        """
+        if any(row[1] == schema for row in self.conn.execute("PRAGMA database_list")):
+            return
+        if not os.path.exists(path):
+            raise sqlite3.OperationalError(f"Database file {path} to attach as {schema} is missing")
+        target = path
+        if self.read_only:
+            target = "file:" + pathname2url(os.path.abspath(path)) + "?mode=ro"
+        self.conn.execute(f'ATTACH DATABASE ? AS "{schema}"', (target,))
+        logger.debug("Attached %s as %s.", path, schema)
+
+    def detach(self, schema):
+        self.conn.execute(f'DETACH DATABASE "{schema}"')
+
+    def attached_schemas(self):
+        """:return: Names of the attached databases (excluding main and temp)."""
+        return [row[1] for row in self.conn.execute("PRAGMA database_list") if row[1] not in ("main", "temp")]
+
     def get_cursor(self):
         return self.cursor
 
@@ -47,7 +90,7 @@ class DBManager:
                     stock INTEGER NOT NULL
                 );
             """)
-            logging.info("Products table checked/created successfully.")
+            logger.info("Products table checked/created successfully.")
 
             self.cursor.execute("""
                 CREATE TABLE IF NOT EXISTS sales (
@@ -58,7 +101,7 @@ class DBManager:
                     cashier_id TEXT
                 );
             """)
-            logging.info("Sales table checked/created successfully.")
+            logger.info("Sales table checked/created successfully.")
 
             self.cursor.execute("""
                 CREATE TABLE IF NOT EXISTS sale_items (
@@ -73,9 +116,398 @@ class DBManager:
                     FOREIGN KEY (product_id) REFERENCES products(product_id) ON DELETE CASCADE
                 );
             """)
-            logging.info("Sale_items table checked/created successfully.")
+            logger.info("Sale_items table checked/created successfully.")
+
+            # Indexes for the report queries and the sale_items -> products foreign key.
+            # benchmarks/query_plans.py fails if a manager query stops using them.
+            # Covers the time-bucketed reports (date range, payment method, amount) without
+            # touching the sales rows; replaces the earlier single-column idx_sales_sale_date
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_date_payment_total ON sales (sale_date, payment_method, total_amount)")
+            self.cursor.execute("DROP INDEX IF EXISTS idx_sales_sale_date")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_sale_id ON sale_items (sale_id)")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_product_id ON sale_items (product_id)")
+            logger.info("Indexes checked/created successfully.")
+
+            # Stock ledger: products.stock is a cache of SUM(delta) per product (see inventory_manager.py)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stock_movements (
+                    movement_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_id TEXT NOT NULL,
+                    ts TEXT NOT NULL,
+                    delta INTEGER NOT NULL,
+                    reason TEXT NOT NULL CHECK (reason IN ('opening', 'receipt', 'sale', 'adjustment')),
+                    reference TEXT
+                );
+            """)
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_stock_movements_product_ts ON stock_movements (product_id, ts)")
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stock_snapshots (
+                    product_id TEXT NOT NULL,
+                    ts TEXT NOT NULL,
+                    stock INTEGER NOT NULL,
+                    PRIMARY KEY (product_id, ts)
+                ) WITHOUT ROWID;
+            """)
+            # Products that predate the ledger get their current stock as an opening balance
+            self.cursor.execute("""
+                INSERT INTO stock_movements (product_id, ts, delta, reason)
+                SELECT p.product_id, strftime('%Y-%m-%d %H:%M:%f000', 'now', 'localtime'), p.stock, 'opening'
+                FROM products p
+                WHERE NOT EXISTS (SELECT 1 FROM stock_movements m WHERE m.product_id = p.product_id)
+            """)
+            if self.cursor.rowcount > 0:
+                logger.info(f"Recorded opening stock balances for {self.cursor.rowcount} products.")
+            logger.info("Stock ledger tables checked/created successfully.")
+
+            # Low-stock alerting (see InventoryManager.set_reorder_threshold). low_stock is the
+            # maintained set of products at or below their threshold; the triggers keep it and
+            # the stock_alerts outbox current in the transaction that changes the stock, and
+            # only do work when a product crosses its threshold.
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stock_thresholds (
+                    product_id TEXT PRIMARY KEY,
+                    threshold INTEGER NOT NULL CHECK (threshold >= 0)
+                ) WITHOUT ROWID;
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS low_stock (
+                    product_id TEXT PRIMARY KEY,
+                    since TEXT NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stock_alerts (
+                    alert_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    product_id TEXT NOT NULL,
+                    kind TEXT NOT NULL CHECK (kind IN ('low', 'cleared')),
+                    stock INTEGER NOT NULL,
+                    threshold INTEGER NOT NULL,
+                    created_at TEXT NOT NULL
+                );
+            """)
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_products_stock_threshold AFTER UPDATE OF stock ON products
+                WHEN EXISTS (SELECT 1 FROM stock_thresholds t WHERE t.product_id = NEW.product_id
+                             AND (OLD.stock <= t.threshold) != (NEW.stock <= t.threshold))
+                BEGIN
+                    INSERT INTO stock_alerts (product_id, kind, stock, threshold, created_at)
+                    SELECT NEW.product_id, CASE WHEN NEW.stock <= t.threshold THEN 'low' ELSE 'cleared' END,
+                           NEW.stock, t.threshold, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')
+                    FROM stock_thresholds t WHERE t.product_id = NEW.product_id;
+                    DELETE FROM low_stock WHERE product_id = NEW.product_id;
+                    INSERT INTO low_stock (product_id, since)
+                    SELECT NEW.product_id, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')
+                    FROM stock_thresholds t WHERE t.product_id = NEW.product_id AND NEW.stock <= t.threshold;
+                END;
+            """)
+            # A new or changed threshold can move a product into or out of the set by itself
+            for event in ("INSERT", "UPDATE"):
+                self.cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_stock_thresholds_{event.lower()} AFTER {event} ON stock_thresholds
+                    BEGIN
+                        INSERT INTO stock_alerts (product_id, kind, stock, threshold, created_at)
+                        SELECT p.product_id, CASE WHEN p.stock <= NEW.threshold THEN 'low' ELSE 'cleared' END,
+                               p.stock, NEW.threshold, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')
+                        FROM products p
+                        WHERE p.product_id = NEW.product_id
+                          AND (p.stock <= NEW.threshold) != EXISTS (SELECT 1 FROM low_stock l WHERE l.product_id = NEW.product_id);
+                        DELETE FROM low_stock WHERE product_id = NEW.product_id
+                          AND NOT EXISTS (SELECT 1 FROM products p WHERE p.product_id = NEW.product_id AND p.stock <= NEW.threshold);
+                        INSERT OR IGNORE INTO low_stock (product_id, since)
+                        SELECT p.product_id, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')
+                        FROM products p WHERE p.product_id = NEW.product_id AND p.stock <= NEW.threshold;
+                    END;
+                """)
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_stock_thresholds_delete AFTER DELETE ON stock_thresholds
+                BEGIN
+                    DELETE FROM low_stock WHERE product_id = OLD.product_id;
+                END;
+            """)
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_products_delete_threshold AFTER DELETE ON products
+                BEGIN
+                    DELETE FROM stock_thresholds WHERE product_id = OLD.product_id;
+                END;
+            """)
+            logger.info("Low-stock alert tables checked/created successfully.")
+
+            # Price history: the triggers record every price a product takes and bump
+            # price_state.version so cached price maps know to reload (see price_manager.py)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS price_history (
+                    product_id TEXT NOT NULL,
+                    effective_from TEXT NOT NULL,
+                    price REAL NOT NULL,
+                    PRIMARY KEY (product_id, effective_from)
+                ) WITHOUT ROWID;
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS price_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL
+                );
+            """)
+            self.cursor.execute("INSERT OR IGNORE INTO price_state (id, version) VALUES (1, 0)")
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_products_price_insert AFTER INSERT ON products
+                BEGIN
+                    INSERT OR REPLACE INTO price_history (product_id, effective_from, price)
+                    VALUES (NEW.product_id, strftime('%Y-%m-%d %H:%M:%f000', 'now', 'localtime'), NEW.price);
+                    UPDATE price_state SET version = version + 1 WHERE id = 1;
+                END;
+            """)
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_products_price_update AFTER UPDATE OF price ON products
+                WHEN NEW.price IS NOT OLD.price
+                BEGIN
+                    INSERT OR REPLACE INTO price_history (product_id, effective_from, price)
+                    VALUES (NEW.product_id, strftime('%Y-%m-%d %H:%M:%f000', 'now', 'localtime'), NEW.price);
+                    UPDATE price_state SET version = version + 1 WHERE id = 1;
+                END;
+            """)
+            self.cursor.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_products_delete AFTER DELETE ON products
+                BEGIN
+                    UPDATE price_state SET version = version + 1 WHERE id = 1;
+                END;
+            """)
+            # Products that predate the history are assumed to have always had their current price
+            self.cursor.execute("""
+                INSERT INTO price_history (product_id, effective_from, price)
+                SELECT p.product_id, '0001-01-01 00:00:00.000000', p.price
+                FROM products p
+                WHERE NOT EXISTS (SELECT 1 FROM price_history h WHERE h.product_id = p.product_id)
+            """)
+            if self.cursor.rowcount > 0:
+                logger.info(f"Recorded opening prices for {self.cursor.rowcount} products.")
+            logger.info("Price history tables checked/created successfully.")
+
+            # Promotions (see promotion_manager.py). Any change bumps price_state.version, so
+            # it versions the whole catalog: compiled promotion engines are cached per version.
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS promotions (
+                    promotion_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    kind TEXT NOT NULL CHECK (kind IN ('multi_buy', 'percent_off', 'time_of_day', 'bundle')),
+                    rule TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    starts_at TEXT,
+                    ends_at TEXT,
+                    active INTEGER NOT NULL DEFAULT 1
+                );
+            """)
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                self.cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_promotions_{event.lower()} AFTER {event} ON promotions
+                    BEGIN
+                        UPDATE price_state SET version = version + 1 WHERE id = 1;
+                    END;
+                """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sale_discounts (
+                    sale_id INTEGER NOT NULL,
+                    promotion_id INTEGER NOT NULL,
+                    promotion_name TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    PRIMARY KEY (sale_id, promotion_id),
+                    FOREIGN KEY (sale_id) REFERENCES sales(sale_id)
+                ) WITHOUT ROWID;
+            """)
+            logger.info("Promotion tables checked/created successfully.")
+
+            # Reorder forecasting (see reorder_manager.py): units sold per product per closed
+            # day, rolled up incrementally, and the latest suggestion per product
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS product_daily_sales (
+                    day TEXT NOT NULL,
+                    product_id TEXT NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    PRIMARY KEY (day, product_id)
+                ) WITHOUT ROWID;
+            """)
+            # sales_day_changes.changes of each rolled-up day when it was rolled up; a day whose
+            # count has moved since (replication brought late sales) is rolled up again
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS product_daily_sales_changes (
+                    day TEXT PRIMARY KEY,
+                    changes INTEGER NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS reorder_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    rolled_through TEXT,
+                    computed_at TEXT
+                );
+            """)
+            self.cursor.execute("INSERT OR IGNORE INTO reorder_state (id) VALUES (1)")
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS reorder_suggestions (
+                    product_id TEXT PRIMARY KEY,
+                    daily_velocity REAL NOT NULL,
+                    stock INTEGER NOT NULL,
+                    days_of_cover REAL,
+                    reorder_point INTEGER NOT NULL,
+                    suggested_qty INTEGER NOT NULL,
+                    computed_at TEXT NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_reorder_suggestions_due
+                ON reorder_suggestions (days_of_cover) WHERE suggested_qty > 0
+            """)
+            logger.info("Reorder tables checked/created successfully.")
+
+            # End-of-day Z-reports (SalesManager.generate_z_report) and the run history of the
+            # background jobs (see scheduler.py)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS z_reports (
+                    business_day TEXT PRIMARY KEY,
+                    transactions INTEGER NOT NULL,
+                    total_cents INTEGER NOT NULL,
+                    generated_at TEXT NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS z_report_lines (
+                    business_day TEXT NOT NULL,
+                    cashier_id TEXT NOT NULL,
+                    payment_method TEXT NOT NULL,
+                    transactions INTEGER NOT NULL,
+                    total_cents INTEGER NOT NULL,
+                    PRIMARY KEY (business_day, cashier_id, payment_method)
+                ) WITHOUT ROWID;
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS job_runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job TEXT NOT NULL,
+                    due_at TEXT NOT NULL,
+                    started_at TEXT NOT NULL,
+                    finished_at TEXT,
+                    status TEXT NOT NULL CHECK (status IN ('running', 'ok', 'failed')),
+                    result TEXT
+                );
+            """)
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_runs_job ON job_runs (job, started_at)")
+            logger.info("Z-report and job tables checked/created successfully.")
+
+            # Change-log replication (see replication.py). change_log holds one row per changed
+            # product or sale (sale_items changes are logged under their sale), replaced with a
+            # new seq on every change, so it never holds superseded entries. The triggers are
+            # muted while sync_state.applying is set, i.e. while replicated changes are applied.
+            self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'change_log'")
+            new_change_log = self.cursor.fetchone() is None
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS change_log (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    table_name TEXT NOT NULL,
+                    row_key TEXT NOT NULL,
+                    deleted INTEGER NOT NULL DEFAULT 0,
+                    changed_at TEXT NOT NULL,
+                    UNIQUE (table_name, row_key)
+                );
+            """)
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_table_seq ON change_log (table_name, seq)")
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    node_id TEXT NOT NULL,
+                    applying INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+            self.cursor.execute("INSERT OR IGNORE INTO sync_state (id, node_id) VALUES (1, lower(hex(randomblob(8))))")
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sync_peers (
+                    peer_id TEXT PRIMARY KEY,
+                    pulled_seq INTEGER NOT NULL DEFAULT 0,
+                    pushed_seq INTEGER NOT NULL DEFAULT 0,
+                    last_sync_at TEXT
+                ) WITHOUT ROWID;
+            """)
+            # Days whose sales a replication push changed after the fact: `changes` counts pushes that
+            # inserted, replaced or deleted sales of the day, `rewrites` those that replaced or deleted
+            # existing ones. Closed-period report caches and the columnar store check them
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sales_day_changes (
+                    day TEXT PRIMARY KEY,
+                    changes INTEGER NOT NULL,
+                    rewrites INTEGER NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS replicated_sales (
+                    origin TEXT NOT NULL,
+                    origin_sale_id INTEGER NOT NULL,
+                    sale_id INTEGER NOT NULL,
+                    PRIMARY KEY (origin, origin_sale_id)
+                ) WITHOUT ROWID;
+            """)
+            logged_changes = (
+                ("products", "INSERT", "NEW.product_id", 0),
+                ("products", "UPDATE OF name, price", "NEW.product_id", 0),
+                ("products", "DELETE", "OLD.product_id", 1),
+                ("sales", "INSERT", "NEW.sale_id", 0),
+                ("sales", "UPDATE", "NEW.sale_id", 0),
+                ("sales", "DELETE", "OLD.sale_id", 1),
+                ("sale_items", "INSERT", "NEW.sale_id", 0),
+                ("sale_items", "UPDATE", "NEW.sale_id", 0),
+                ("sale_items", "DELETE", "OLD.sale_id", 0),
+            )
+            for table, event, key, deleted in logged_changes:
+                logged_table = "sales" if table == "sale_items" else table
+                condition = "(SELECT applying FROM sync_state WHERE id = 1) = 0"
+                if table == "sale_items":
+                    # A checkout logs its sale first; its items need no entry of their own while
+                    # that is still the newest one
+                    condition += (f" AND NOT EXISTS (SELECT 1 FROM change_log WHERE seq = (SELECT MAX(seq) FROM change_log)"
+                                  f" AND table_name = 'sales' AND row_key = {key})")
+                self.cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_log_{event.split()[0].lower()} AFTER {event} ON {table}
+                    WHEN {condition}
+                    BEGIN
+                        INSERT OR REPLACE INTO change_log (table_name, row_key, deleted, changed_at)
+                        VALUES ('{logged_table}', {key}, {deleted}, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'));
+                    END;
+                """)
+            if new_change_log:
+                # Rows that predate the change log are logged once, so a first sync ships them
+                self.cursor.execute("""
+                    INSERT OR IGNORE INTO change_log (table_name, row_key, changed_at)
+                    SELECT 'products', product_id, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime') FROM products
+                    UNION ALL
+                    SELECT 'sales', sale_id, strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime') FROM sales
+                """)
+            logger.info("Replication tables checked/created successfully.")
+
+            # Closed months of sales moved out to one database file per month (see archive_manager.py);
+            # SalesManager ATTACHes the ones a report's date range overlaps
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sales_partitions (
+                    month TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    sales INTEGER NOT NULL,
+                    items INTEGER NOT NULL,
+                    first_sale_id INTEGER,
+                    last_sale_id INTEGER,
+                    archived_at TEXT NOT NULL
+                ) WITHOUT ROWID;
+            """)
+            logger.info("Sales partition table checked/created successfully.")
+
+            # Ids of logged-out session tokens, shared by all worker processes (see session_tokens.py)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS revoked_tokens (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT, -- never reused, so workers poll WHERE seq > last seen
+                    jti TEXT NOT NULL UNIQUE,
+                    exp INTEGER NOT NULL
+                );
+            """)
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_revoked_tokens_exp ON revoked_tokens (exp)")
+            logger.info("Revoked session token table checked/created successfully.")
             self.conn.commit()
-            logging.info("Database schema committed.")
+            logger.info("Database schema committed.")
         except sqlite3.Error as e:
-            logging.critical(f"Error creating tables: {e}") # Log critical error
+            logger.critical(f"Error creating tables: {e}") # Log critical error
             raise RuntimeError(f"Database table creation failed: {e}")
\ No newline at end of file
@@ -0,0 +1,284 @@
+import sqlite3
+import logging
+import sys
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Every change to products.stock is also written to stock_movements in the same
+# transaction, so products.stock is a materialized cache of SUM(delta) per product.
+MOVEMENT_REASONS = ("opening", "receipt", "sale", "adjustment")
+INSERT_MOVEMENT_SQL = "INSERT INTO stock_movements (product_id, ts, delta, reason, reference) VALUES (?, ?, ?, ?, ?)"
+
+
+def movement_timestamp(when=None):
+    """Movement timestamps carry microseconds so snapshot cut-offs never split a second."""
+    return (when or datetime.now()).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _as_of_timestamp(as_of):
+    """Accepts 'YYYY-MM-DD' (end of that day) or 'YYYY-MM-DD HH:MM:SS[.ffffff]'."""
+    if len(as_of) == 10:
+        return movement_timestamp(datetime.strptime(as_of, "%Y-%m-%d") + timedelta(days=1, microseconds=-1))
+    fmt = "%Y-%m-%d %H:%M:%S.%f" if "." in as_of else "%Y-%m-%d %H:%M:%S"
+    return movement_timestamp(datetime.strptime(as_of, fmt))
+
+
+class InventoryManager:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.conn = self.db_manager.get_connection()
+        self.cursor = self.db_manager.get_cursor()
+
+    def record_movement(self, product_id, delta, reason, reference=None):
+        """
+        Appends one ledger row. Does not commit: call it inside the transaction that changes products.stock.
+        """
+        try:
+            self.cursor.execute(INSERT_MOVEMENT_SQL, (product_id, movement_timestamp(), delta, reason, reference))
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error recording stock movement for {product_id} ({reason}, {delta}): {e}")
+            return False
+
+    def receive_stock(self, product_id, quantity, reference=None):
+        """
+        Books a goods receipt: increases products.stock and records a 'receipt' movement atomically.
+        :return: True on success, False if the product does not exist or on a database error.
+        """
+        try:
+            self.cursor.execute("UPDATE products SET stock = stock + ? WHERE product_id = ?", (quantity, product_id))
+            if self.cursor.rowcount == 0:
+                self.conn.rollback()
+                logger.warning(f"Stock receipt for unknown product {product_id} ignored.")
+                return False
+            self.cursor.execute(INSERT_MOVEMENT_SQL, (product_id, movement_timestamp(), quantity, "receipt", reference))
+            self.conn.commit()
+            logger.info(f"Received {quantity} units of {product_id} (ref: {reference}).")
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error receiving stock for {product_id}: {e}")
+            return False
+
+    def get_movements(self, product_id, start=None, end=None, limit=500):
+        """:return: List of (movement_id, ts, delta, reason, reference), newest first."""
+        try:
+            query = "SELECT movement_id, ts, delta, reason, reference FROM stock_movements WHERE product_id = ?"
+            params = [product_id]
+            if start:
+                query += " AND ts >= ?"
+                params.append(start)
+            if end:
+                query += " AND ts <= ?"
+                params.append(_as_of_timestamp(end))
+            query += " ORDER BY ts DESC LIMIT ?"
+            params.append(limit)
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error getting stock movements for {product_id}: {e}")
+            return []
+
+    def get_stock_as_of(self, product_id, as_of):
+        """
+        Stock level at a point in time: the latest snapshot at or before `as_of` (one index
+        seek) plus the movements between that snapshot and `as_of` (one index range).
+        :param as_of: 'YYYY-MM-DD' (end of that day) or 'YYYY-MM-DD HH:MM:SS'.
+        :return: The stock level, or None on error.
+        """
+        try:
+            as_of_ts = _as_of_timestamp(as_of)
+            self.cursor.execute("""
+                SELECT ts, stock FROM stock_snapshots
+                WHERE product_id = ? AND ts <= ?
+                ORDER BY ts DESC LIMIT 1
+            """, (product_id, as_of_ts))
+            snapshot = self.cursor.fetchone()
+            snapshot_ts, stock = snapshot if snapshot else ("", 0)
+            self.cursor.execute("""
+                SELECT COALESCE(SUM(delta), 0) FROM stock_movements
+                WHERE product_id = ? AND ts > ? AND ts <= ?
+            """, (product_id, snapshot_ts, as_of_ts))
+            return stock + self.cursor.fetchone()[0]
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error getting stock of {product_id} as of {as_of}: {e}")
+            return None
+
+    def take_snapshot(self, cutoff=None):
+        """
+        Materializes stock levels at `cutoff` (default: one second ago, so no movement can
+        still be written with an earlier timestamp) for every product that moved since its
+        previous snapshot. Run periodically (e.g. daily) to keep as-of replays short.
+        :return: Number of products snapshotted, or None on error.
+        """
+        cutoff_ts = movement_timestamp(cutoff or datetime.now() - timedelta(seconds=1))
+        try:
+            self.cursor.execute("""
+                INSERT OR REPLACE INTO stock_snapshots (product_id, ts, stock)
+                SELECT product_id, :cutoff,
+                       COALESCE((SELECT s.stock FROM stock_snapshots s
+                                 WHERE s.product_id = last.product_id AND s.ts = last.snapshot_ts), 0)
+                       + (SELECT COALESCE(SUM(m.delta), 0) FROM stock_movements m
+                          WHERE m.product_id = last.product_id AND m.ts > last.snapshot_ts AND m.ts <= :cutoff)
+                FROM (
+                    SELECT p.product_id,
+                           COALESCE((SELECT MAX(s.ts) FROM stock_snapshots s
+                                     WHERE s.product_id = p.product_id AND s.ts <= :cutoff), '') AS snapshot_ts
+                    FROM products p
+                ) AS last
+                WHERE EXISTS (SELECT 1 FROM stock_movements m
+                              WHERE m.product_id = last.product_id AND m.ts > last.snapshot_ts AND m.ts <= :cutoff)
+            """, {"cutoff": cutoff_ts})
+            count = self.cursor.rowcount
+            self.conn.commit()
+            logger.info(f"Stock snapshot at {cutoff_ts}: {count} products.")
+            return count
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error taking stock snapshot: {e}")
+            return None
+
+    def verify_stock_cache(self):
+        """:return: List of (product_id, cached stock, ledger stock) where products.stock disagrees with the ledger."""
+        try:
+            self.cursor.execute("""
+                SELECT p.product_id, p.stock,
+                       (SELECT COALESCE(SUM(m.delta), 0) FROM stock_movements m WHERE m.product_id = p.product_id) AS ledger
+                FROM products p
+                WHERE p.stock != ledger
+            """)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error verifying stock cache: {e}")
+            return []
+
+    def rebuild_stock_cache(self):
+        """Recomputes products.stock from the ledger. :return: Number of products corrected, or None on error."""
+        mismatches = self.verify_stock_cache()
+        try:
+            self.cursor.executemany("UPDATE products SET stock = ? WHERE product_id = ?",
+                                    [(ledger, product_id) for product_id, _, ledger in mismatches])
+            self.conn.commit()
+            if mismatches:
+                logger.warning(f"Rebuilt cached stock for {len(mismatches)} products from the ledger.")
+            return len(mismatches)
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error rebuilding stock cache: {e}")
+            return None
+
+    # --- Low-stock alerting (the set and the alerts are maintained by triggers, see DBManager.create_tables) ---
+    def set_reorder_threshold(self, product_id, threshold):
+        """
+        :param threshold: Alert once stock is at or below this; None removes the product's threshold.
+        :return: True on success, False if the product does not exist or on a database error.
+        """
+        try:
+            self.cursor.execute("SELECT 1 FROM products WHERE product_id = ?", (product_id,))
+            if self.cursor.fetchone() is None:
+                logger.warning(f"Reorder threshold for unknown product {product_id} ignored.")
+                return False
+            if threshold is None:
+                self.cursor.execute("DELETE FROM stock_thresholds WHERE product_id = ?", (product_id,))
+            else:
+                self.cursor.execute("""
+                    INSERT INTO stock_thresholds (product_id, threshold) VALUES (?, ?)
+                    ON CONFLICT (product_id) DO UPDATE SET threshold = excluded.threshold
+                """, (product_id, threshold))
+            self.conn.commit()
+            logger.info(f"Reorder threshold for {product_id} set to {threshold}.")
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error setting reorder threshold for {product_id}: {e}")
+            return False
+
+    def set_thresholds_from_reorder_points(self):
+        """
+        Sets every product's threshold to its reorder point from the last reorder job
+        (see reorder_manager.py). :return: Number of thresholds set, or None on error.
+        """
+        try:
+            self.cursor.execute("""
+                INSERT INTO stock_thresholds (product_id, threshold)
+                SELECT product_id, reorder_point FROM reorder_suggestions WHERE reorder_point > 0
+                ON CONFLICT (product_id) DO UPDATE SET threshold = excluded.threshold
+            """)
+            count = self.cursor.rowcount
+            self.conn.commit()
+            logger.info(f"Reorder thresholds set from reorder points for {count} products.")
+            return count
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error setting thresholds from reorder points: {e}")
+            return None
+
+    def get_low_stock_products(self):
+        """:return: List of (product_id, name, stock, threshold, since) at or below threshold, emptiest first."""
+        try:
+            self.cursor.execute("""
+                SELECT l.product_id, p.name, p.stock, t.threshold, l.since
+                FROM low_stock l
+                CROSS JOIN products p ON p.product_id = l.product_id
+                CROSS JOIN stock_thresholds t ON t.product_id = l.product_id
+                ORDER BY p.stock, l.product_id
+            """)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error getting low-stock products: {e}")
+            return []
+
+    def get_stock_alerts(self, after_id=0, limit=100):
+        """
+        Threshold crossings in the order they happened, for consumers that poll with the
+        last alert_id they have seen.
+        :return: List of (alert_id, product_id, kind ('low' or 'cleared'), stock, threshold, created_at).
+        """
+        try:
+            self.cursor.execute("""
+                SELECT alert_id, product_id, kind, stock, threshold, created_at
+                FROM stock_alerts WHERE alert_id > ? ORDER BY alert_id LIMIT ?
+            """, (after_id, limit))
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error getting stock alerts: {e}")
+            return []
+
+
+def main(argv=None):
+    """python inventory_manager.py snapshot | verify | rebuild | as-of PRODUCT_ID DATE [--database FILE]"""
+    import argparse
+    from db_manager import DBManager
+
+    parser = argparse.ArgumentParser(description="Stock ledger maintenance.")
+    parser.add_argument("command", choices=("snapshot", "verify", "rebuild", "as-of"))
+    parser.add_argument("args", nargs="*")
+    parser.add_argument("--database", default="pos_database.db")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    db_manager = DBManager(args.database)
+    inventory = InventoryManager(db_manager)
+    try:
+        if args.command == "snapshot":
+            print(f"{inventory.take_snapshot()} products snapshotted")
+        elif args.command == "verify":
+            mismatches = inventory.verify_stock_cache()
+            for product_id, cached, ledger in mismatches:
+                print(f"{product_id}: products.stock={cached} ledger={ledger}")
+            print("OK" if not mismatches else f"{len(mismatches)} mismatches")
+            return 1 if mismatches else 0
+        elif args.command == "rebuild":
+            print(f"{inventory.rebuild_stock_cache()} products corrected")
+        else:
+            if len(args.args) != 2:
+                parser.error("as-of needs PRODUCT_ID and DATE")
+            print(inventory.get_stock_as_of(*args.args))
+    finally:
+        db_manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import logging
+import logging.handlers
+import json
+import os
+import queue
+import threading
+import time
+import atexit
+
+# Default size-based rotation for the backend/GUI log files
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+# Hot-path DEBUG messages allowed per (logger, message template) per interval
+DEFAULT_DEBUG_RATE = 20
+DEFAULT_DEBUG_INTERVAL = 1.0
+
+_listener = None
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a single JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%d %H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugRateLimitFilter(logging.Filter):
+    """
+    Drops DEBUG records once a given (logger, message template) pair has been
+    logged more than `rate` times within `interval` seconds. Records at INFO and
+    above always pass. Attached to the QueueHandler so dropped records are never
+    enqueued or formatted.
+    """
+
+    def __init__(self, rate=DEFAULT_DEBUG_RATE, interval=DEFAULT_DEBUG_INTERVAL):
+        super().__init__()
+        self.rate = rate
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count = self._windows.get(key, (now, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            count += 1
+            self._windows[key] = (window_start, count)
+        return count <= self.rate
+
+
+def _parse_logger_levels(spec):
+    """Parses 'name=LEVEL,name2=LEVEL' (as used in POS_LOG_LEVELS) into a dict."""
+    levels = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        name, level = part.split("=", 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(log_file, level=None, logger_levels=None, json_format=None,
+                  max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+    """
+    Configures a non-blocking logging pipeline: callers only put records on an
+    in-memory queue, and a QueueListener thread writes them to a size-rotated file.
+
+    :param log_file: Path of the log file (e.g. 'pos_backend.log').
+    :param level: Root level name. Defaults to $POS_LOG_LEVEL or INFO.
+    :param logger_levels: Dict of per-logger levels, e.g. {'sales_manager': 'DEBUG'}.
+                          Merged over $POS_LOG_LEVELS ('name=LEVEL,...').
+    :param json_format: Write JSON lines (default) or plain text. $POS_LOG_FORMAT=text disables JSON.
+    :return: The running QueueListener.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.environ.get("POS_LOG_LEVEL", "INFO")).upper()
+    levels = _parse_logger_levels(os.environ.get("POS_LOG_LEVELS"))
+    levels.update(logger_levels or {})
+    if json_format is None:
+        json_format = os.environ.get("POS_LOG_FORMAT", "json").lower() != "text"
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    if json_format:
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        ))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(DebugRateLimitFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _queue_handler = queue_handler
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def _restart_listener_in_child():
+    """
+    Forked workers (see serve.py) inherit the queue but not the listener thread, so records
+    would pile up unwritten. Give the child a fresh queue and its own listener over the same
+    file handler. Rotation is not coordinated between processes; size limits are approximate.
+    """
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener_in_child)
+
+
+def shutdown_logging():
+    """Flushes any queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -0,0 +1,152 @@
+"""
+Minimal in-process metrics (counters, gauges, histograms) rendered in the Prometheus
+text exposition format. Each process keeps its own registry; with prefork serving
+(serve.py) every worker reports its own numbers, so scrape each worker or sum them.
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # Per-bucket (non-cumulative) counts + [sum, count]; cumulated at render time
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = self.header()
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, label_values, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+http_request_duration = REGISTRY.register(Histogram(
+    "pos_http_request_duration_seconds", "Request latency by endpoint.", ("endpoint", "method")))
+http_requests_total = REGISTRY.register(Counter(
+    "pos_http_requests_total", "Requests by endpoint and status code.", ("endpoint", "method", "status")))
+http_requests_in_flight = REGISTRY.register(Gauge(
+    "pos_http_requests_in_flight", "Requests currently being handled.", ("endpoint",)))
+db_connect_duration = REGISTRY.register(Histogram(
+    "pos_db_connect_duration_seconds", "Time to open a DBManager connection for a request."))
+manager_call_duration = REGISTRY.register(Histogram(
+    "pos_manager_call_duration_seconds", "Duration of manager methods (their SQL plus Python work).",
+    ("manager", "method")))
+
+
+def instrument_methods(*classes):
+    """
+    Wraps every public method of the given manager classes so each call is observed in
+    manager_call_duration. Generator methods are left alone (they run lazily).
+    Idempotent; call once at startup.
+    """
+    for cls in classes:
+        for attr, func in list(vars(cls).items()):
+            if attr.startswith("_") or not inspect.isfunction(func) or inspect.isgeneratorfunction(func):
+                continue
+            if getattr(func, "_pos_instrumented", False):
+                continue
+            setattr(cls, attr, _timed(cls.__name__, attr, func))
+
+
+def _timed(manager_name, method_name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            manager_call_duration.observe(time.perf_counter() - start, manager_name, method_name)
+    wrapper._pos_instrumented = True
+    return wrapper
@@ -0,0 +1,267 @@
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Stored hashes are encoded as '<algorithm>$<cost>$<algorithm-specific data>', so every
+# user row records which hasher and cost produced it. Bare 64-char hex strings are the
+# legacy unsalted SHA-256 hashes and are upgraded on the next successful login.
+# POS_PASSWORD_HASHER is checked against HASHERS below, at import.
+DEFAULT_ALGORITHM = os.environ.get("POS_PASSWORD_HASHER", "scrypt")
+DEFAULT_COST = int(os.environ["POS_PASSWORD_COST"]) if os.environ.get("POS_PASSWORD_COST") else None
+
+# Password hashing runs on a small dedicated pool so a burst of logins cannot
+# occupy every request/checkout thread. hashlib.scrypt, hashlib.pbkdf2_hmac and
+# bcrypt all release the GIL while hashing, so threads run them in parallel.
+HASH_POOL_WORKERS = int(os.environ.get("POS_HASH_WORKERS", "2"))
+HASH_POOL_MAX_PENDING = 16
+HASH_TIMEOUT_SECONDS = 10
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+class LegacySha256Hasher:
+    """Unsalted SHA-256 hex digests as written by earlier versions. Verify-only."""
+    algorithm = "sha256"
+    default_cost = 0
+
+    def encode(self, password, cost=None):
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def verify(self, password, encoded):
+        return hmac.compare_digest(self.encode(password), encoded)
+
+    def cost_of(self, encoded):
+        return 0
+
+
+class ScryptHasher:
+    """hashlib.scrypt with N = 2**cost, r = 8, p = 1."""
+    algorithm = "scrypt"
+    default_cost = 14
+    block_size = 8
+
+    def _derive(self, password, salt, cost):
+        n = 2 ** cost
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=self.block_size, p=1,
+                              maxmem=256 * self.block_size * n + 1024 * 1024, dklen=32)
+
+    def encode(self, password, cost=None):
+        cost = cost or self.default_cost
+        salt = secrets.token_bytes(16)
+        return f"{self.algorithm}${cost}${_b64encode(salt)}${_b64encode(self._derive(password, salt, cost))}"
+
+    def verify(self, password, encoded):
+        _, cost, salt, expected = encoded.split("$")
+        return hmac.compare_digest(_b64encode(self._derive(password, _b64decode(salt), int(cost))), expected)
+
+    def cost_of(self, encoded):
+        return int(encoded.split("$")[1])
+
+
+class Pbkdf2Hasher:
+    """PBKDF2-HMAC-SHA256 with 2**cost iterations."""
+    algorithm = "pbkdf2_sha256"
+    default_cost = 19
+
+    def _derive(self, password, salt, cost):
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, 2 ** cost)
+
+    def encode(self, password, cost=None):
+        cost = cost or self.default_cost
+        salt = secrets.token_bytes(16)
+        return f"{self.algorithm}${cost}${_b64encode(salt)}${_b64encode(self._derive(password, salt, cost))}"
+
+    def verify(self, password, encoded):
+        _, cost, salt, expected = encoded.split("$")
+        return hmac.compare_digest(_b64encode(self._derive(password, _b64decode(salt), int(cost))), expected)
+
+    def cost_of(self, encoded):
+        return int(encoded.split("$")[1])
+
+
+class BcryptHasher:
+    """bcrypt (optional dependency) with 2**cost rounds."""
+    algorithm = "bcrypt"
+    default_cost = 12
+
+    def encode(self, password, cost=None):
+        import bcrypt
+        cost = cost or self.default_cost
+        hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=cost)).decode("ascii")
+        return f"{self.algorithm}${cost}${hashed}"
+
+    def verify(self, password, encoded):
+        import bcrypt
+        hashed = encoded.split("$", 2)[2]
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("ascii"))
+
+    def cost_of(self, encoded):
+        return int(encoded.split("$")[1])
+
+
+HASHERS = {
+    hasher.algorithm: hasher
+    for hasher in (LegacySha256Hasher(), ScryptHasher(), Pbkdf2Hasher(), BcryptHasher())
+}
+
+
+def _usable_algorithm(algorithm):
+    """
+    :return: `algorithm` if new hashes can be made with it, else 'scrypt' (with a warning), so a
+             typo or a missing optional package does not surface as an error on every login.
+    """
+    if algorithm not in HASHERS or algorithm == LegacySha256Hasher.algorithm:
+        choices = ", ".join(name for name in HASHERS if name != LegacySha256Hasher.algorithm)
+        logger.warning(f"POS_PASSWORD_HASHER={algorithm!r} is not one of {choices}; using scrypt.")
+        return ScryptHasher.algorithm
+    if algorithm == BcryptHasher.algorithm:
+        try:
+            import bcrypt
+        except ImportError:
+            logger.warning("POS_PASSWORD_HASHER=bcrypt but the bcrypt package is not installed; using scrypt.")
+            return ScryptHasher.algorithm
+    return algorithm
+
+
+DEFAULT_ALGORITHM = _usable_algorithm(DEFAULT_ALGORITHM)
+
+
+def identify_hasher(encoded):
+    """Returns the hasher that produced `encoded`, or None for unknown formats."""
+    if encoded and "$" not in encoded and len(encoded) == 64:
+        return HASHERS["sha256"]
+    return HASHERS.get((encoded or "").split("$", 1)[0])
+
+
+def hash_password(password, algorithm=None, cost=None):
+    """Hashes with the configured default hasher unless algorithm/cost are given."""
+    hasher = HASHERS[algorithm or DEFAULT_ALGORITHM]
+    return hasher.encode(password, cost or DEFAULT_COST)
+
+
+def verify_password(password, encoded):
+    hasher = identify_hasher(encoded)
+    if hasher is None:
+        logger.error("Stored password hash has an unrecognised format.")
+        return False
+    return hasher.verify(password, encoded)
+
+
+def needs_rehash(encoded, algorithm=None, cost=None):
+    """True when `encoded` was made with a different hasher or cost than currently configured."""
+    algorithm = algorithm or DEFAULT_ALGORITHM
+    hasher = identify_hasher(encoded)
+    if hasher is None or hasher.algorithm != algorithm:
+        return True
+    return hasher.cost_of(encoded) != (cost or DEFAULT_COST or hasher.default_cost)
+
+
+class HashPoolBusyError(RuntimeError):
+    """Raised when too many password hashes are already queued."""
+
+
+class PasswordHashPool:
+    def __init__(self, max_workers=HASH_POOL_WORKERS, max_pending=HASH_POOL_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pw-hash")
+        # Bounds running + queued jobs; beyond this, callers are turned away immediately
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def submit(self, fn, *args):
+        """Queues fn(*args) and returns its Future; raises HashPoolBusyError when the pool is full."""
+        if not self._slots.acquire(blocking=False):
+            raise HashPoolBusyError("Too many concurrent login attempts, try again shortly.")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args, timeout=HASH_TIMEOUT_SECONDS):
+        try:
+            return self.submit(fn, *args).result(timeout=timeout)
+        except FutureTimeoutError:
+            # The job keeps its slot until it finishes, so the pool stays bounded
+            raise HashPoolBusyError("Password hashing timed out, try again shortly.")
+
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def get_hash_pool():
+    """Returns the process-wide PasswordHashPool, creating it on first use."""
+    global _hash_pool
+    if _hash_pool is None:
+        with _hash_pool_lock:
+            if _hash_pool is None:
+                _hash_pool = PasswordHashPool()
+    return _hash_pool
+
+
+def _reset_hash_pool_in_child():
+    # Executor threads do not survive fork(); a forked worker must build its own pool
+    global _hash_pool, _hash_pool_lock
+    _hash_pool = None
+    _hash_pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_hash_pool_in_child)
+
+
+def calibrate_cost(algorithm=None, target_ms=250.0, samples=3, max_cost=24):
+    """
+    Benchmarks the hasher on this machine and returns the highest cost whose median
+    hash time stays within `target_ms`, together with the measured timings.
+    """
+    hasher = HASHERS[algorithm or DEFAULT_ALGORITHM]
+    if hasher.algorithm == "sha256":
+        raise ValueError("The legacy SHA-256 hasher has no cost factor.")
+    timings = {}
+    best = None
+    cost = {"bcrypt": 4}.get(hasher.algorithm, 10)
+    while cost <= max_cost:
+        runs = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            hasher.encode("calibration-password", cost)
+            runs.append((time.perf_counter() - start) * 1000)
+        timings[cost] = statistics.median(runs)
+        if timings[cost] > target_ms:
+            break
+        best = cost
+        cost += 1
+    return best, timings
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Pick a password hashing cost for this hardware.")
+    parser.add_argument("--algorithm", default=DEFAULT_ALGORITHM, choices=[a for a in HASHERS if a != "sha256"])
+    parser.add_argument("--target-ms", type=float, default=250.0, help="Maximum acceptable time per login hash.")
+    args = parser.parse_args()
+
+    best, timings = calibrate_cost(args.algorithm, args.target_ms)
+    for cost, ms in timings.items():
+        print(f"{args.algorithm} cost {cost:>2}: {ms:8.1f} ms")
+    if best is None:
+        print(f"Even the lowest cost exceeds {args.target_ms} ms on this machine.")
+    else:
+        print(f"\nRecommended: POS_PASSWORD_HASHER={args.algorithm} POS_PASSWORD_COST={best}")
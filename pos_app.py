@@ -1,11 +1,15 @@
 # app.py
-from flask import Flask, request, jsonify, g, render_template  # ADDED 'render_template'
+from flask import Flask, request, jsonify, g, render_template, Response  # ADDED 'render_template'
 from flask_cors import CORS
 import os
 import sys
 import logging
 from datetime import datetime, timedelta
 import sqlite3
+import time
+import atexit
+import threading
+from functools import wraps
 
 # Add the directory containing manager files to the system path
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,23 +19,61 @@ if os.path.exists(manager_files_path):
     sys.path.append(manager_files_path)
 
 # Import the manager classes
-from db_manager import DBManager
+from db_manager import DBManager, SQL_TRACE_DEFAULT
 from product_manager import ProductManager
-from sales_manager import SalesManager
-from user_manager import UserManager
+from sales_manager import SalesManager, TIMESERIES_BUCKETS, WEEKDAYS
+from user_manager import UserManager, HashPoolBusyError
+from inventory_manager import InventoryManager
+from price_manager import PriceManager
+from promotion_manager import PromotionManager
+from reorder_manager import ReorderManager
+from money import cart_totals, from_cents
+from log_config import setup_logging
+from session_tokens import SessionTokenManager
+from sales_journal import SalesJournal, InsufficientStockError
+from analytics_store import ColumnarSalesStore, AnalyticsExporter, DIMENSIONS
+from scheduler import JobScheduler, JOBS, lane_activity
+from replication import ReplicationManager, DEFAULT_BATCH
+import metrics
+import sql_trace
 
 app = Flask(__name__)
 CORS(app)
 
 # --- Logging Configuration (for Flask app) ---
-logging.basicConfig(
-    filename='pos_backend.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Records go through an in-memory queue; a background listener does the file I/O and rotation.
+# Per-logger levels can be set with POS_LOG_LEVELS, e.g. "sales_manager=DEBUG,db_manager=WARNING".
+setup_logging('pos_backend.log')
 
 DATABASE_NAME = "pos_database.db"
+MAX_HOURLY_REPORT_DAYS = 92
+
+# Optional append-only sales journal (see sales_journal.py); started by setup_database_once
+SALES_JOURNAL_DIR = os.environ.get('POS_SALES_JOURNAL')
+sales_journal = None
+
+# Optional columnar sales snapshot for /reports/analytics (see analytics_store.py)
+ANALYTICS_DIR = os.environ.get('POS_ANALYTICS_DIR')
+analytics_store = ColumnarSalesStore(ANALYTICS_DIR) if ANALYTICS_DIR else None
+analytics_exporter = None
+
+# End-of-day and housekeeping jobs (see scheduler.py); the background thread is started by
+# setup_database_once when POS_SCHEDULER=1, jobs can always be run through the API. Built on
+# first use, so it runs against DATABASE_NAME as set by serve.py or PosAsgiApp
+job_scheduler = None
+_job_scheduler_lock = threading.Lock()
+
+# Signed session tokens: verified in-process without touching the users table
+session_tokens = SessionTokenManager()
+
+# Opt-in per-request profiling; nothing is installed unless POS_PROFILING=1
+if os.environ.get('POS_PROFILING') == '1':
+    from request_profiler import RequestProfilerMiddleware
+    app.wsgi_app = RequestProfilerMiddleware(app.wsgi_app, session_tokens.verify_token)
+
+# Per-method timings for every manager call, exposed at /metrics
+metrics.instrument_methods(ProductManager, SalesManager, UserManager, InventoryManager, PriceManager,
+                           PromotionManager, ReorderManager, ReplicationManager)
 
 # --- One-time Database Setup on App Startup ---
 def setup_database_once():
@@ -63,6 +105,13 @@ def setup_database_once():
         _seed_products_if_empty(temp_product_manager)
 
         temp_db_manager.close()
+
+        # Logouts are recorded in the database so every worker process sees them
+        session_tokens.db_path = DATABASE_NAME
+        # Replays any sales left in the journal by a crash before requests are served
+        start_sales_journal()
+        start_analytics_exporter()
+        start_job_scheduler()
         logging.info("Backend: One-time database setup completed successfully.")
     except Exception as e:
         logging.critical(f"Backend: FATAL: Failed during one-time database setup: {e}. Exiting.")
@@ -97,6 +146,38 @@ def _seed_products_if_empty(product_mgr):
         logging.info("Products already exist, skipping default seeding.")
 
 
+def start_sales_journal():
+    """Opens the sales journal when POS_SALES_JOURNAL is set. Idempotent."""
+    global sales_journal
+    if SALES_JOURNAL_DIR and sales_journal is None:
+        sales_journal = SalesJournal(SALES_JOURNAL_DIR, DATABASE_NAME).open()
+        atexit.register(sales_journal.close)
+        logging.info(f"Backend: Sales journal mode enabled ({SALES_JOURNAL_DIR}).")
+
+def start_analytics_exporter():
+    """Starts the background export to the columnar store when POS_ANALYTICS_DIR is set. Idempotent."""
+    global analytics_exporter
+    if analytics_store is not None and analytics_exporter is None:
+        analytics_exporter = AnalyticsExporter(analytics_store, DATABASE_NAME).start()
+        atexit.register(analytics_exporter.stop)
+
+def get_job_scheduler():
+    """Returns the job scheduler for the current DATABASE_NAME, creating it on first use."""
+    global job_scheduler
+    with _job_scheduler_lock:
+        if job_scheduler is None:
+            job_scheduler = JobScheduler(DATABASE_NAME, os.environ.get('POS_SCHEDULE'))
+        return job_scheduler
+
+def start_job_scheduler():
+    """Starts the background job scheduler when POS_SCHEDULER=1. Idempotent."""
+    if os.environ.get('POS_SCHEDULER') == '1':
+        scheduler = get_job_scheduler()
+        if not scheduler.is_running():
+            scheduler.start()
+            atexit.register(scheduler.stop)
+
+
 # --- Per-Request Database Connection Management (Thread-Safe) ---
 def get_db_manager():
     """
@@ -105,12 +186,19 @@ def get_db_manager():
     """
     if 'db_manager' not in g:
         try:
+            connect_start = time.perf_counter()
             g.db_manager = DBManager(DATABASE_NAME)
-            logging.info("Backend: New DBManager created for current request context.")
+            metrics.db_connect_duration.observe(time.perf_counter() - connect_start)
+            logging.debug("Backend: New DBManager created for current request context.")
             # Initialize other managers here, passing the current request's db_manager
             g.product_manager = ProductManager(g.db_manager)
-            g.sales_manager = SalesManager(g.db_manager)
+            g.sales_manager = SalesManager(g.db_manager, journal=sales_journal)
             g.user_manager = UserManager(g.db_manager)
+            g.inventory_manager = InventoryManager(g.db_manager)
+            g.price_manager = PriceManager(g.db_manager)
+            g.promotion_manager = PromotionManager(g.db_manager)
+            g.reorder_manager = ReorderManager(g.db_manager)
+            g.replication_manager = ReplicationManager(g.db_manager)
         except (ConnectionError, RuntimeError) as e:
             logging.critical(f"Backend: FATAL: Failed to initialize database in request context: {e}.")
             raise ConnectionError(f"Database connection failed: {e}")
@@ -122,6 +210,10 @@ def get_db_manager():
 @app.before_request
 def before_request_hook():
     """Ensure db_manager and other managers are available on 'g' before each request."""
+    g.request_start = time.perf_counter()
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_method = request.method
+    metrics.http_requests_in_flight.inc(g.metrics_endpoint)
     try:
         get_db_manager() # This will create and attach managers to g if they don't exist for the current request
     except (ConnectionError, RuntimeError) as e:
@@ -136,7 +228,43 @@ def close_db_connection(exception):
     db_manager_instance = g.pop('db_manager', None)
     if db_manager_instance is not None:
         db_manager_instance.close()
-        logging.info("Backend: DBManager connection closed for current request context.")
+        logging.debug("Backend: DBManager connection closed for current request context.")
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_appcontext
+def record_request_metrics(exception):
+    start = g.pop('request_start', None)
+    if start is None:
+        return
+    # The request context is already gone here, so everything needed was stashed on g
+    endpoint = g.pop('metrics_endpoint', "unmatched")
+    method = g.pop('metrics_method', "")
+    status = g.pop('response_status', 500)
+    metrics.http_request_duration.observe(time.perf_counter() - start, endpoint, method)
+    metrics.http_requests_total.inc(endpoint, method, str(status))
+    metrics.http_requests_in_flight.dec(endpoint)
+
+def _bearer_token():
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        return auth_header[len('Bearer '):].strip()
+    return None
+
+def require_session(view):
+    """Rejects the request with 401 unless it carries a valid session token; sets g.current_user."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        user_info = session_tokens.verify_token(_bearer_token())
+        if user_info is None:
+            logging.warning(f"Rejected request to {request.path}: missing or invalid session token.")
+            return jsonify({"message": "Authentication required. Please log in again."}), 401
+        g.current_user = user_info
+        return view(*args, **kwargs)
+    return wrapped
 
 
 # --- API Endpoints ---
@@ -145,6 +273,22 @@ def close_db_connection(exception):
 def home():
     return render_template('dms_pos.html')
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/debug/sql_stats', methods=['GET'])
+@require_session
+def sql_statement_stats():
+    """Per-statement timings collected when POS_SQL_TRACE=1 (admin only)."""
+    if g.current_user['role'] != 'admin':
+        return jsonify({"message": "Admin role required."}), 403
+    order_by = request.args.get('order_by', 'total_ms')
+    if order_by not in ('total_ms', 'count', 'mean_ms', 'p50_ms', 'p99_ms', 'rows'):
+        return jsonify({"message": "Invalid order_by."}), 400
+    return jsonify({"tracing_enabled": SQL_TRACE_DEFAULT,
+                    "statements": sql_trace.STATS.report(order_by)}), 200
+
 @app.route('/login', methods=['POST'])
 def login():
     user_manager = g.user_manager
@@ -156,15 +300,27 @@ def login():
         logging.warning("Login attempt: Missing username or password.")
         return jsonify({"message": "Username and password are required"}), 400
 
-    user_info = user_manager.verify_user(username, password)
+    try:
+        user_info = user_manager.verify_user(username, password)
+    except HashPoolBusyError as e:
+        logging.warning(f"Login for '{username}' rejected: {e}")
+        return jsonify({"message": str(e)}), 503
 
     if user_info:
         logging.info(f"User '{username}' logged in successfully.")
-        return jsonify({"message": "Login successful", "user": user_info}), 200
+        token = session_tokens.issue_token(user_info)
+        return jsonify({"message": "Login successful", "user": user_info, "token": token}), 200
     else:
         logging.warning(f"Login failed for username: {username}.")
         return jsonify({"message": "Invalid username or password"}), 401
 
+@app.route('/logout', methods=['POST'])
+@require_session
+def logout():
+    session_tokens.revoke_token(_bearer_token())
+    logging.info(f"User '{g.current_user['username']}' logged out.")
+    return jsonify({"message": "Logged out successfully"}), 200
+
 @app.route('/products', methods=['GET'])
 def get_products():
     product_manager = g.product_manager
@@ -173,7 +329,7 @@ def get_products():
         {"product_id": p[0], "name": p[1], "price": p[2], "stock": p[3]}
         for p in products
     ]
-    logging.info(f"Retrieved {len(product_list)} products.")
+    logging.debug("Retrieved %d products.", len(product_list))
     return jsonify(product_list), 200
 
 @app.route('/products/search', methods=['GET'])
@@ -262,91 +418,391 @@ def delete_product(product_id):
         logging.warning(f"Failed to delete product '{product_id}' via API (not found?).")
         return jsonify({"message": "Failed to delete product. Product not found."}), 404
 
+@app.route('/products/<product_id>/price', methods=['GET'])
+def get_product_price(product_id):
+    price_manager = g.price_manager
+    as_of = request.args.get('as_of', '').strip()
+    if not as_of:
+        price = price_manager.current_prices().get(product_id)
+        if price is None:
+            return jsonify({"message": f"Product {product_id} not found."}), 404
+        return jsonify({"product_id": product_id, "price": price, "as_of": None}), 200
+
+    price = price_manager.get_price_as_of(product_id, as_of)
+    if price is None:
+        return jsonify({"message": f"No price for {product_id} as of {as_of} (use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS)."}), 404
+    return jsonify({"product_id": product_id, "price": price, "as_of": as_of}), 200
+
+@app.route('/products/<product_id>/price_history', methods=['GET'])
+def get_product_price_history(product_id):
+    history = g.price_manager.get_price_history(product_id)
+    return jsonify([{"effective_from": h[0], "price": h[1]} for h in history]), 200
+
+@app.route('/promotions', methods=['GET'])
+def get_promotions():
+    include_inactive = request.args.get('all', '').lower() in ('1', 'true')
+    promotions = g.promotion_manager.get_promotions(include_inactive)
+    return jsonify([
+        {"promotion_id": p[0], "name": p[1], "kind": p[2], "rule": p[3], "priority": p[4],
+         "starts_at": p[5], "ends_at": p[6], "active": bool(p[7])}
+        for p in promotions
+    ]), 200
+
+@app.route('/promotions', methods=['POST'])
+@require_session
+def add_promotion():
+    if g.current_user['role'] != 'admin':
+        return jsonify({"message": "Admin role required."}), 403
+    data = request.get_json() or {}
+    name = (data.get('name') or '').strip()
+    kind = data.get('kind')
+    rule = data.get('rule')
+    if not name or not kind or rule is None:
+        return jsonify({"message": "Name, kind and rule are required"}), 400
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({"message": "Priority must be an integer"}), 400
+
+    promotion_id = g.promotion_manager.add_promotion(name, kind, rule, priority,
+                                                     data.get('starts_at'), data.get('ends_at'))
+    if promotion_id is None:
+        return jsonify({"message": "Invalid promotion rule (see the server log for details)."}), 400
+    logging.info(f"User '{g.current_user['username']}' added promotion {promotion_id} ({kind}).")
+    return jsonify({"message": "Promotion added", "promotion_id": promotion_id}), 201
+
+@app.route('/promotions/<int:promotion_id>', methods=['PUT'])
+@require_session
+def set_promotion_active(promotion_id):
+    if g.current_user['role'] != 'admin':
+        return jsonify({"message": "Admin role required."}), 403
+    data = request.get_json() or {}
+    if 'active' not in data:
+        return jsonify({"message": "'active' is required"}), 400
+    if g.promotion_manager.set_promotion_active(promotion_id, bool(data['active'])):
+        return jsonify({"message": "Promotion updated"}), 200
+    return jsonify({"message": f"Promotion {promotion_id} not found."}), 404
+
+@app.route('/cart/quote', methods=['POST'])
+def quote_cart():
+    """Prices a cart the way checkout will: current prices plus the active promotions."""
+    data = request.get_json() or {}
+    prices = g.price_manager.current_prices_cents()
+    lines = []
+    for item in data.get('cart_items') or []:
+        product_id, qty = item.get('product_id'), item.get('qty')
+        if product_id not in prices:
+            return jsonify({"message": f"Product {product_id} not found."}), 404
+        if not isinstance(qty, int) or qty <= 0:
+            return jsonify({"message": f"Invalid quantity for {product_id}."}), 400
+        lines.append((product_id, qty))
+
+    totals, quote = price_cart(g.db_manager, prices, lines)
+    payload = totals_payload(totals, quote)
+    payload["line_discounts"] = {product_id: from_cents(cents) for product_id, cents in quote['line_discounts_cents'].items()}
+    return jsonify(payload), 200
+
 @app.route('/sales/checkout', methods=['POST'])
+@require_session
 def checkout_sale():
-    db_manager = g.db_manager
-    product_manager = g.product_manager
-    sales_manager = g.sales_manager
+    # The cashier comes from the verified session token, never from the request body
+    with lane_activity.checkout():
+        payload, status = process_checkout(g.db_manager, g.product_manager, g.sales_manager,
+                                           request.get_json(), g.current_user['username'])
+    return jsonify(payload), status
 
-    data = request.get_json()
+def price_cart(db_manager, prices, lines):
+    """
+    Prices cart lines in integer cents: the active promotions, then line totals, discounts
+    and VAT for the whole cart in one batched pass (money.cart_totals).
+    :param prices: Dict product_id -> unit price in cents (PriceManager.current_prices_cents()).
+    :param lines: List of (product_id, qty).
+    :return: (money.cart_totals result, promotion quote)
+    """
+    quote = PromotionManager(db_manager).quote(lines, prices)
+    # A product's discount is booked on its first line
+    line_discounts = dict(quote['line_discounts_cents'])
+    totals = cart_totals([prices[product_id] for product_id, _ in lines], [qty for _, qty in lines],
+                         [line_discounts.pop(product_id, 0) for product_id, _ in lines])
+    return totals, quote
+
+def totals_payload(totals, quote):
+    """The money fields of quote and checkout responses, as currency amounts."""
+    return {
+        "subtotal_amount": from_cents(totals['subtotal']),
+        "discount_amount": from_cents(totals['discount']),
+        "discounts": [{"promotion_id": d['promotion_id'], "name": d['name'], "amount": from_cents(d['amount_cents'])}
+                      for d in quote['discounts']],
+        "vat_amount": from_cents(totals['vat']),
+        "total_amount": from_cents(totals['total']),
+    }
+
+def process_checkout(db_manager, product_manager, sales_manager, data, cashier_id):
+    """
+    Runs the whole checkout as one database transaction. Framework-independent so the
+    Flask routes and the ASGI variant (pos_asgi.py) share it.
+    :return: (response payload dict, HTTP status code)
+    """
     cart_items_data = data.get('cart_items')
     payment_method = data.get('payment_method')
     amount_tendered = data.get('amount_tendered')
     change_due = data.get('change_due')
-    cashier_id = data.get('cashier_id')
 
     if not all([cart_items_data, payment_method, amount_tendered is not None, change_due is not None, cashier_id]):
         logging.warning("Checkout: Missing data fields.")
-        return jsonify({"message": "Missing cart items, payment method, amount tendered, change due, or cashier ID"}), 400
+        return {"message": "Missing cart items, payment method, amount tendered, change due, or cashier ID"}, 400
 
     if not cart_items_data:
-        return jsonify({"message": "Cart is empty"}), 400
+        return {"message": "Cart is empty"}, 400
+
+    prices = PriceManager(db_manager).current_prices_cents()
+    sale_lines, error = _checkout_lines(product_manager, prices, cart_items_data)
+    if error:
+        return error
+    if sales_manager.journal is not None:
+        return _process_journaled_checkout(product_manager, sales_manager, prices, sale_lines, payment_method,
+                                           amount_tendered, change_due, cashier_id)
 
     conn = db_manager.get_connection()
     sale_id = None
     try:
         conn.execute("BEGIN TRANSACTION")
-        logging.info("Backend: Starting checkout transaction.")
-
-        calculated_total_amount = 0.0
-        for item in cart_items_data:
-            product_id = item.get('product_id')
-            qty = item.get('qty')
-
-            db_product = product_manager.get_product_by_id(product_id)
-            if not db_product:
-                conn.rollback()
-                logging.warning(f"Checkout failed: Product {product_id} not found in DB.")
-                return jsonify({"message": f"Product {product_id} not found."}), 404
-
-            db_price = db_product[2]
-            db_stock = db_product[3]
-
-            if qty > db_stock:
-                conn.rollback()
-                logging.warning(f"Checkout failed: Insufficient stock for {item.get('name')} (ID: {product_id}). Requested: {qty}, Available: {db_stock}.")
-                return jsonify({"message": f"Insufficient stock for {item.get('name')} (Available: {db_stock})."}), 400
-
-            calculated_total_amount += db_price * qty
+        logging.debug("Backend: Starting checkout transaction.")
 
+        for product_id, name, qty in sale_lines:
+            # Guarded by stock >= qty; the product is only read back to explain a failure
             if not product_manager.decrease_product_stock(product_id, qty):
+                db_product = product_manager.get_product_by_id(product_id)
                 conn.rollback()
+                if db_product and qty > db_product[3]:
+                    logging.warning(f"Checkout failed: Insufficient stock for {name} (ID: {product_id}). Requested: {qty}, Available: {db_product[3]}.")
+                    return {"message": f"Insufficient stock for {name} (Available: {db_product[3]})."}, 400
                 logging.error(f"Failed to decrease stock for {product_id} during checkout.")
-                return jsonify({"message": f"Failed to update stock for {item.get('name')}."}), 500
+                return {"message": f"Failed to update stock for {name}."}, 500
 
-        sale_id = sales_manager.record_sale(calculated_total_amount, payment_method, cashier_id)
+        totals, quote = price_cart(db_manager, prices, [(product_id, qty) for product_id, _, qty in sale_lines])
+        sale_id = sales_manager.record_sale(from_cents(totals['total']), payment_method, cashier_id)
 
         if sale_id is None:
             raise Exception("Failed to record main sale (database error).")
-        logging.info(f"Backend: Main sale record created with Sale ID: {sale_id}")
-
-        for item in cart_items_data:
-            if not sales_manager.record_sale_item(
-                sale_id,
-                item['product_id'],
-                item['name'],
-                item['price'],
-                item['qty'],
-                item['total']
-            ):
-                raise Exception(f"Failed to record sale item: {item['name']}")
-            logging.info(f"Backend: Sale item recorded: Sale ID {sale_id}, Product ID {item['product_id']}, Qty {item['qty']}")
+        logging.debug("Backend: Main sale record created with Sale ID: %s", sale_id)
+
+        for (product_id, name, qty), line_total in zip(sale_lines, totals['line_totals']):
+            if not sales_manager.record_sale_item(sale_id, product_id, name, from_cents(prices[product_id]), qty,
+                                                  from_cents(line_total)):
+                raise Exception(f"Failed to record sale item: {name}")
+            logging.debug("Backend: Sale item recorded: Sale ID %s, Product ID %s, Qty %s", sale_id, product_id, qty)
+        if quote['discounts'] and not sales_manager.record_sale_discounts(sale_id, quote['discounts']):
+            raise Exception("Failed to record sale discounts.")
 
         conn.commit()
         logging.info(f"Backend: Checkout transaction committed successfully for Sale ID: {sale_id}")
-        return jsonify({
+        return {
             "message": "Checkout successful",
             "sale_id": sale_id,
-            "total_amount": calculated_total_amount,
+            **totals_payload(totals, quote),
             "payment_method": payment_method,
             "amount_tendered": amount_tendered,
             "change_due": change_due
-        }), 200
+        }, 200
 
     except Exception as e:
         conn.rollback()
         logging.error(f"Backend: Checkout error for Sale ID {sale_id}: {e}. Transaction rolled back.")
-        return jsonify({"message": f"An error occurred during checkout: {str(e)}", "details": "Transaction rolled back."}), 500
+        return {"message": f"An error occurred during checkout: {str(e)}", "details": "Transaction rolled back."}, 500
+
+def _checkout_lines(product_manager, prices, cart_items_data):
+    """
+    Validates cart items the way /cart/quote does, before anything is priced or written.
+    :return: ([(product_id, name, qty)], None), or (None, (error payload, HTTP status)).
+    """
+    lines = []
+    for item in cart_items_data:
+        if not isinstance(item, dict):
+            return None, ({"message": "Invalid cart item."}, 400)
+        product_id, qty = item.get('product_id'), item.get('qty')
+        # The charged price comes from the cached price map, never from the client
+        if product_id not in prices:
+            logging.warning(f"Checkout failed: Product {product_id} not found in DB.")
+            return None, ({"message": f"Product {product_id} not found."}, 404)
+        if not isinstance(qty, int) or qty <= 0:
+            logging.warning(f"Checkout failed: Invalid quantity {qty!r} for {product_id}.")
+            return None, ({"message": f"Invalid quantity for {product_id}."}, 400)
+        name = item.get('name')
+        if not name:
+            db_product = product_manager.get_product_by_id(product_id)
+            name = db_product[1] if db_product else product_id
+        lines.append((product_id, name, qty))
+    return lines, None
+
+def _process_journaled_checkout(product_manager, sales_manager, prices, sale_lines, payment_method,
+                                amount_tendered, change_due, cashier_id):
+    """Journal-mode checkout: one durable append instead of a multi-table transaction."""
+    totals, quote = price_cart(sales_manager.db_manager, prices, [(product_id, qty) for product_id, _, qty in sale_lines])
+    items = [{"product_id": product_id, "name": name, "price": from_cents(prices[product_id]),
+              "qty": qty, "subtotal": from_cents(line_total)}
+             for (product_id, name, qty), line_total in zip(sale_lines, totals['line_totals'])]
+
+    def stock_lookup(product_id):
+        db_product = product_manager.get_product_by_id(product_id)
+        return db_product[3] if db_product else 0
+
+    try:
+        sale_id = sales_manager.journal_sale(from_cents(totals['total']), payment_method, cashier_id, items, stock_lookup,
+                                             quote['discounts'])
+    except InsufficientStockError as e:
+        name = next((i['name'] for i in items if i['product_id'] == e.product_id), e.product_id)
+        logging.warning(f"Checkout failed: Insufficient stock for {name} (ID: {e.product_id}). Available: {e.available}.")
+        return {"message": f"Insufficient stock for {name} (Available: {e.available})."}, 400
+    if sale_id is None:
+        return {"message": "An error occurred during checkout: the sale could not be journaled."}, 500
+
+    logging.info(f"Backend: Checkout journaled for Sale ID: {sale_id}")
+    return {
+        "message": "Checkout successful",
+        "sale_id": sale_id,
+        **totals_payload(totals, quote),
+        "payment_method": payment_method,
+        "amount_tendered": amount_tendered,
+        "change_due": change_due
+    }, 200
+
+@app.route('/inventory/<product_id>/movements', methods=['GET'])
+def get_stock_movements(product_id):
+    inventory_manager = g.inventory_manager
+    start = request.args.get('start', '').strip() or None
+    end = request.args.get('end', '').strip() or None
+    try:
+        limit = int(request.args.get('limit', '500'))
+    except ValueError:
+        return jsonify({"message": "Invalid limit format. Must be an integer."}), 400
+
+    movements = inventory_manager.get_movements(product_id, start, end, limit)
+    movement_list = [
+        {"movement_id": m[0], "ts": m[1], "delta": m[2], "reason": m[3], "reference": m[4]}
+        for m in movements
+    ]
+    return jsonify(movement_list), 200
+
+@app.route('/inventory/<product_id>/stock', methods=['GET'])
+def get_stock_as_of(product_id):
+    inventory_manager = g.inventory_manager
+    as_of = request.args.get('as_of', '').strip()
+    if not as_of:
+        product = g.product_manager.get_product_by_id(product_id)
+        if not product:
+            return jsonify({"message": f"Product {product_id} not found."}), 404
+        return jsonify({"product_id": product_id, "stock": product[3], "as_of": None}), 200
+
+    stock = inventory_manager.get_stock_as_of(product_id, as_of)
+    if stock is None:
+        return jsonify({"message": "Invalid as_of. Use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS."}), 400
+    return jsonify({"product_id": product_id, "stock": stock, "as_of": as_of}), 200
+
+@app.route('/inventory/receipts', methods=['POST'])
+@require_session
+def receive_stock():
+    inventory_manager = g.inventory_manager
+    data = request.get_json() or {}
+    product_id = data.get('product_id', '').strip().upper()
+    quantity = data.get('quantity')
+    reference = data.get('reference')
+
+    try:
+        quantity = int(quantity)
+    except (TypeError, ValueError):
+        return jsonify({"message": "Quantity must be an integer"}), 400
+    if not product_id or quantity <= 0:
+        return jsonify({"message": "Product ID and a positive quantity are required"}), 400
+
+    if inventory_manager.receive_stock(product_id, quantity, reference):
+        logging.info(f"User '{g.current_user['username']}' received {quantity} of {product_id}.")
+        return jsonify({"message": "Stock received", "product_id": product_id, "quantity": quantity}), 201
+    return jsonify({"message": f"Could not receive stock for {product_id}."}), 404
+
+@app.route('/inventory/low_stock', methods=['GET'])
+def get_low_stock_products():
+    """Products at or below their reorder threshold; read from the trigger-maintained set."""
+    low_stock = g.inventory_manager.get_low_stock_products()
+    return jsonify([
+        {"product_id": r[0], "name": r[1], "stock": r[2], "threshold": r[3], "since": r[4]}
+        for r in low_stock
+    ]), 200
+
+@app.route('/inventory/alerts', methods=['GET'])
+def get_stock_alerts():
+    """Threshold crossings after ?after_id= (the last alert_id the client has seen), oldest first."""
+    try:
+        after_id = int(request.args.get('after_id', '0'))
+        limit = int(request.args.get('limit', '100'))
+    except ValueError:
+        return jsonify({"message": "after_id and limit must be integers."}), 400
+
+    alerts = g.inventory_manager.get_stock_alerts(after_id, limit)
+    return jsonify([
+        {"alert_id": a[0], "product_id": a[1], "kind": a[2], "stock": a[3], "threshold": a[4], "created_at": a[5]}
+        for a in alerts
+    ]), 200
+
+@app.route('/inventory/<product_id>/threshold', methods=['PUT'])
+@require_session
+def set_reorder_threshold(product_id):
+    data = request.get_json() or {}
+    if 'threshold' not in data:
+        return jsonify({"message": "'threshold' is required (null removes it)"}), 400
+    threshold = data['threshold']
+    if threshold is not None and (not isinstance(threshold, int) or threshold < 0):
+        return jsonify({"message": "Threshold must be a non-negative integer or null"}), 400
+
+    if g.inventory_manager.set_reorder_threshold(product_id, threshold):
+        logging.info(f"User '{g.current_user['username']}' set the reorder threshold of {product_id} to {threshold}.")
+        return jsonify({"message": "Threshold updated", "product_id": product_id, "threshold": threshold}), 200
+    return jsonify({"message": f"Could not set the threshold for {product_id}."}), 404
+
+@app.route('/inventory/thresholds/from_reorder', methods=['POST'])
+@require_session
+def set_thresholds_from_reorder_points():
+    """Sets every threshold to the reorder point computed by the last reorder job."""
+    if g.current_user['role'] != 'admin':
+        return jsonify({"message": "Admin role required."}), 403
+    count = g.inventory_manager.set_thresholds_from_reorder_points()
+    if count is None:
+        return jsonify({"message": "Could not set thresholds (see the server log for details)."}), 500
+    return jsonify({"message": "Thresholds updated", "products": count}), 200
+
+@app.route('/reorder/suggestions', methods=['GET'])
+def get_reorder_suggestions():
+    """Latest reorder suggestions; products due for reorder only, most urgent first, unless ?all=1."""
+    only_due = request.args.get('all', '0') not in ('1', 'true')
+    try:
+        limit = int(request.args.get('limit', '0')) or None
+    except ValueError:
+        return jsonify({"message": "Invalid limit format. Must be an integer."}), 400
+
+    rolled_through, computed_at = g.reorder_manager.get_reorder_status()
+    suggestions = g.reorder_manager.get_reorder_suggestions(only_due=only_due, limit=limit)
+    return jsonify({
+        "rolled_through": rolled_through,
+        "computed_at": computed_at,
+        "suggestions": [
+            {"product_id": r[0], "name": r[1], "stock": r[2], "daily_velocity": r[3], "days_of_cover": r[4],
+             "reorder_point": r[5], "suggested_qty": r[6]}
+            for r in suggestions
+        ]
+    }), 200
+
+@app.route('/reorder/run', methods=['POST'])
+@require_session
+def run_reorder_job():
+    """Runs the reorder job now; {"full": true} rebuilds the daily rollup from scratch."""
+    if g.current_user['role'] != 'admin':
+        return jsonify({"message": "Admin role required."}), 403
+    full = bool((request.get_json(silent=True) or {}).get('full'))
+    due = g.reorder_manager.run_reorder_job(full=full)
+    if due is None:
+        return jsonify({"message": "Reorder job failed (see the server log for details)."}), 500
+    logging.info(f"User '{g.current_user['username']}' ran the reorder job ({due} products to reorder).")
+    return jsonify({"message": "Reorder suggestions updated", "products_to_reorder": due}), 200
 
 @app.route('/reports/daily_sales', methods=['GET'])
 def get_daily_sales_report():
@@ -361,6 +817,20 @@ def get_daily_sales_report():
     logging.info(f"Generated daily sales report for {date_str}. Total: {total_amount}, Count: {num_sales}.")
     return jsonify({"date": date_str, "total_sales_amount": total_amount, "number_of_sales": num_sales}), 200
 
+@app.route('/reports/z_report', methods=['GET'])
+def get_z_report():
+    """The stored Z-report of ?date= (default yesterday), per cashier and payment method."""
+    date_str = request.args.get('date', (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")).strip()
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"message": "Invalid date format. Use YYYY-MM-DD."}), 400
+
+    z_report = g.sales_manager.get_z_report(date_str)
+    if z_report is None:
+        return jsonify({"message": f"No Z-report has been generated for {date_str}."}), 404
+    return jsonify(z_report), 200
+
 @app.route('/reports/sales_history', methods=['GET'])
 def get_sales_history():
     sales_manager = g.sales_manager
@@ -383,6 +853,65 @@ def get_sales_history():
     logging.info(f"Generated sales history for {start_date_str} to {end_date_str}. Found {len(sales_list)} sales.")
     return jsonify(sales_list), 200
 
+def _report_period(default_days):
+    """:return: (start_date, end_date, None) from the query string, or (None, None, error response)."""
+    start_date_str = request.args.get('start_date', (datetime.now() - timedelta(days=default_days)).strftime("%Y-%m-%d")).strip()
+    end_date_str = request.args.get('end_date', datetime.now().strftime("%Y-%m-%d")).strip()
+    try:
+        if datetime.strptime(start_date_str, "%Y-%m-%d") > datetime.strptime(end_date_str, "%Y-%m-%d"):
+            return None, None, (jsonify({"message": "Start date cannot be after end date."}), 400)
+    except ValueError:
+        return None, None, (jsonify({"message": "Invalid date format. Use YYYY-MM-DD."}), 400)
+    return start_date_str, end_date_str, None
+
+def _period_cache_headers(end_date_str):
+    # A period that ended before today is final, so clients and proxies may keep the report
+    if end_date_str < datetime.now().strftime("%Y-%m-%d"):
+        return {"Cache-Control": "private, max-age=86400"}
+    return {"Cache-Control": "no-store"}
+
+@app.route('/reports/timeseries', methods=['GET'])
+def get_sales_timeseries_report():
+    """Revenue and transactions per ?bucket=hour|day between start_date and end_date, split by payment method."""
+    start_date_str, end_date_str, error = _report_period(7)
+    if error:
+        return error
+    bucket = request.args.get('bucket', 'day').strip()
+    if bucket not in TIMESERIES_BUCKETS:
+        return jsonify({"message": f"Invalid bucket. Use one of: {', '.join(TIMESERIES_BUCKETS)}."}), 400
+    days = (datetime.strptime(end_date_str, "%Y-%m-%d") - datetime.strptime(start_date_str, "%Y-%m-%d")).days + 1
+    if bucket == 'hour' and days > MAX_HOURLY_REPORT_DAYS:
+        return jsonify({"message": f"Hourly buckets are limited to {MAX_HOURLY_REPORT_DAYS} days; use bucket=day."}), 400
+
+    series = g.sales_manager.get_sales_timeseries(start_date_str, end_date_str, bucket)
+    if series is None:
+        return jsonify({"message": "Could not compute the sales timeseries."}), 500
+    points = [
+        {"period": period, "revenue": revenue, "transactions": transactions,
+         "payment_methods": {method: {"revenue": r, "transactions": t} for method, (r, t) in by_method.items()}}
+        for period, revenue, transactions, by_method in series
+    ]
+    logging.info(f"Generated {bucket} sales timeseries for {start_date_str} to {end_date_str}.")
+    return jsonify({"start_date": start_date_str, "end_date": end_date_str, "bucket": bucket, "series": points}), \
+        200, _period_cache_headers(end_date_str)
+
+@app.route('/reports/heatmap', methods=['GET'])
+def get_sales_heatmap_report():
+    """Revenue and transactions by weekday x hour of day between start_date and end_date."""
+    start_date_str, end_date_str, error = _report_period(28)
+    if error:
+        return error
+    payment_method = request.args.get('payment_method', '').strip() or None
+
+    heatmap = g.sales_manager.get_sales_heatmap(start_date_str, end_date_str, payment_method)
+    if heatmap is None:
+        return jsonify({"message": "Could not compute the sales heatmap."}), 500
+    revenue, transactions = heatmap
+    logging.info(f"Generated sales heatmap for {start_date_str} to {end_date_str}.")
+    return jsonify({"start_date": start_date_str, "end_date": end_date_str, "payment_method": payment_method,
+                    "weekdays": list(WEEKDAYS), "hours": list(range(24)),
+                    "revenue": revenue, "transactions": transactions}), 200, _period_cache_headers(end_date_str)
+
 @app.route('/reports/sale_items/<int:sale_id>', methods=['GET'])
 def get_sale_items(sale_id):
     sales_manager = g.sales_manager
@@ -399,6 +928,34 @@ def get_sale_items(sale_id):
         return jsonify({"message": f"Could not retrieve sale items for Sale ID {sale_id}."}), 500
 
 
+@app.route('/reports/analytics', methods=['GET'])
+def get_analytics_report():
+    """Revenue grouped by ?by=hour|day|month|cashier|payment_method|product, from the columnar store."""
+    if analytics_store is None:
+        return jsonify({"message": "Analytics store is not enabled (set POS_ANALYTICS_DIR)."}), 503
+    dimension = request.args.get('by', 'day').strip()
+    start_date_str = request.args.get('start_date', '').strip() or None
+    end_date_str = request.args.get('end_date', '').strip() or None
+    if dimension not in DIMENSIONS:
+        return jsonify({"message": f"Invalid 'by'. Use one of: {', '.join(DIMENSIONS)}."}), 400
+    try:
+        for date_str in (start_date_str, end_date_str):
+            if date_str:
+                datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"message": "Invalid date format. Use YYYY-MM-DD."}), 400
+
+    rows = analytics_store.revenue_by(dimension, start_date_str, end_date_str)
+    count_name = "units_sold" if dimension == "product" else "number_of_sales"
+    if dimension == "product":
+        groups = [{"product_id": key[0], "product_name": key[1], "revenue": revenue, count_name: count}
+                  for key, revenue, count in rows]
+    else:
+        groups = [{dimension: key, "revenue": revenue, count_name: count} for key, revenue, count in rows]
+    manifest = analytics_store.manifest()
+    return jsonify({"by": dimension, "start_date": start_date_str, "end_date": end_date_str,
+                    "exported_through_sale_id": manifest["last_sale_id"], "groups": groups}), 200
+
 @app.route('/reports/top_products', methods=['GET'])
 def get_top_selling_products_report():
     sales_manager = g.sales_manager
@@ -429,6 +986,111 @@ def get_top_selling_products_report():
     logging.info(f"Generated top selling products report for {start_date_str} to {end_date_str} with limit {limit}.")
     return jsonify(top_products_list), 200
 
+def _job_run_payload(run):
+    run_id, job, due_at, started_at, finished_at, status, result = run
+    return {"run_id": run_id, "job": job, "due_at": due_at, "started_at": started_at,
+            "finished_at": finished_at, "status": status, "result": result}
+
+@app.route('/scheduler/jobs', methods=['GET'])
+@require_session
+def get_scheduled_jobs():
+    """Every background job with its schedule, the run pending for it and its last run."""
+    scheduler = get_job_scheduler()
+    jobs = [
+        {"job": name, "schedule": schedule, "due_at": due_at.strftime("%Y-%m-%d %H:%M:%S") if due_at else None,
+         "last_run": _job_run_payload(last_run) if last_run else None}
+        for name, schedule, due_at, last_run in scheduler.get_status()
+    ]
+    return jsonify({"scheduler_running": scheduler.is_running(), "jobs": jobs}), 200
+
+@app.route('/scheduler/runs', methods=['GET'])
+@require_session
+def get_job_runs():
+    """Run history, newest first; ?job= filters, ?limit= (default 50)."""
+    job = request.args.get('job', '').strip() or None
+    try:
+        limit = int(request.args.get('limit', '50'))
+        if limit <= 0:
+            return jsonify({"message": "Limit must be a positive integer."}), 400
+    except ValueError:
+        return jsonify({"message": "Invalid limit format. Must be an integer."}), 400
+    return jsonify([_job_run_payload(run) for run in get_job_scheduler().get_runs(job, limit)]), 200
+
+@app.route('/scheduler/jobs/<job>/run', methods=['POST'])
+@require_session
+def run_scheduled_job(job):
+    """Runs a background job now, in this request; 409 while another job run holds the lock."""
+    if g.current_user['role'] != 'admin':
+        return jsonify({"message": "Admin role required."}), 403
+    if job not in JOBS:
+        return jsonify({"message": f"Unknown job. Use one of: {', '.join(JOBS)}."}), 404
+    run = get_job_scheduler().run_job(job)
+    if run is None:
+        return jsonify({"message": "Another job is running; try again shortly."}), 409
+    run_id, status, result = run
+    logging.info(f"User '{g.current_user['username']}' ran job {job} (run {run_id}: {status}).")
+    return jsonify({"run_id": run_id, "job": job, "status": status, "result": result}), \
+        200 if status == 'ok' else 500
+
+# --- Change-log replication (see replication.py): this instance acting as head office ---
+@app.route('/sync/node', methods=['GET'])
+def get_sync_node():
+    return jsonify({"node": g.replication_manager.get_node_id()}), 200
+
+@app.route('/sync/changes', methods=['GET'])
+@require_session
+def get_sync_changes():
+    """Product changes after ?since= (a pull checkpoint), at most ?limit= of them (admin only)."""
+    if g.current_user['role'] != 'admin':
+        return jsonify({"message": "Admin role required."}), 403
+    try:
+        since = int(request.args.get('since', '0'))
+        limit = int(request.args.get('limit', str(DEFAULT_BATCH)))
+        if since < 0 or not 0 < limit <= 5000:
+            return jsonify({"message": "since must be >= 0 and limit between 1 and 5000."}), 400
+    except ValueError:
+        return jsonify({"message": "since and limit must be integers."}), 400
+    changes = g.replication_manager.changes_since(since, limit)
+    if changes is None:
+        return jsonify({"message": "Failed to read changes."}), 500
+    return jsonify(changes), 200
+
+@app.route('/sync/sales', methods=['POST'])
+@require_session
+def push_sync_sales():
+    """Stores a batch of sales pushed by a terminal (admin only); re-pushed sales replace their earlier copy."""
+    if g.current_user['role'] != 'admin':
+        return jsonify({"message": "Admin role required."}), 403
+    data = request.get_json(silent=True) or {}
+    origin = str(data.get('origin') or '').strip()
+    sales = data.get('sales')
+    deleted = data.get('deleted') or []
+    if not origin or not isinstance(sales, list) or not isinstance(deleted, list):
+        return jsonify({"message": "origin, sales (list) and deleted (list) are required."}), 400
+    if origin == g.replication_manager.get_node_id():
+        return jsonify({"message": "A database cannot sync with itself."}), 400
+    counts = g.replication_manager.apply_sales(origin, sales, deleted)
+    if counts is None:
+        return jsonify({"message": "Failed to store the sales."}), 500
+    inserted, replaced, removed = counts
+    logging.info(f"Stored {inserted + replaced} sales pushed by {origin} ({removed} deleted).")
+    return jsonify({"inserted": inserted, "replaced": replaced, "deleted": removed}), 200
+
+@app.route('/sync/status', methods=['GET'])
+@require_session
+def get_sync_status():
+    """This node's id, its sync checkpoints per peer and the local sales not pushed yet."""
+    status = g.replication_manager.get_sync_status()
+    if status is None:
+        return jsonify({"message": "Failed to get sync status."}), 500
+    node_id, peers, unpushed = status
+    return jsonify({
+        "node": node_id,
+        "peers": [{"peer": peer_id, "pulled_seq": pulled, "pushed_seq": pushed, "last_sync_at": last_sync_at}
+                  for peer_id, pulled, pushed, last_sync_at in peers],
+        "unpushed_sales": unpushed,
+    }), 200
+
 # Run one-time database setup when the application starts
 if __name__ == '__main__':
     setup_database_once() # Call this ONCE before running the app
@@ -2,11 +2,11 @@
 
 
 a = Analysis(
-    ['pos_app.py'],
+    ['serve.py'],
     pathex=[],
     binaries=[],
     datas=[('templates', 'templates')],
-    hiddenimports=[],
+    hiddenimports=['waitress'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
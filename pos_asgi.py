@@ -0,0 +1,629 @@
+"""
+Asyncio (ASGI) variant of the POS API, with the same payloads as pos_app.py, plus
+GET /events (server-sent events for sales and product changes).
+
+Login/logout, the product catalog (/products), /sales/checkout and the daily_sales,
+sales_history, sale_items and top_products reports are implemented here natively. Every
+other path (prices, promotions and /cart/quote, /inventory, /reorder, the remaining
+reports, /scheduler, /sync, /metrics) is passed to pos_app's Flask app through a small
+WSGI bridge, on the same threads as the native handlers: GET and HEAD on a reader thread,
+anything else on the writer thread. Bridged responses are buffered and not cancellable.
+Background jobs still run in this process when POS_SCHEDULER=1, and checkouts report to
+the scheduler's lane activity.
+
+    uvicorn pos_asgi:app --host 0.0.0.0 --port 5000
+    python pos_asgi.py
+
+The event loop never touches SQLite. Reads go to a pool of reader threads and all
+writes to a single writer thread (SQLite allows one writer at a time anyway); each
+thread keeps its own DBManager and managers. Long reports run cancellably: if the
+client disconnects, the running statement is interrupted.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+import pos_app
+from pos_app import setup_database_once, process_checkout, session_tokens
+from scheduler import lane_activity
+from db_manager import DBManager
+from product_manager import ProductManager
+from sales_manager import SalesManager
+from user_manager import UserManager, HashPoolBusyError
+from password_hashers import get_hash_pool, hash_password, verify_password, needs_rehash, HASH_TIMEOUT_SECONDS
+
+DEFAULT_READERS = 8
+STREAM_BATCH_SIZE = 500
+SSE_HEARTBEAT_SECONDS = 15
+SSE_QUEUE_SIZE = 100
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "dms_pos.html")
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class DatabaseExecutors:
+    """Reader pool + single writer thread, each thread with its own connection and managers."""
+
+    def __init__(self, db_name, readers=DEFAULT_READERS):
+        self.db_name = db_name
+        self._local = threading.local()
+        self.reader = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+    def _managers(self):
+        managers = getattr(self._local, "managers", None)
+        if managers is None:
+            db_manager = DBManager(self.db_name)
+            managers = SimpleNamespace(
+                db_manager=db_manager,
+                product_manager=ProductManager(db_manager),
+                sales_manager=SalesManager(db_manager, journal=pos_app.sales_journal),
+                user_manager=UserManager(db_manager),
+            )
+            self._local.managers = managers
+        return managers
+
+    async def read(self, fn, *args):
+        """Runs fn(managers, *args) on a reader thread."""
+        return await asyncio.get_running_loop().run_in_executor(self.reader, lambda: fn(self._managers(), *args))
+
+    async def write(self, fn, *args):
+        """Runs fn(managers, *args) on the writer thread."""
+        return await asyncio.get_running_loop().run_in_executor(self.writer, lambda: fn(self._managers(), *args))
+
+    async def read_cancellable(self, receive, fn, *args):
+        """Like read(), but interrupts the statement and raises ClientDisconnected if the client goes away."""
+        state = {"conn": None, "cancelled": False}
+        lock = threading.Lock()
+
+        def job():
+            managers = self._managers()
+            with lock:
+                if state["cancelled"]:
+                    raise ClientDisconnected()
+                state["conn"] = managers.db_manager.get_connection()
+            try:
+                return fn(managers, *args)
+            finally:
+                with lock:
+                    state["conn"] = None
+
+        future = asyncio.get_running_loop().run_in_executor(self.reader, job)
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+        done, _ = await asyncio.wait({future, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if disconnect in done:
+            with lock:
+                state["cancelled"] = True
+                if state["conn"] is not None:
+                    state["conn"].interrupt()
+            logging.info("ASGI: client disconnected, report query interrupted.")
+            raise ClientDisconnected()
+        disconnect.cancel()
+        return future.result()
+
+    def shutdown(self):
+        self.reader.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+
+
+class EventBroker:
+    """In-process fan-out of events to SSE subscribers. Slow subscribers drop events rather than block."""
+
+    def __init__(self):
+        self._subscribers = set()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event, data):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                pass
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+_CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type, Authorization"),
+    (b"access-control-allow-methods", b"GET, POST, PUT, DELETE, OPTIONS"),
+]
+
+
+async def _send_response(send, status, body, content_type=b"application/json"):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())] + _CORS_HEADERS})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, payload, status=200):
+    await _send_response(send, status, json.dumps(payload).encode("utf-8"))
+
+
+def _product_rows(products):
+    return [{"product_id": p[0], "name": p[1], "price": p[2], "stock": p[3]} for p in products]
+
+
+def _validate_date_range(start_date_str, end_date_str):
+    """Returns an error message, or None when both dates are valid and ordered."""
+    try:
+        if datetime.strptime(start_date_str, "%Y-%m-%d") > datetime.strptime(end_date_str, "%Y-%m-%d"):
+            return "Start date cannot be after end date."
+    except ValueError:
+        return "Invalid date format. UseYYYY-MM-DD."
+    return None
+
+
+def _validate_price_stock(price, stock):
+    """Returns (price, stock, error message)."""
+    try:
+        price = float(price)
+        stock = int(stock)
+    except (TypeError, ValueError):
+        return None, None, "Price must be a number and Stock an integer"
+    if price <= 0:
+        return None, None, "Price must be positive"
+    if stock < 0:
+        return None, None, "Stock cannot be negative"
+    return price, stock, None
+
+
+async def _hash(fn, *args):
+    """Runs a password hash on the hashing pool without holding a reader or writer thread."""
+    future = get_hash_pool().submit(fn, *args)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), HASH_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HashPoolBusyError("Password hashing timed out, try again shortly.")
+
+
+def _wsgi_environ(scope, body):
+    """Builds a PEP 3333 environ for an ASGI http scope and its (already read) body."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_LENGTH":
+            continue
+        key = name if name == "CONTENT_TYPE" else "HTTP_" + name
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+def _call_wsgi(wsgi_app, environ):
+    """Runs a WSGI app to completion. :return: (status code, ASGI headers, body)."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], body
+
+
+class Request:
+    def __init__(self, scope, receive, params):
+        self.scope = scope
+        self.receive = receive
+        self.params = params
+        self.args = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+
+    async def json(self):
+        body = await _read_body(self.receive)
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            return {}
+
+    def current_user(self):
+        auth_header = self.headers.get("authorization", "")
+        token = auth_header[len("Bearer "):].strip() if auth_header.startswith("Bearer ") else None
+        return session_tokens.verify_token(token), token
+
+
+class POSAsgiApp:
+    def __init__(self, db_name=None, readers=DEFAULT_READERS):
+        self.db_name = db_name or pos_app.DATABASE_NAME
+        self.readers = readers
+        self.db = None
+        self.events = EventBroker()
+        self.routes = []
+        self._template = None
+        for method, pattern, handler in [
+            ("GET", r"/", self.home),
+            ("POST", r"/login", self.login),
+            ("POST", r"/logout", self.logout),
+            ("GET", r"/products", self.get_products),
+            ("GET", r"/products/search", self.search_products),
+            ("POST", r"/products", self.add_product),
+            ("PUT", r"/products/(?P<product_id>[^/]+)", self.update_product),
+            ("DELETE", r"/products/(?P<product_id>[^/]+)", self.delete_product),
+            ("POST", r"/sales/checkout", self.checkout_sale),
+            ("GET", r"/reports/daily_sales", self.daily_sales_report),
+            ("GET", r"/reports/sales_history", self.sales_history),
+            ("GET", r"/reports/sale_items/(?P<sale_id>\d+)", self.sale_items),
+            ("GET", r"/reports/top_products", self.top_products_report),
+            ("GET", r"/events", self.event_stream),
+        ]:
+            self.routes.append((method, re.compile(pattern + r"\Z"), handler))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        if scope["method"] == "OPTIONS":
+            await _send_response(send, 204, b"")
+            return
+        path_matched = False
+        for method, pattern, handler in self.routes:
+            match = pattern.match(scope["path"])
+            if not match:
+                continue
+            path_matched = True
+            if method != scope["method"]:
+                continue
+            try:
+                await handler(Request(scope, receive, match.groupdict()), send)
+            except ClientDisconnected:
+                pass
+            except Exception as e:
+                logging.error(f"ASGI: unhandled error on {scope['method']} {scope['path']}: {e}")
+                await _send_json(send, {"message": f"Server error: An unexpected issue occurred. {e}"}, 500)
+            return
+        if path_matched:
+            await _send_json(send, {"message": "Method not allowed"}, 405)
+            return
+        try:
+            await self.bridge_to_flask(scope, receive, send)
+        except ClientDisconnected:
+            pass
+        except Exception as e:
+            logging.error(f"ASGI: unhandled error on {scope['method']} {scope['path']}: {e}")
+            await _send_json(send, {"message": f"Server error: An unexpected issue occurred. {e}"}, 500)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                pos_app.DATABASE_NAME = self.db_name
+                await asyncio.get_running_loop().run_in_executor(None, setup_database_once)
+                self.db = DatabaseExecutors(self.db_name, self.readers)
+                logging.info(f"ASGI: started with {self.readers} reader threads and 1 writer thread.")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.db is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, self.db.shutdown)
+                logging.info("ASGI: shut down.")
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # --- Handlers ---
+    async def home(self, request, send):
+        if self._template is None:
+            with open(TEMPLATE_PATH, "rb") as f:
+                self._template = f.read()
+        await _send_response(send, 200, self._template, b"text/html; charset=utf-8")
+
+    async def login(self, request, send):
+        data = await request.json()
+        username = data.get("username")
+        password = data.get("password")
+        if not username or not password:
+            logging.warning("Login attempt: Missing username or password.")
+            await _send_json(send, {"message": "Username and password are required"}, 400)
+            return
+        # Only the row lookup and the rehash UPDATE use database threads; hashing is awaited here
+        user = await self.db.read(lambda m: m.user_manager.get_credentials(username))
+        try:
+            if user is None:
+                # Spend the same hashing time for unknown users so usernames cannot be probed by timing
+                await _hash(hash_password, password)
+                verified = False
+            else:
+                verified = await _hash(verify_password, password, user[3])
+        except HashPoolBusyError as e:
+            logging.warning(f"Login for '{username}' rejected: {e}")
+            await _send_json(send, {"message": str(e)}, 503)
+            return
+        if not verified:
+            logging.warning(f"Login failed for username: {username}.")
+            await _send_json(send, {"message": "Invalid username or password"}, 401)
+            return
+        if needs_rehash(user[3]):
+            try:
+                new_hash = await _hash(hash_password, password)
+                await self.db.write(lambda m: m.user_manager.set_password_hash(user[0], new_hash))
+            except HashPoolBusyError as e:
+                # Not fatal: the old hash still verifies, the upgrade is retried on the next login
+                logging.warning(f"Could not upgrade password hash for user {user[0]}: {e}")
+        user_info = {"user_id": user[0], "username": user[1], "role": user[2]}
+        logging.info(f"User '{username}' logged in successfully.")
+        token = session_tokens.issue_token(user_info)
+        await _send_json(send, {"message": "Login successful", "user": user_info, "token": token})
+
+    async def logout(self, request, send):
+        user_info, token = request.current_user()
+        if user_info is None:
+            await _send_json(send, {"message": "Authentication required. Please log in again."}, 401)
+            return
+        session_tokens.revoke_token(token)
+        await _send_json(send, {"message": "Logged out successfully"})
+
+    async def get_products(self, request, send):
+        products = await self.db.read(lambda m: m.product_manager.get_all_products())
+        await _send_json(send, _product_rows(products))
+
+    async def search_products(self, request, send):
+        query = request.args.get("q", "").strip()
+        if not query:
+            await _send_json(send, {"message": "Search query 'q' is required"}, 400)
+            return
+        products = await self.db.read(lambda m: m.product_manager.search_products(query))
+        await _send_json(send, _product_rows(products))
+
+    async def add_product(self, request, send):
+        data = await request.json()
+        product_id = (data.get("product_id") or "").strip().upper()
+        name = (data.get("name") or "").strip()
+        if not all([product_id, name, data.get("price") is not None, data.get("stock") is not None]):
+            await _send_json(send, {"message": "Product ID, Name, Price, and Stock are required"}, 400)
+            return
+        price, stock, error = _validate_price_stock(data.get("price"), data.get("stock"))
+        if error:
+            await _send_json(send, {"message": error}, 400)
+            return
+        if await self.db.write(lambda m: m.product_manager.add_product(product_id, name, price, stock)):
+            self.events.publish("product_changed", {"product_id": product_id})
+            await _send_json(send, {"message": "Product added successfully", "product_id": product_id}, 201)
+        else:
+            await _send_json(send, {"message": "Failed to add product. Product ID might already exist."}, 409)
+
+    async def update_product(self, request, send):
+        product_id = request.params["product_id"]
+        data = await request.json()
+        name = (data.get("name") or "").strip()
+        if not all([name, data.get("price") is not None, data.get("stock") is not None]):
+            await _send_json(send, {"message": "Name, Price, and Stock are required"}, 400)
+            return
+        price, stock, error = _validate_price_stock(data.get("price"), data.get("stock"))
+        if error:
+            await _send_json(send, {"message": error}, 400)
+            return
+        if await self.db.write(lambda m: m.product_manager.update_product(product_id, name, price, stock)):
+            self.events.publish("product_changed", {"product_id": product_id})
+            await _send_json(send, {"message": "Product updated successfully"})
+        else:
+            await _send_json(send, {"message": "Failed to update product. Product not found."}, 404)
+
+    async def delete_product(self, request, send):
+        product_id = request.params["product_id"]
+        if await self.db.write(lambda m: m.product_manager.delete_product(product_id)):
+            self.events.publish("product_changed", {"product_id": product_id, "deleted": True})
+            await _send_json(send, {"message": "Product deleted successfully"})
+        else:
+            await _send_json(send, {"message": "Failed to delete product. Product not found."}, 404)
+
+    async def checkout_sale(self, request, send):
+        user_info, _ = request.current_user()
+        if user_info is None:
+            await _send_json(send, {"message": "Authentication required. Please log in again."}, 401)
+            return
+        data = await request.json()
+        # Counted from the moment it waits for the writer, so idle-time jobs hold off meanwhile
+        with lane_activity.checkout():
+            payload, status = await self.db.write(
+                lambda m: process_checkout(m.db_manager, m.product_manager, m.sales_manager, data, user_info["username"])
+            )
+        if status == 200:
+            self.events.publish("sale_completed", {
+                "sale_id": payload["sale_id"],
+                "total_amount": payload["total_amount"],
+                "product_ids": [item.get("product_id") for item in data.get("cart_items", [])],
+            })
+        await _send_json(send, payload, status)
+
+    async def daily_sales_report(self, request, send):
+        date_str = request.args.get("date", datetime.now().strftime("%Y-%m-%d")).strip()
+        try:
+            datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            await _send_json(send, {"message": "Invalid date format. UseYYYY-MM-DD."}, 400)
+            return
+        total_amount, num_sales = await self.db.read_cancellable(
+            request.receive, lambda m: m.sales_manager.get_daily_sales_summary(date_str))
+        await _send_json(send, {"date": date_str, "total_sales_amount": total_amount, "number_of_sales": num_sales})
+
+    async def sales_history(self, request, send):
+        """Streams the JSON array in batches; stops reading from SQLite if the client disconnects."""
+        start_date_str = request.args.get("start_date", (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")).strip()
+        end_date_str = request.args.get("end_date", datetime.now().strftime("%Y-%m-%d")).strip()
+        error = _validate_date_range(start_date_str, end_date_str)
+        if error:
+            await _send_json(send, {"message": error}, 400)
+            return
+
+        loop = asyncio.get_running_loop()
+        batches = asyncio.Queue(maxsize=4)
+        cancelled = threading.Event()
+
+        def produce(m):
+            # Pinned to one reader thread for the cursor's lifetime; put() blocks for backpressure
+            try:
+                for rows in m.sales_manager.iter_sales_report(start_date_str + " 00:00:00", end_date_str + " 23:59:59",
+                                                              STREAM_BATCH_SIZE):
+                    if cancelled.is_set():
+                        return
+                    asyncio.run_coroutine_threadsafe(batches.put(rows), loop).result()
+            finally:
+                asyncio.run_coroutine_threadsafe(batches.put(None), loop)
+
+        producer = asyncio.ensure_future(self.db.read(produce))
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(request.receive))
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")] + _CORS_HEADERS})
+        first = True
+        try:
+            while True:
+                next_batch = asyncio.ensure_future(batches.get())
+                done, _ = await asyncio.wait({next_batch, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnect in done:
+                    next_batch.cancel()
+                    raise ClientDisconnected()
+                rows = next_batch.result()
+                if rows is None:
+                    break
+                chunk = ",".join(json.dumps({"sale_id": r[0], "total_amount": r[1], "payment_method": r[2],
+                                             "sale_date": r[3], "cashier_id": r[4]}) for r in rows)
+                await send({"type": "http.response.body", "body": (("[" if first else ",") + chunk).encode(),
+                            "more_body": True})
+                first = False
+            await send({"type": "http.response.body", "body": b"[]" if first else b"]"})
+        finally:
+            cancelled.set()
+            disconnect.cancel()
+            # Unblock a producer waiting on a full queue so its thread is released
+            while not batches.empty():
+                batches.get_nowait()
+            await asyncio.gather(producer, return_exceptions=True)
+
+    async def sale_items(self, request, send):
+        sale_id = int(request.params["sale_id"])
+        sale_details = await self.db.read(lambda m: m.sales_manager.get_sale_details(sale_id))
+        if sale_details is None:
+            await _send_json(send, {"message": f"Sale with ID {sale_id} not found."}, 404)
+        else:
+            await _send_json(send, sale_details["items"])
+
+    async def top_products_report(self, request, send):
+        start_date_str = request.args.get("start_date", (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")).strip()
+        end_date_str = request.args.get("end_date", datetime.now().strftime("%Y-%m-%d")).strip()
+        try:
+            limit = int(request.args.get("limit", "10").strip())
+            if limit <= 0:
+                await _send_json(send, {"message": "Limit must be a positive integer."}, 400)
+                return
+        except ValueError:
+            await _send_json(send, {"message": "Invalid limit format. Must be an integer."}, 400)
+            return
+        error = _validate_date_range(start_date_str, end_date_str)
+        if error:
+            await _send_json(send, {"message": error}, 400)
+            return
+        top_products = await self.db.read_cancellable(
+            request.receive,
+            lambda m: m.sales_manager.get_top_selling_products(limit=limit, start_date_str=start_date_str,
+                                                               end_date_str=end_date_str))
+        await _send_json(send, [{"product_name": p[0], "units_sold": p[1]} for p in top_products])
+
+    async def bridge_to_flask(self, scope, receive, send):
+        """Serves a path without a native handler through pos_app's Flask app."""
+        body = await _read_body(receive)
+        environ = _wsgi_environ(scope, body)
+        run = self.db.read if scope["method"] in ("GET", "HEAD") else self.db.write
+        status, headers, response_body = await run(lambda m: _call_wsgi(pos_app.app, environ))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": response_body})
+
+    async def event_stream(self, request, send):
+        """Server-sent events: 'sale_completed' and 'product_changed', with periodic heartbeats."""
+        queue = self.events.subscribe()
+        disconnect = asyncio.ensure_future(_wait_for_disconnect(request.receive))
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")] + _CORS_HEADERS})
+        try:
+            await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+            while True:
+                next_event = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({next_event, disconnect}, timeout=SSE_HEARTBEAT_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnect in done:
+                    next_event.cancel()
+                    return
+                if next_event in done:
+                    event, data = next_event.result()
+                    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                else:
+                    next_event.cancel()
+                    message = ": heartbeat\n\n"
+                await send({"type": "http.response.body", "body": message.encode(), "more_body": True})
+        finally:
+            disconnect.cancel()
+            self.events.unsubscribe(queue)
+
+
+app = POSAsgiApp()
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The ASGI variant needs an ASGI server: pip install uvicorn")
+    uvicorn.run(app, host=os.environ.get("POS_HOST", "0.0.0.0"), port=int(os.environ.get("POS_PORT", "5000")))
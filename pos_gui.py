@@ -15,15 +15,20 @@ sys.path.append(script_dir)
 from db_manager import DBManager
 from product_manager import ProductManager
 from sales_manager import SalesManager
+from price_manager import PriceManager
+from promotion_manager import PromotionManager
+from reorder_manager import ReorderManager
+from inventory_manager import InventoryManager
+from scheduler import JobScheduler, lane_activity
+from money import cart_totals, from_cents, to_cents
 from user_manager import UserManager
+from log_config import setup_logging
+
+STOCK_ALERT_POLL_MS = 30000
 
 # --- Logging Configuration (NEW) ---
-logging.basicConfig(
-    filename='pos_application.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# Non-blocking: the Tk main loop only enqueues records, file writes happen on a listener thread.
+setup_logging('pos_application.log')
 
 # Calendar widget helper (minimal for date input)
 class DatePickerDialog(tk.Toplevel):
@@ -172,6 +177,14 @@ class POSApp:
             logging.info("POSApp: ProductManager initialized.")
             self.sales_manager = SalesManager(self.db_manager)
             logging.info("POSApp: SalesManager initialized.")
+            self.price_manager = PriceManager(self.db_manager)
+            self.promotion_manager = PromotionManager(self.db_manager)
+            self.reorder_manager = ReorderManager(self.db_manager)
+            self.inventory_manager = InventoryManager(self.db_manager)
+            # End-of-day and housekeeping jobs in the background (see scheduler.py)
+            self.job_scheduler = JobScheduler("pos_database.db", os.environ.get("POS_SCHEDULE"))
+            if os.environ.get("POS_SCHEDULER") == "1":
+                self.job_scheduler.start()
         except (ConnectionError, RuntimeError) as e:
             logging.critical(f"POSApp: FATAL: Failed to initialize database: {e}. Application will exit.")
             messagebox.showerror("Database Error", f"Failed to initialize database: {e}\nApplication will exit.")
@@ -229,10 +242,15 @@ class POSApp:
         self.cart_items = {}
         self.total_amount = 0.0
         self.subtotal_amount = 0.0
+        self.discount_amount = 0.0
+        self.applied_discounts = []
+        self.last_stock_alert_id = 0
 
         self.create_widgets()
         self.load_products_to_treeview()
         self.update_cart_display()
+        self.refresh_low_stock_banner()
+        self.poll_stock_alerts()
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         logging.info("POSApp GUI initialized and ready.")
@@ -240,6 +258,7 @@ class POSApp:
     def on_closing(self):
         """Called when the window is closed. Ensures database connections are closed."""
         if messagebox.askokcancel("Quit", "Do you want to quit the POS system?"):
+            self.job_scheduler.stop()
             self.db_manager.close() # Ensure DB connection is closed
             logging.info("Application closing. Database connection closed.")
             self.root.destroy()
@@ -274,6 +293,12 @@ class POSApp:
             logging.info("Products already exist, skipping seeding.")
 
     def create_widgets(self):
+        # Low-stock banner across the bottom; only shown while products are at or below their threshold
+        self.low_stock_banner = tk.Label(self.root, text="", bg="#fff3cd", fg="#856404", anchor="w",
+                                         font=("Arial", 10, "bold"), padx=10, pady=4)
+        self.low_stock_banner.grid(row=1, column=0, columnspan=2, sticky="ew", padx=10, pady=(0, 10))
+        self.low_stock_banner.grid_remove()
+
         # Left Panel (Product Search and List)
         left_panel = ttk.LabelFrame(self.root, text="Products & Search", padding="10")
         left_panel.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
@@ -354,6 +379,10 @@ class POSApp:
         self.subtotal_label = ttk.Label(total_frame, text="KES 0.00", font=("Arial", 12, "bold"))
         self.subtotal_label.pack(side=tk.RIGHT)
 
+        ttk.Label(total_frame, text="Discount:").pack(side=tk.LEFT)
+        self.discount_label = ttk.Label(total_frame, text="KES 0.00", font=("Arial", 12, "bold"), foreground="green")
+        self.discount_label.pack(side=tk.RIGHT, padx=(0, 10))
+
         ttk.Label(total_frame, text="Total:").pack(side=tk.LEFT)
         self.total_label = ttk.Label(total_frame, text="KES 0.00", font=("Arial", 14, "bold"), foreground="blue")
         self.total_label.pack(side=tk.RIGHT, padx=(0, 10))
@@ -380,7 +409,7 @@ class POSApp:
             formatted_price = f"{product[2]:.2f}"
             formatted_stock = f"{int(product[3])}"
             self.product_tree.insert("", "end", values=(product[0], product[1], formatted_price, formatted_stock))
-        logging.info("Products loaded into treeview.")
+        logging.debug("Products loaded into treeview.")
 
 
     def filter_products(self, event=None):
@@ -494,25 +523,68 @@ class POSApp:
             logging.info("Attempted to clear an already empty cart.")
 
 
+    def refresh_low_stock_banner(self):
+        low_stock = self.inventory_manager.get_low_stock_products()
+        alerts = self.inventory_manager.get_stock_alerts(self.last_stock_alert_id, limit=1000)
+        if alerts:
+            self.last_stock_alert_id = alerts[-1][0]
+        if not low_stock:
+            self.low_stock_banner.grid_remove()
+            return
+        names = ", ".join(f"{name} ({stock})" for _, name, stock, _, _ in low_stock[:5])
+        more = f" and {len(low_stock) - 5} more" if len(low_stock) > 5 else ""
+        self.low_stock_banner.config(text=f"Low stock: {names}{more}")
+        self.low_stock_banner.grid()
+
+    def poll_stock_alerts(self):
+        # Crossings from other lanes or the API; the banner is only rebuilt when there are new alerts
+        if self.inventory_manager.get_stock_alerts(self.last_stock_alert_id, limit=1):
+            self.refresh_low_stock_banner()
+        self.root.after(STOCK_ALERT_POLL_MS, self.poll_stock_alerts)
+
     def update_cart_display(self):
         for item in self.cart_tree.get_children():
             self.cart_tree.delete(item)
 
-        self.subtotal_amount = 0.0
-        for product_id, item_data in self.cart_items.items():
+        lines, quote, totals = self.price_cart()
+        for (product_id, _), line_total in zip(lines, totals['line_totals']):
+            item_data = self.cart_items[product_id]
+            item_data['total'] = from_cents(line_total)
             self.cart_tree.insert("", "end", values=(
                 item_data['name'],
                 f"{item_data['price']:.2f}",
                 item_data['qty'],
                 f"{item_data['total']:.2f}"
             ))
-            self.subtotal_amount += item_data['total']
 
-        self.total_amount = self.subtotal_amount # No discounts/taxes implemented yet
+        self.subtotal_amount = from_cents(totals['subtotal'])
+        self.discount_amount = from_cents(totals['discount'])
+        self.applied_discounts = quote['discounts']
+        self.total_amount = from_cents(totals['total'])
         self.subtotal_label.config(text=f"KES {self.subtotal_amount:.2f}")
+        self.discount_label.config(text=f"KES {self.discount_amount:.2f}")
         self.total_label.config(text=f"KES {self.total_amount:.2f}")
-        logging.debug(f"Cart display updated. Subtotal: {self.subtotal_amount:.2f}, Total: {self.total_amount:.2f}")
+        logging.debug("Cart display updated. Subtotal: %.2f, Discount: %.2f, Total: %.2f",
+                      self.subtotal_amount, self.discount_amount, self.total_amount)
 
+    def price_cart(self):
+        """
+        Prices the cart at the current product prices, as the API's checkout does, and stores
+        each line's unit price back into the cart.
+        :return: (lines, promotion quote, cart_totals) with money in integer cents.
+        """
+        # Money is summed in integer cents; the promotions are priced over the whole cart
+        current_prices = self.price_manager.current_prices_cents()
+        lines = [(product_id, item_data['qty']) for product_id, item_data in self.cart_items.items()]
+        prices = {}
+        for product_id, item_data in self.cart_items.items():
+            # A product deleted meanwhile keeps its cart price; checkout then rejects it
+            prices[product_id] = current_prices.get(product_id, to_cents(item_data['price']))
+            item_data['price'] = from_cents(prices[product_id])
+        quote = self.promotion_manager.quote(lines, prices)
+        totals = cart_totals([prices[product_id] for product_id, _ in lines], [qty for _, qty in lines],
+                             [quote['line_discounts_cents'].get(product_id, 0) for product_id, _ in lines])
+        return lines, quote, totals
 
     def open_add_product_dialog(self):
         add_window = tk.Toplevel(self.root)
@@ -722,7 +794,8 @@ class POSApp:
                     logging.warning(f"Payment error: Tendered {tendered_amount:.2f} less than total {total:.2f}.")
                     return
                 change = tendered_amount - total
-                self.checkout(payment_method, tendered_amount, change)
+                with lane_activity.checkout():
+                    self.checkout(payment_method, tendered_amount, change)
                 payment_window.destroy()
             except ValueError:
                 messagebox.showerror("Input Error", "Please enter a valid amount for tendered.", parent=payment_window)
@@ -747,7 +820,7 @@ class POSApp:
 
         try:
             conn.execute("BEGIN TRANSACTION") # Start transaction
-            logging.info("Starting checkout transaction.")
+            logging.debug("Starting checkout transaction.")
 
             stock_deductions_successful = True
             failed_deductions = []
@@ -785,24 +858,40 @@ class POSApp:
                 )
                 return
 
+            # Priced again inside the transaction: a price changed since the cart was shown must not
+            # go through at the old one
+            lines, quote, totals = self.price_cart()
+            if from_cents(totals['total']) != self.total_amount:
+                conn.rollback()
+                logging.warning(f"Checkout stopped: cart total changed from {self.total_amount:.2f} to "
+                                f"{from_cents(totals['total']):.2f} because prices changed.")
+                self.update_cart_display()
+                messagebox.showwarning("Prices Changed",
+                                       f"Prices changed while the payment was open. The new total is "
+                                       f"KES {self.total_amount:.2f}; please take the payment again.")
+                return
+
             # Pass the logged-in username as cashier_id
-            sale_id = self.sales_manager.record_sale(self.total_amount, payment_method, self.logged_in_user['username'])
+            sale_id = self.sales_manager.record_sale(from_cents(totals['total']), payment_method, self.logged_in_user['username'])
 
             if sale_id is None:
                 raise Exception("Failed to record main sale (database error).")
-            logging.info(f"Main sale record created with Sale ID: {sale_id}")
+            logging.debug("Main sale record created with Sale ID: %s", sale_id)
 
-            for product_id, item_data in self.cart_items.items():
+            for (product_id, qty), line_total in zip(lines, totals['line_totals']):
+                item_data = self.cart_items[product_id]
                 if not self.sales_manager.record_sale_item(
                     sale_id,
                     product_id,
                     item_data['name'],
                     item_data['price'],
-                    item_data['qty'],
-                    item_data['total']
+                    qty,
+                    from_cents(line_total)
                 ):
                     raise Exception(f"Failed to record sale item: {item_data['name']}")
-                logging.info(f"Sale item recorded: Sale ID {sale_id}, Product ID {product_id}, Qty {item_data['qty']}")
+                logging.debug("Sale item recorded: Sale ID %s, Product ID %s, Qty %s", sale_id, product_id, qty)
+            if quote['discounts'] and not self.sales_manager.record_sale_discounts(sale_id, quote['discounts']):
+                raise Exception("Failed to record sale discounts.")
 
             conn.commit() # Commit the transaction only if all steps succeed
             sale_successful = True
@@ -816,6 +905,7 @@ class POSApp:
             print(f"Transaction rolled back due to error: {e}") # Keep for immediate console feedback during dev
         finally:
             self.load_products_to_treeview() # Always reload products to reflect latest stock
+            self.refresh_low_stock_banner()
             if sale_successful and sale_id is not None:
                 self.show_receipt_window(sale_id, payment_method, amount_tendered, change_due)
                 self.cart_items = {} # Clear cart after successful checkout
@@ -869,9 +959,11 @@ Item                Qty  Price    Total
             # Format to align columns
             receipt += f"{product_name:<18.18s} {quantity:<4} {price:>6.2f} {subtotal:>8.2f}\n"
 
+        items_subtotal = sum(item[4] for item in sale_items)
         receipt += f"""
 ------------------------------------
-Subtotal:                    KES {total_amount:.2f}
+Subtotal:                    KES {items_subtotal:.2f}
+Discount:                    KES {items_subtotal - total_amount:.2f}
 Total:                       KES {total_amount:.2f}
 ------------------------------------
 Payment Method: {payment_method}
@@ -1002,6 +1094,32 @@ THANK YOU FOR YOUR PURCHASE!
         top_products_scrollbar.grid(row=2, column=2, sticky="ns") # Place scrollbar in column 2 of row 2
         self.top_products_tree.configure(yscrollcommand=top_products_scrollbar.set)
 
+        # --- Reorder Suggestions Tab ---
+        reorder_frame = ttk.Frame(notebook, padding=10)
+        notebook.add(reorder_frame, text="Reorder")
+        reorder_frame.grid_rowconfigure(1, weight=1)
+        reorder_frame.grid_columnconfigure(0, weight=1)
+
+        reorder_controls = ttk.Frame(reorder_frame)
+        reorder_controls.grid(row=0, column=0, columnspan=2, sticky="ew", pady=5)
+        ttk.Button(reorder_controls, text="Run Reorder Job", command=self.run_reorder_job).pack(side=tk.LEFT, padx=5)
+        ttk.Button(reorder_controls, text="Refresh", command=self.load_reorder_suggestions).pack(side=tk.LEFT, padx=5)
+        self.reorder_status_label = ttk.Label(reorder_controls, text="")
+        self.reorder_status_label.pack(side=tk.LEFT, padx=10)
+
+        reorder_columns = ("Product ID", "Name", "Stock", "Sold/Day", "Days of Cover", "Reorder Point", "Order Qty")
+        self.reorder_tree = ttk.Treeview(reorder_frame, columns=reorder_columns, show="headings")
+        for column in reorder_columns:
+            anchor = tk.W if column in ("Product ID", "Name") else tk.E
+            self.reorder_tree.heading(column, text=column, anchor=anchor)
+            self.reorder_tree.column(column, width=200 if column == "Name" else 90, anchor=anchor)
+        self.reorder_tree.grid(row=1, column=0, sticky="nsew", pady=5)
+
+        reorder_scrollbar = ttk.Scrollbar(reorder_frame, orient="vertical", command=self.reorder_tree.yview)
+        reorder_scrollbar.grid(row=1, column=1, sticky="ns")
+        self.reorder_tree.configure(yscrollcommand=reorder_scrollbar.set)
+        self.load_reorder_suggestions()
+
 
     def _open_date_picker(self, entry_widget):
         # Helper to open date picker and update entry widget
@@ -1040,6 +1158,13 @@ Total Sales Amount: KES {total_amount:.2f}
 Number of Sales:    {num_sales}
 ------------------------------------------------
 """
+        z_report = self.sales_manager.get_z_report(date_str)
+        if z_report:
+            report_content += f"Z-REPORT (generated {z_report['generated_at']})\n"
+            for line in z_report['lines']:
+                report_content += (f"{line['cashier_id'] or '-':<15} {line['payment_method']:<12} "
+                                   f"{line['transactions']:>6}  KES {line['total_amount']:>12.2f}\n")
+            report_content += "------------------------------------------------\n"
         self.daily_report_text.insert(tk.END, report_content)
         self.daily_report_text.config(state="disabled")
         logging.info(f"Daily sales report generated for {date_str}. Total: {total_amount:.2f}, Sales Count: {num_sales}.")
@@ -1157,6 +1282,33 @@ Number of Sales:    {num_sales}
                 self.top_products_tree.insert("", "end", values=(product_name, int(total_quantity_sold)))
             logging.info(f"Top {len(top_products)} selling products generated for {start_date_str} to {end_date_str}.")
 
+    def run_reorder_job(self):
+        due = self.reorder_manager.run_reorder_job()
+        if due is None:
+            messagebox.showerror("Reorder Job Failed", "Could not compute reorder suggestions. See the log for details.",
+                                 parent=self.reorder_tree.master)
+            return
+        logging.info(f"Reorder job run from the GUI: {due} products to reorder.")
+        self.load_reorder_suggestions()
+
+    def load_reorder_suggestions(self):
+        for item in self.reorder_tree.get_children():
+            self.reorder_tree.delete(item)
+
+        rolled_through, computed_at = self.reorder_manager.get_reorder_status()
+        suggestions = self.reorder_manager.get_reorder_suggestions()
+        if computed_at is None:
+            self.reorder_status_label.config(text="The reorder job has not run yet.")
+            return
+        self.reorder_status_label.config(text=f"Computed {computed_at} from sales through {rolled_through}: "
+                                              f"{len(suggestions)} products to reorder.")
+        for product_id, name, stock, velocity, days_of_cover, reorder_point, suggested_qty, _ in suggestions:
+            self.reorder_tree.insert("", "end", values=(
+                product_id, name, stock, f"{velocity:.2f}",
+                f"{days_of_cover:.1f}" if days_of_cover is not None else "-",
+                reorder_point, suggested_qty
+            ))
+
 
 # --- Main execution block ---
 if __name__ == "__main__":
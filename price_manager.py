@@ -0,0 +1,117 @@
+import sqlite3
+import logging
+import threading
+
+from inventory_manager import _as_of_timestamp
+from money import to_cents
+
+logger = logging.getLogger(__name__)
+
+# price_history is written by triggers on products (see DBManager.create_tables), so every
+# price a product has had is recorded no matter which code path changed it. The same
+# triggers bump price_state.version, which lets each process keep the current prices in
+# memory and reload them only after a change.
+
+
+class _PriceCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.prices = {}
+        self.cents = {}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _cache_for(db_name):
+    with _caches_lock:
+        cache = _caches.get(db_name)
+        if cache is None:
+            cache = _caches[db_name] = _PriceCache()
+        return cache
+
+
+class PriceManager:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.conn = self.db_manager.get_connection()
+        self.cursor = self.db_manager.get_cursor()
+        self._cache = _cache_for(db_manager.db_name)
+
+    def current_prices(self):
+        """
+        :return: Dict product_id -> current price. Costs one primary-key lookup when
+                 nothing changed; reloads all prices after any price or product change.
+        """
+        cache = self._refresh()
+        return cache.prices if cache else {}
+
+    def current_prices_cents(self):
+        """:return: Dict product_id -> current price in integer cents (see money.py); cached like current_prices."""
+        cache = self._refresh()
+        return cache.cents if cache else {}
+
+    def _refresh(self):
+        try:
+            self.cursor.execute("SELECT version FROM price_state WHERE id = 1")
+            version = self.cursor.fetchone()[0]
+            cache = self._cache
+            if cache.version != version:
+                with cache.lock:
+                    if cache.version != version:
+                        self.cursor.execute("SELECT product_id, price FROM products")
+                        prices = dict(self.cursor.fetchall())
+                        cache.prices, cache.cents = prices, {p: to_cents(price) for p, price in prices.items()}
+                        cache.version = version
+                        logger.debug("Reloaded %d current prices (version %s).", len(cache.prices), version)
+            return cache
+        except sqlite3.Error as e:
+            logger.error(f"Error loading current prices: {e}")
+            return None
+
+    def get_price_as_of(self, product_id, as_of):
+        """
+        :param as_of: 'YYYY-MM-DD' (end of that day) or 'YYYY-MM-DD HH:MM:SS'.
+        :return: The price in effect at that moment, or None if unknown or on error.
+        """
+        try:
+            self.cursor.execute("""
+                SELECT price FROM price_history
+                WHERE product_id = ? AND effective_from <= ?
+                ORDER BY effective_from DESC LIMIT 1
+            """, (product_id, _as_of_timestamp(as_of)))
+            row = self.cursor.fetchone()
+            return row[0] if row else None
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error getting price of {product_id} as of {as_of}: {e}")
+            return None
+
+    def get_prices_as_of(self, as_of):
+        """:return: Dict product_id -> price in effect at `as_of` for every product priced by then."""
+        try:
+            self.cursor.execute("""
+                SELECT p.product_id,
+                       (SELECT h.price FROM price_history h
+                        WHERE h.product_id = p.product_id AND h.effective_from <= ?
+                        ORDER BY h.effective_from DESC LIMIT 1)
+                FROM products p
+            """, (_as_of_timestamp(as_of),))
+            return {product_id: price for product_id, price in self.cursor.fetchall() if price is not None}
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error getting prices as of {as_of}: {e}")
+            return {}
+
+    def get_price_history(self, product_id):
+        """:return: List of (effective_from, price), newest first."""
+        try:
+            self.cursor.execute("""
+                SELECT effective_from, price FROM price_history
+                WHERE product_id = ?
+                ORDER BY effective_from DESC
+            """, (product_id,))
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error getting price history for {product_id}: {e}")
+            return []
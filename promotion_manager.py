@@ -0,0 +1,292 @@
+import json
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+
+from money import allocate, percent_of, to_cents
+
+logger = logging.getLogger(__name__)
+
+# Rule definitions (stored as JSON in promotions.rule):
+#   multi_buy    {"product_ids": [...], "buy": 3, "pay": 2}       per SKU: every 3 units cost 2
+#   percent_off  {"product_ids": [...], "percent": 10}            e.g. all products of a category
+#   time_of_day  {"product_ids": [...], "percent": 20, "from": "16:00", "to": "18:00", "days": [4, 5]}
+#   bundle       {"items": {"P001": 1, "P002": 2}, "price": 500}  the set sells for a fixed price
+# Rules are applied in priority order (highest first, then oldest) and each unit in the
+# cart is discounted by at most one rule, so promotions never stack on the same unit.
+PROMOTION_KINDS = ("multi_buy", "percent_off", "time_of_day", "bundle")
+
+
+def validate_rule(kind, rule):
+    """
+    :return: The rule as stored: a copy with time_of_day 'days' as a sorted list of ints.
+    :raises ValueError: If `rule` is not a valid definition for `kind`.
+    """
+    if kind not in PROMOTION_KINDS:
+        raise ValueError(f"Unknown promotion kind {kind!r}; expected one of {', '.join(PROMOTION_KINDS)}.")
+    if not isinstance(rule, dict):
+        raise ValueError("A promotion rule must be a JSON object.")
+    try:
+        if kind == "bundle":
+            items = rule.get("items")
+            if not isinstance(items, dict) or not items or any(int(q) < 1 for q in items.values()):
+                raise ValueError("bundle needs 'items': {product_id: quantity >= 1}.")
+            if float(rule.get("price", -1)) < 0:
+                raise ValueError("bundle needs a non-negative 'price'.")
+            return dict(rule)
+        product_ids = rule.get("product_ids")
+        if not isinstance(product_ids, list) or not product_ids:
+            raise ValueError(f"{kind} needs a non-empty 'product_ids' list.")
+        if kind == "multi_buy":
+            buy, pay = int(rule.get("buy", 0)), int(rule.get("pay", -1))
+            if buy < 2 or not 0 <= pay < buy:
+                raise ValueError("multi_buy needs 'buy' >= 2 and 0 <= 'pay' < 'buy'.")
+            return dict(rule)
+        if not 0 < float(rule.get("percent", 0)) <= 100:
+            raise ValueError(f"{kind} needs 'percent' in (0, 100].")
+        rule = dict(rule)
+        if kind == "time_of_day":
+            for key in ("from", "to"):
+                datetime.strptime(rule.get(key) or "", "%H:%M")
+            days = rule.get("days", [])
+            if not isinstance(days, list) or any(isinstance(day, bool) or int(day) not in range(7) for day in days):
+                raise ValueError("time_of_day 'days' is a list of weekday numbers, Monday = 0.")
+            rule["days"] = sorted({int(day) for day in days})
+        return rule
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid {kind} rule: {e}") from e
+
+
+def _apply_multi_buy(rule, matched, remaining, prices, line_discounts, when):
+    buy, pay = int(rule.rule["buy"]), int(rule.rule["pay"])
+    total = 0
+    for product_id in matched:
+        groups = remaining[product_id] // buy
+        if groups:
+            amount = groups * (buy - pay) * prices[product_id]
+            remaining[product_id] -= groups * buy
+            line_discounts[product_id] += amount
+            total += amount
+    return total
+
+
+def _apply_percent_off(rule, matched, remaining, prices, line_discounts, when):
+    total = 0
+    for product_id in matched:
+        units = remaining[product_id]
+        if units:
+            amount = percent_of(units * prices[product_id], rule.rule["percent"])
+            remaining[product_id] = 0
+            line_discounts[product_id] += amount
+            total += amount
+    return total
+
+
+def _apply_time_of_day(rule, matched, remaining, prices, line_discounts, when):
+    if rule.days and when.weekday() not in rule.days:
+        return 0
+    start, end, now = rule.rule["from"], rule.rule["to"], when.strftime("%H:%M")
+    # A window such as 22:00-02:00 wraps past midnight
+    in_window = start <= now < end if start <= end else (now >= start or now < end)
+    if not in_window:
+        return 0
+    return _apply_percent_off(rule, matched, remaining, prices, line_discounts, when)
+
+
+def _apply_bundle(rule, matched, remaining, prices, line_discounts, when):
+    items = rule.rule["items"]
+    sets = min(remaining.get(product_id, 0) // int(qty) for product_id, qty in items.items())
+    if not sets:
+        return 0
+    values = [prices[product_id] * int(qty) for product_id, qty in items.items()]
+    saving = sets * (sum(values) - rule.price_cents)
+    if saving <= 0:
+        return 0
+    # The saving is spread over the bundle's lines in proportion to their regular value
+    for (product_id, qty), amount in zip(items.items(), allocate(saving, values)):
+        remaining[product_id] -= sets * int(qty)
+        line_discounts[product_id] += amount
+    return saving
+
+
+_APPLY = {
+    "multi_buy": _apply_multi_buy,
+    "percent_off": _apply_percent_off,
+    "time_of_day": _apply_time_of_day,
+    "bundle": _apply_bundle,
+}
+
+
+class _Rule:
+    __slots__ = ("promotion_id", "name", "kind", "rule", "starts_at", "ends_at", "product_ids", "price_cents", "days",
+                 "apply")
+
+    def __init__(self, promotion_id, name, kind, rule, starts_at, ends_at):
+        rule = validate_rule(kind, rule)
+        self.promotion_id, self.name, self.kind, self.rule = promotion_id, name, kind, rule
+        self.starts_at, self.ends_at = starts_at, ends_at
+        self.product_ids = frozenset(rule["items"] if kind == "bundle" else rule["product_ids"])
+        self.price_cents = to_cents(rule["price"]) if kind == "bundle" else None
+        self.days = frozenset(rule.get("days", ())) if kind == "time_of_day" else None
+        self.apply = _APPLY[kind]
+
+
+class PromotionEngine:
+    """
+    Active promotions compiled for checkout: rules sorted by precedence plus an index from
+    product_id to the rules that mention it, so a cart is evaluated in one pass over its
+    lines and only the rules that can apply to it are looked at.
+    """
+
+    def __init__(self, promotions):
+        """:param promotions: Iterable of (promotion_id, name, kind, rule dict, priority, starts_at, ends_at)."""
+        self.rules = []
+        for p in sorted(promotions, key=lambda p: (-p[4], p[0])):
+            try:
+                self.rules.append(_Rule(p[0], p[1], p[2], p[3], p[5], p[6]))
+            except ValueError as e:
+                # Stored before validation was tightened; pricing must not fail because of it
+                logger.warning(f"Promotion {p[0]} skipped: {e}")
+        self.by_product = {}
+        for index, rule in enumerate(self.rules):
+            for product_id in rule.product_ids:
+                self.by_product.setdefault(product_id, []).append(index)
+
+    def evaluate(self, lines, prices, when=None):
+        """
+        :param lines: Iterable of (product_id, qty); every product_id must be in `prices`.
+        :param prices: Dict product_id -> unit price in integer cents (PriceManager.current_prices_cents()).
+        :param when: datetime the cart is priced at (default: now); decides time-limited rules.
+        :return: Dict with 'discount_total_cents', 'discounts' (promotion_id, name and
+                 amount_cents per applied promotion) and 'line_discounts_cents'
+                 (product_id -> discount on that product's lines). All amounts are int cents.
+        """
+        remaining = Counter()
+        matches = {}
+        for product_id, qty in lines:
+            if product_id not in remaining:
+                for index in self.by_product.get(product_id, ()):
+                    matches.setdefault(index, []).append(product_id)
+            remaining[product_id] += qty
+        return self.apply_matches(matches, remaining, prices, when)
+
+    def apply_matches(self, matches, remaining, prices, when=None):
+        """
+        Second half of evaluate(): applies the matched rules in precedence order.
+        :param matches: Dict rule index -> product_ids in the cart that the rule mentions.
+        :param remaining: Counter product_id -> cart quantity; consumed as rules claim units.
+        """
+        when = when or datetime.now()
+        now = when.strftime("%Y-%m-%d %H:%M:%S")
+        line_discounts = Counter()
+        discounts = []
+        for index in sorted(matches):
+            rule = self.rules[index]
+            if (rule.starts_at and now < rule.starts_at) or (rule.ends_at and now >= rule.ends_at):
+                continue
+            amount = rule.apply(rule, matches[index], remaining, prices, line_discounts, when)
+            if amount > 0:
+                discounts.append({"promotion_id": rule.promotion_id, "name": rule.name, "amount_cents": amount})
+        return {
+            "discount_total_cents": sum(d["amount_cents"] for d in discounts),
+            "discounts": discounts,
+            "line_discounts_cents": dict(line_discounts),
+        }
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+class PromotionManager:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.conn = self.db_manager.get_connection()
+        self.cursor = self.db_manager.get_cursor()
+
+    def add_promotion(self, name, kind, rule, priority=0, starts_at=None, ends_at=None):
+        """
+        :param rule: Rule definition dict for `kind` (see the top of this module).
+        :param starts_at: Optional 'YYYY-MM-DD HH:MM:SS' from which the promotion applies.
+        :param ends_at: Optional 'YYYY-MM-DD HH:MM:SS' from which it no longer applies.
+        :return: The new promotion_id, or None if the rule or period is invalid or on a database error.
+        """
+        try:
+            rule = validate_rule(kind, rule)
+            for bound in (starts_at, ends_at):
+                if bound is not None:
+                    datetime.strptime(bound, "%Y-%m-%d %H:%M:%S")
+            if starts_at and ends_at and ends_at <= starts_at:
+                raise ValueError("ends_at must be after starts_at.")
+            self.cursor.execute("""
+                INSERT INTO promotions (name, kind, rule, priority, starts_at, ends_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, kind, json.dumps(rule, sort_keys=True), priority, starts_at, ends_at))
+            self.conn.commit()
+            logger.info(f"Promotion '{name}' ({kind}) added with ID {self.cursor.lastrowid}.")
+            return self.cursor.lastrowid
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Promotion '{name}' rejected: {e}")
+            return None
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error adding promotion '{name}': {e}")
+            return None
+
+    def set_promotion_active(self, promotion_id, active):
+        try:
+            self.cursor.execute("UPDATE promotions SET active = ? WHERE promotion_id = ?", (1 if active else 0, promotion_id))
+            self.conn.commit()
+            if self.cursor.rowcount > 0:
+                logger.info(f"Promotion {promotion_id} {'activated' if active else 'deactivated'}.")
+                return True
+            logger.warning(f"Promotion {promotion_id} not found.")
+            return False
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error updating promotion {promotion_id}: {e}")
+            return False
+
+    def get_promotions(self, include_inactive=False):
+        """:return: List of (promotion_id, name, kind, rule dict, priority, starts_at, ends_at, active)."""
+        try:
+            query = "SELECT promotion_id, name, kind, rule, priority, starts_at, ends_at, active FROM promotions"
+            if not include_inactive:
+                query += " WHERE active = 1"
+            self.cursor.execute(query + " ORDER BY promotion_id")
+            return [(p[0], p[1], p[2], json.loads(p[3])) + tuple(p[4:]) for p in self.cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting promotions: {e}")
+            return []
+
+    def get_engine(self):
+        """
+        :return: The compiled PromotionEngine for the active promotions. Compiled once per
+                 catalog version (price_state.version, bumped by any price or promotion
+                 change), so this normally costs a single primary-key lookup.
+        """
+        try:
+            self.cursor.execute("SELECT version FROM price_state WHERE id = 1")
+            version = self.cursor.fetchone()[0]
+            with _engines_lock:
+                cached = _engines.get(self.db_manager.db_name)
+                if cached and cached[0] == version:
+                    return cached[1]
+                self.cursor.execute("""
+                    SELECT promotion_id, name, kind, rule, priority, starts_at, ends_at
+                    FROM promotions WHERE active = 1
+                """)
+                engine = PromotionEngine([(p[0], p[1], p[2], json.loads(p[3])) + tuple(p[4:])
+                                          for p in self.cursor.fetchall()])
+                _engines[self.db_manager.db_name] = (version, engine)
+            logger.debug("Compiled %d promotions (catalog version %s).", len(engine.rules), version)
+            return engine
+        except sqlite3.Error as e:
+            logger.error(f"Error compiling promotions: {e}")
+            return PromotionEngine(())
+
+    def quote(self, lines, prices, when=None):
+        """Prices a cart (unit prices in cents) with the active promotions. See PromotionEngine.evaluate."""
+        return self.get_engine().evaluate(lines, prices, when)
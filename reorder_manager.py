@@ -0,0 +1,255 @@
+import logging
+import os
+import sqlite3
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sales_manager import SalesManager
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+# Reorder forecasting. Units sold per product per closed day are rolled up into
+# product_daily_sales incrementally (only days not rolled up yet, and days whose sales
+# replication changed since, are read from sale_items), so the daily job touches one day
+# of sales. Suggestions are then recomputed for the whole catalog at once from that
+# rollup and products.stock:
+#
+#   daily_velocity = units sold in the last VELOCITY_WINDOW_DAYS closed days / window
+#   days_of_cover  = stock / daily_velocity
+#   reorder_point  = ceil(daily_velocity * (lead time + safety days))
+#   suggested_qty  = ceil(daily_velocity * (lead time + safety + review days)) - stock,
+#                    once stock is at or below the reorder point
+#
+# Quantities are computed in integer arithmetic (units * days // window), so a product
+# exactly at its reorder point is not tipped over by float rounding.
+VELOCITY_WINDOW_DAYS = 28
+LEAD_TIME_DAYS = int(os.environ.get("POS_REORDER_LEAD_DAYS", "7"))
+SAFETY_DAYS = int(os.environ.get("POS_REORDER_SAFETY_DAYS", "3"))
+REVIEW_DAYS = int(os.environ.get("POS_REORDER_REVIEW_DAYS", "7"))
+ROLLUP_RETENTION_DAYS = 365
+
+
+def _ceil_div(numerator, denominator):
+    return -(-numerator // denominator)
+
+
+class ReorderManager:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.conn = self.db_manager.get_connection()
+        self.cursor = self.db_manager.get_cursor()
+
+    def roll_up_daily_sales(self, today=None, full=False):
+        """
+        Adds the closed days (before `today`) that are not rolled up yet to product_daily_sales,
+        rolls up again the days whose sales replication changed since they were rolled up
+        (sales_day_changes), and drops days older than ROLLUP_RETENTION_DAYS.
+        :param today: Optional date; default the current local date.
+        :param full: Rebuild the whole retention window instead of continuing where the last run stopped.
+        :return: Number of days rolled up, or None on a database error.
+        """
+        today = today or datetime.now().date()
+        oldest = today - timedelta(days=ROLLUP_RETENTION_DAYS)
+        try:
+            self.cursor.execute("SELECT rolled_through FROM reorder_state WHERE id = 1")
+            rolled_through = self.cursor.fetchone()[0]
+            start = oldest
+            if rolled_through and not full:
+                start = max(oldest, datetime.strptime(rolled_through, "%Y-%m-%d").date() + timedelta(days=1))
+            # Read before the sales are summed: a push landing meanwhile is picked up next run
+            self.cursor.execute("SELECT day, changes FROM sales_day_changes WHERE day >= ? AND day < ?",
+                                (oldest.isoformat(), today.isoformat()))
+            day_changes = dict(self.cursor.fetchall())
+            self.cursor.execute("SELECT day, changes FROM product_daily_sales_changes")
+            rolled_changes = dict(self.cursor.fetchall())
+            changed_days = sorted(day for day, changes in day_changes.items()
+                                  if day < start.isoformat() and rolled_changes.get(day) != changes)
+            ranges = [(day, (datetime.strptime(day, "%Y-%m-%d").date() + timedelta(days=1)).isoformat())
+                      for day in changed_days]
+            if start < today:
+                ranges.append((start.isoformat(), today.isoformat()))
+            if not ranges:
+                return 0
+
+            # Archived months are read from their partitions (see archive_manager.py). ATTACH cannot
+            # run inside a transaction, so the days are summed before it starts
+            sales_manager = SalesManager(self.db_manager)
+            rolled_up = Counter()
+            for first_day, end_day in ranges:
+                bounds = (first_day + " 00:00:00", end_day + " 00:00:00")
+                for chunk in sales_manager._partition_chunks(*bounds):
+                    source = sales_manager._union_source("""
+                        SELECT s.sale_date, si.product_id, si.quantity
+                        FROM {db}.sales s
+                        JOIN {db}.sale_items si ON si.sale_id = s.sale_id
+                    """, chunk)
+                    self.cursor.execute(f"""
+                        SELECT substr(sale_date, 1, 10), product_id, SUM(quantity)
+                        FROM {source}
+                        WHERE sale_date >= ? AND sale_date < ?
+                        GROUP BY 1, 2
+                    """, bounds)
+                    for day, product_id, quantity in self.cursor.fetchall():
+                        rolled_up[(day, product_id)] += quantity
+
+            self.conn.execute("BEGIN")
+            if full:
+                self.cursor.execute("DELETE FROM product_daily_sales")
+                self.cursor.execute("DELETE FROM product_daily_sales_changes")
+            else:
+                self.cursor.execute("DELETE FROM product_daily_sales WHERE day < ?", (oldest.isoformat(),))
+                self.cursor.execute("DELETE FROM product_daily_sales_changes WHERE day < ?", (oldest.isoformat(),))
+                self.cursor.executemany("DELETE FROM product_daily_sales WHERE day >= ? AND day < ?", ranges)
+            self.cursor.executemany("INSERT INTO product_daily_sales (day, product_id, quantity) VALUES (?, ?, ?)",
+                                    [(day, product_id, quantity) for (day, product_id), quantity in rolled_up.items()])
+            self.cursor.executemany("INSERT OR REPLACE INTO product_daily_sales_changes (day, changes) VALUES (?, ?)",
+                                    [(day, changes) for day, changes in day_changes.items()
+                                     if day >= start.isoformat() or day in changed_days])
+            if start < today:
+                self.cursor.execute("UPDATE reorder_state SET rolled_through = ? WHERE id = 1",
+                                    ((today - timedelta(days=1)).isoformat(),))
+            self.conn.commit()
+            days = max((today - start).days, 0) + len(changed_days)
+            if changed_days:
+                logger.info(f"Rolled up daily product sales again for {len(changed_days)} days changed by replication.")
+            if start < today:
+                logger.info(f"Rolled up daily product sales for {start} to {today - timedelta(days=1)}.")
+            return days
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error rolling up daily product sales: {e}")
+            return None
+
+    def compute_suggestions(self, today=None, window_days=VELOCITY_WINDOW_DAYS, lead_time_days=LEAD_TIME_DAYS,
+                            safety_days=SAFETY_DAYS, review_days=REVIEW_DAYS):
+        """
+        Replaces reorder_suggestions with a fresh suggestion for every product, computed from
+        the rollup (see roll_up_daily_sales) and the current stock.
+        :return: Number of products with a suggested quantity, or None on a database error.
+        """
+        today = today or datetime.now().date()
+        window_start = today - timedelta(days=window_days)
+        computed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self.conn.execute("BEGIN")
+            # A store with less history than the window averages over the days it has
+            self.cursor.execute("SELECT MIN(day) FROM product_daily_sales")
+            first_day = self.cursor.fetchone()[0]
+            if first_day:
+                window_days = max(1, min(window_days, (today - datetime.strptime(first_day, "%Y-%m-%d").date()).days))
+            self.cursor.execute("""
+                SELECT product_id, SUM(quantity) FROM product_daily_sales
+                WHERE day >= ? AND day < ?
+                GROUP BY product_id
+            """, (window_start.isoformat(), today.isoformat()))
+            sold_by_product = dict(self.cursor.fetchall())
+            self.cursor.execute("SELECT product_id, stock FROM products")
+            products = self.cursor.fetchall()
+
+            rows = _suggestion_rows(products, sold_by_product, window_days, lead_time_days + safety_days,
+                                    lead_time_days + safety_days + review_days, computed_at)
+            self.cursor.execute("DELETE FROM reorder_suggestions")
+            self.cursor.executemany("""
+                INSERT INTO reorder_suggestions
+                    (product_id, daily_velocity, stock, days_of_cover, reorder_point, suggested_qty, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            self.cursor.execute("UPDATE reorder_state SET computed_at = ? WHERE id = 1", (computed_at,))
+            self.conn.commit()
+            due = sum(1 for row in rows if row[5] > 0)
+            logger.info(f"Computed reorder suggestions for {len(rows)} products ({due} to reorder).")
+            return due
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error computing reorder suggestions: {e}")
+            return None
+
+    def run_reorder_job(self, full=False):
+        """The daily batch job: roll up yesterday's sales, then recompute every suggestion."""
+        if self.roll_up_daily_sales(full=full) is None:
+            return None
+        return self.compute_suggestions()
+
+    def get_reorder_suggestions(self, only_due=True, limit=None):
+        """
+        :param only_due: Only products with a suggested quantity, most urgent (fewest days of cover) first.
+        :return: List of (product_id, name, stock, daily_velocity, days_of_cover, reorder_point,
+                 suggested_qty, computed_at).
+        """
+        try:
+            query = """
+                SELECT r.product_id, p.name, r.stock, r.daily_velocity, r.days_of_cover,
+                       r.reorder_point, r.suggested_qty, r.computed_at
+                FROM reorder_suggestions r
+                CROSS JOIN products p ON p.product_id = r.product_id
+            """
+            # CROSS JOIN keeps reorder_suggestions as the outer loop, so the due list is read
+            # from idx_reorder_suggestions_due instead of scanning products
+            if only_due:
+                query += " WHERE r.suggested_qty > 0 ORDER BY r.days_of_cover"
+            else:
+                query += " ORDER BY r.product_id"
+            params = ()
+            if limit:
+                query += " LIMIT ?"
+                params = (limit,)
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error getting reorder suggestions: {e}")
+            return []
+
+    def get_reorder_status(self):
+        """:return: (rolled_through, computed_at) of the last job run, or (None, None)."""
+        try:
+            self.cursor.execute("SELECT rolled_through, computed_at FROM reorder_state WHERE id = 1")
+            return self.cursor.fetchone() or (None, None)
+        except sqlite3.Error as e:
+            logger.error(f"Error getting reorder status: {e}")
+            return None, None
+
+
+def _suggestion_rows(products, sold_by_product, window_days, point_days, target_days, computed_at):
+    """Rows for reorder_suggestions; vectorized over the catalog when NumPy is installed."""
+    if not products:
+        return []
+    product_ids = [p[0] for p in products]
+    if numpy is not None:
+        stock = numpy.fromiter((p[1] for p in products), dtype=numpy.int64, count=len(products))
+        sold = numpy.fromiter((sold_by_product.get(product_id, 0) for product_id in product_ids),
+                              dtype=numpy.int64, count=len(products))
+        reorder_point = -(-(sold * point_days) // window_days)
+        target = -(-(sold * target_days) // window_days)
+        suggested = numpy.where(stock <= reorder_point, numpy.maximum(target - stock, 0), 0)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            cover = (stock * window_days) / sold
+        covers = [c if s else None for c, s in zip(cover.tolist(), sold.tolist())]
+        return list(zip(product_ids, (sold / window_days).tolist(), stock.tolist(), covers,
+                        reorder_point.tolist(), suggested.tolist(), [computed_at] * len(products)))
+
+    rows = []
+    for product_id, stock in products:
+        sold = sold_by_product.get(product_id, 0)
+        reorder_point = _ceil_div(sold * point_days, window_days)
+        suggested = max(_ceil_div(sold * target_days, window_days) - stock, 0) if stock <= reorder_point else 0
+        rows.append((product_id, sold / window_days, stock, stock * window_days / sold if sold else None,
+                     reorder_point, suggested, computed_at))
+    return rows
+
+
+if __name__ == "__main__":
+    # Run the job from cron or by hand: python reorder_manager.py [database] [--full]
+    from db_manager import DBManager
+    logging.basicConfig(level=logging.INFO)
+    args = [a for a in sys.argv[1:] if a != "--full"]
+    db_manager = DBManager(args[0] if args else "pos_database.db")
+    db_manager.create_tables()
+    due = ReorderManager(db_manager).run_reorder_job(full="--full" in sys.argv)
+    db_manager.close()
+    sys.exit(0 if due is not None else 1)
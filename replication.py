@@ -0,0 +1,446 @@
+"""
+Change-log replication between branch terminals and a head-office database.
+
+Every database logs its own changes to products, sales and sale_items in change_log
+(triggers, see db_manager.py): one row per changed product or sale, re-sequenced on
+every change, so the log is compact by construction. A terminal syncs with head office
+in two directions:
+
+  pull  products (name, price) changed at head office since the terminal's pulled_seq
+  push  sales, with their items, changed at the terminal since its pushed_seq
+
+Both go in batches of DEFAULT_BATCH rows. Row images are read when a batch is built,
+so a product changed ten times since the last sync is shipped once, as it is now. The
+checkpoints live in the terminal's sync_peers row for the head office (keyed by its
+node_id): a pulled batch is applied and its checkpoint advanced in one transaction, and a
+pushed batch is only checkpointed after head office acknowledged it, so an interrupted
+sync resumes where it stopped and never ships a batch twice into the data.
+
+Conflict rules:
+  - products belong to head office: a pulled change overwrites name and price (local
+    edits are kept until head office changes that product again); stock is never
+    replicated, a product new to the terminal starts with stock 0;
+  - a product deleted at head office is deleted at the terminal unless the terminal
+    still has stock of it (counted as a conflict and kept);
+  - sales belong to the terminal that recorded them: head office stores them under its
+    own sale_ids, mapped in replicated_sales by (origin node, origin sale_id), and a
+    re-pushed sale replaces the earlier copy, so pushes are idempotent.
+
+Applying replicated changes sets sync_state.applying, which mutes the change-log
+triggers, so nothing is echoed back. Head office must not run in sales journal mode
+(the journal hands out sale_ids itself). Replicated sales do not change head-office stock.
+
+    python replication.py terminal.db head_office.db                 # two local files
+    python replication.py pos_database.db http://hq:5000 --user admin --password ...
+"""
+import json
+import logging
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from db_manager import DBManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH = 500
+SALE_COLUMNS = ("sale_id", "total_amount", "payment_method", "sale_date", "cashier_id")
+ITEM_COLUMNS = ("product_id", "product_name", "price_at_sale", "quantity", "subtotal")
+PRODUCT_COLUMNS = ("product_id", "name", "price")
+
+
+def _placeholders(values):
+    return ", ".join("?" * len(values))
+
+
+class ReplicationManager:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.conn = self.db_manager.get_connection()
+        self.cursor = self.db_manager.get_cursor()
+
+    def get_node_id(self):
+        """:return: This database's replication identity (random, created with the schema)."""
+        self.cursor.execute("SELECT node_id FROM sync_state WHERE id = 1")
+        return self.cursor.fetchone()[0]
+
+    # --- Head-office side ---
+    def changes_since(self, since_seq, limit=DEFAULT_BATCH):
+        """
+        The next batch of product changes for a puller.
+        :param since_seq: The puller's checkpoint (last_seq of its previous batch).
+        :return: Dictionary with node, last_seq, more, columns, rows (current product images)
+                 and deleted (product_ids), or None on error.
+        """
+        try:
+            self.cursor.execute("""
+                SELECT seq, row_key FROM change_log
+                WHERE table_name = 'products' AND seq > ?
+                ORDER BY seq
+                LIMIT ?
+            """, (since_seq, limit + 1))
+            entries = self.cursor.fetchall()
+            more = len(entries) > limit
+            entries = entries[:limit]
+            keys = [row_key for _, row_key in entries]
+            rows = []
+            if keys:
+                self.cursor.execute(f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM products "
+                                    f"WHERE product_id IN ({_placeholders(keys)})", keys)
+                rows = [list(row) for row in self.cursor.fetchall()]
+            present = {row[0] for row in rows}
+            return {
+                "node": self.get_node_id(),
+                "last_seq": entries[-1][0] if entries else since_seq,
+                "more": more,
+                "columns": list(PRODUCT_COLUMNS),
+                "rows": rows,
+                "deleted": [key for key in keys if key not in present],
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Error reading product changes since {since_seq}: {e}")
+            return None
+
+    def apply_sales(self, origin, sales, deleted=()):
+        """
+        Stores a batch of sales pushed by a terminal, replacing earlier copies of the same sales.
+        :param origin: The terminal's node_id.
+        :param sales: List of [sale_id, total_amount, payment_method, sale_date, cashier_id, items],
+                      items being [product_id, product_name, price_at_sale, quantity, subtotal] lists.
+        :param deleted: Origin sale_ids deleted at the terminal.
+        :return: (inserted, replaced, deleted) counts, or None on error.
+        """
+        inserted = replaced = removed = 0
+        changed_days = {}  # day -> 1 if existing sales of it were replaced or deleted, else 0
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.cursor.execute("UPDATE sync_state SET applying = 1 WHERE id = 1")
+            for origin_sale_id, total_amount, payment_method, sale_date, cashier_id, items in sales:
+                self.cursor.execute("""
+                    SELECT r.sale_id, s.sale_date FROM replicated_sales r LEFT JOIN sales s ON s.sale_id = r.sale_id
+                    WHERE r.origin = ? AND r.origin_sale_id = ?
+                """, (origin, origin_sale_id))
+                mapped = self.cursor.fetchone()
+                if mapped:
+                    sale_id, old_sale_date = mapped
+                    if old_sale_date is None:
+                        # Its month was archived here since (see archive_manager.py); the archive keeps it
+                        logger.warning(f"Sale {origin_sale_id} from {origin} is archived as {sale_id}; change not applied.")
+                        continue
+                    self.cursor.execute("""
+                        UPDATE sales SET total_amount = ?, payment_method = ?, sale_date = ?, cashier_id = ?
+                        WHERE sale_id = ?
+                    """, (total_amount, payment_method, sale_date, cashier_id, sale_id))
+                    self.cursor.execute("DELETE FROM sale_items WHERE sale_id = ?", (sale_id,))
+                    changed_days[old_sale_date[:10]] = changed_days[sale_date[:10]] = 1
+                    replaced += 1
+                else:
+                    self.cursor.execute("""
+                        INSERT INTO sales (total_amount, payment_method, sale_date, cashier_id) VALUES (?, ?, ?, ?)
+                    """, (total_amount, payment_method, sale_date, cashier_id))
+                    sale_id = self.cursor.lastrowid
+                    self.cursor.execute("INSERT INTO replicated_sales (origin, origin_sale_id, sale_id) VALUES (?, ?, ?)",
+                                        (origin, origin_sale_id, sale_id))
+                    changed_days.setdefault(sale_date[:10], 0)
+                    inserted += 1
+                self.cursor.executemany(f"""
+                    INSERT INTO sale_items (sale_id, {', '.join(ITEM_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)
+                """, [[sale_id] + list(item) for item in items])
+            for origin_sale_id in deleted:
+                self.cursor.execute("""
+                    SELECT r.sale_id, s.sale_date FROM replicated_sales r JOIN sales s ON s.sale_id = r.sale_id
+                    WHERE r.origin = ? AND r.origin_sale_id = ?
+                """, (origin, origin_sale_id))
+                mapped = self.cursor.fetchone()
+                if mapped:
+                    sale_id, old_sale_date = mapped
+                    self.cursor.execute("DELETE FROM sale_items WHERE sale_id = ?", (sale_id,))
+                    self.cursor.execute("DELETE FROM sales WHERE sale_id = ?", (sale_id,))
+                    self.cursor.execute("DELETE FROM replicated_sales WHERE origin = ? AND origin_sale_id = ?",
+                                        (origin, origin_sale_id))
+                    changed_days[old_sale_date[:10]] = 1
+                    removed += 1
+            # Lets cached closed-period reports and the columnar store (analytics_store.py) notice
+            self.cursor.executemany("""
+                INSERT INTO sales_day_changes (day, changes, rewrites) VALUES (?, 1, ?)
+                ON CONFLICT (day) DO UPDATE SET changes = changes + 1, rewrites = rewrites + excluded.rewrites
+            """, sorted(changed_days.items()))
+            self.cursor.execute("UPDATE sync_state SET applying = 0 WHERE id = 1")
+            self.conn.commit()
+            logger.info(f"Applied sales from {origin}: {inserted} new, {replaced} replaced, {removed} deleted.")
+            return inserted, replaced, removed
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            self.conn.rollback()
+            logger.error(f"Error applying sales from {origin}: {e}")
+            return None
+
+    # --- Terminal side ---
+    def get_checkpoint(self, peer_id):
+        """:return: (pulled_seq, pushed_seq) for a peer; (0, 0) before the first sync."""
+        self.cursor.execute("SELECT pulled_seq, pushed_seq FROM sync_peers WHERE peer_id = ?", (peer_id,))
+        return self.cursor.fetchone() or (0, 0)
+
+    def apply_changes(self, peer_id, changes):
+        """
+        Applies a batch pulled from changes_since() and advances the pull checkpoint with it.
+        :return: (upserted, deleted, conflicts) counts, or None on error.
+        """
+        upserted = removed = conflicts = 0
+        try:
+            columns = changes["columns"]
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.cursor.execute("UPDATE sync_state SET applying = 1 WHERE id = 1")
+            for row in changes["rows"]:
+                product = dict(zip(columns, row))
+                self.cursor.execute("""
+                    INSERT INTO products (product_id, name, price, stock) VALUES (?, ?, ?, 0)
+                    ON CONFLICT (product_id) DO UPDATE SET name = excluded.name, price = excluded.price
+                """, (product["product_id"], product["name"], product["price"]))
+                upserted += 1
+            for product_id in changes["deleted"]:
+                self.cursor.execute("DELETE FROM products WHERE product_id = ? AND stock = 0", (product_id,))
+                if self.cursor.rowcount:
+                    removed += 1
+                else:
+                    self.cursor.execute("SELECT 1 FROM products WHERE product_id = ?", (product_id,))
+                    if self.cursor.fetchone():
+                        conflicts += 1
+                        logger.warning(f"Sync: {product_id} was deleted at head office but is still in stock here; kept.")
+            self.cursor.execute("UPDATE sync_state SET applying = 0 WHERE id = 1")
+            self._save_checkpoint(peer_id, "pulled_seq", changes["last_seq"])
+            self.conn.commit()
+            return upserted, removed, conflicts
+        except (sqlite3.Error, KeyError, TypeError) as e:
+            self.conn.rollback()
+            logger.error(f"Error applying product changes from {peer_id}: {e}")
+            return None
+
+    def sales_since(self, since_seq, limit=DEFAULT_BATCH):
+        """
+        The next batch of local sales to push.
+        :return: Dictionary with last_seq, more, sales (see apply_sales) and deleted, or None on error.
+        """
+        try:
+            self.cursor.execute("""
+                SELECT seq, CAST(row_key AS INTEGER) FROM change_log
+                WHERE table_name = 'sales' AND seq > ?
+                ORDER BY seq
+                LIMIT ?
+            """, (since_seq, limit + 1))
+            entries = self.cursor.fetchall()
+            more = len(entries) > limit
+            entries = entries[:limit]
+            sale_ids = [sale_id for _, sale_id in entries]
+            sales = {}
+            if sale_ids:
+                self.cursor.execute(f"SELECT {', '.join(SALE_COLUMNS)} FROM sales "
+                                    f"WHERE sale_id IN ({_placeholders(sale_ids)})", sale_ids)
+                sales = {row[0]: list(row) + [[]] for row in self.cursor.fetchall()}
+                self.cursor.execute(f"SELECT sale_id, {', '.join(ITEM_COLUMNS)} FROM sale_items "
+                                    f"WHERE sale_id IN ({_placeholders(sale_ids)}) ORDER BY item_id", sale_ids)
+                for row in self.cursor.fetchall():
+                    sales[row[0]][-1].append(list(row[1:]))
+            return {
+                "last_seq": entries[-1][0] if entries else since_seq,
+                "more": more,
+                "sales": [sales[sale_id] for sale_id in sale_ids if sale_id in sales],
+                "deleted": [sale_id for sale_id in sale_ids if sale_id not in sales],
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Error reading local sales since {since_seq}: {e}")
+            return None
+
+    def acknowledge_push(self, peer_id, last_seq):
+        """
+        Advances the push checkpoint after the peer stored a batch, and drops the sales
+        entries every peer has acknowledged (nothing else reads them).
+        """
+        try:
+            self._save_checkpoint(peer_id, "pushed_seq", last_seq)
+            self.cursor.execute("""
+                DELETE FROM change_log
+                WHERE table_name = 'sales' AND seq <= (SELECT MIN(pushed_seq) FROM sync_peers)
+            """)
+            self.conn.commit()
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logger.error(f"Error saving the push checkpoint for {peer_id}: {e}")
+            return False
+
+    def _save_checkpoint(self, peer_id, column, seq):
+        self.cursor.execute(f"""
+            INSERT INTO sync_peers (peer_id, {column}, last_sync_at) VALUES (?, ?, ?)
+            ON CONFLICT (peer_id) DO UPDATE SET {column} = excluded.{column}, last_sync_at = excluded.last_sync_at
+        """, (peer_id, seq, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def sync_with(self, peer, batch=DEFAULT_BATCH):
+        """
+        Pulls product changes from `peer` (head office), then pushes local sales to it,
+        batch by batch, until both directions are caught up.
+        :param peer: LocalPeer or HttpPeer.
+        :return: Dictionary of counts.
+        :raises RuntimeError: if a batch cannot be read or applied; ConnectionError/OSError from the peer.
+        """
+        node_id, peer_id = self.get_node_id(), peer.node_id()
+        if peer_id == node_id:
+            raise RuntimeError("A database cannot sync with itself.")
+        pulled_seq, pushed_seq = self.get_checkpoint(peer_id)
+        stats = {"pulled_batches": 0, "products_upserted": 0, "products_deleted": 0, "conflicts": 0,
+                 "pushed_batches": 0, "sales_inserted": 0, "sales_replaced": 0, "sales_deleted": 0}
+
+        while True:
+            changes = peer.pull(pulled_seq, batch)
+            applied = self.apply_changes(peer_id, changes)
+            if applied is None:
+                raise RuntimeError(f"Could not apply the product changes after seq {pulled_seq}.")
+            stats["pulled_batches"] += 1
+            stats["products_upserted"] += applied[0]
+            stats["products_deleted"] += applied[1]
+            stats["conflicts"] += applied[2]
+            pulled_seq = changes["last_seq"]
+            if not changes["more"]:
+                break
+
+        while True:
+            payload = self.sales_since(pushed_seq, batch)
+            if payload is None:
+                raise RuntimeError(f"Could not read local sales after seq {pushed_seq}.")
+            if not payload["sales"] and not payload["deleted"]:
+                break
+            inserted, replaced, removed = peer.push(node_id, payload["sales"], payload["deleted"])
+            if not self.acknowledge_push(peer_id, payload["last_seq"]):
+                raise RuntimeError(f"Could not save the push checkpoint {payload['last_seq']}.")
+            stats["pushed_batches"] += 1
+            stats["sales_inserted"] += inserted
+            stats["sales_replaced"] += replaced
+            stats["sales_deleted"] += removed
+            pushed_seq = payload["last_seq"]
+            if not payload["more"]:
+                break
+
+        logger.info(f"Synced with {peer_id}: {stats}")
+        return stats
+
+    def get_sync_status(self):
+        """:return: (node_id, [(peer_id, pulled_seq, pushed_seq, last_sync_at)], number of sales not pushed yet)."""
+        try:
+            node_id = self.get_node_id()
+            self.cursor.execute("SELECT peer_id, pulled_seq, pushed_seq, last_sync_at FROM sync_peers ORDER BY peer_id")
+            peers = self.cursor.fetchall()
+            self.cursor.execute("""
+                SELECT COUNT(*) FROM change_log
+                WHERE table_name = 'sales' AND seq > COALESCE((SELECT MIN(pushed_seq) FROM sync_peers), 0)
+            """)
+            return node_id, peers, self.cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting sync status: {e}")
+            return None
+
+
+class LocalPeer:
+    """Head office as a database file this process can open (a local copy, a LAN share, tests)."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _call(self, method, *args):
+        db_manager = DBManager(self.db_path)
+        try:
+            db_manager.create_tables()
+            return getattr(ReplicationManager(db_manager), method)(*args)
+        finally:
+            db_manager.close()
+
+    def node_id(self):
+        return self._call("get_node_id")
+
+    def pull(self, since_seq, limit):
+        changes = self._call("changes_since", since_seq, limit)
+        if changes is None:
+            raise RuntimeError(f"Head office {self.db_path} could not list its changes.")
+        return changes
+
+    def push(self, origin, sales, deleted):
+        counts = self._call("apply_sales", origin, sales, deleted)
+        if counts is None:
+            raise RuntimeError(f"Head office {self.db_path} could not store the sales.")
+        return counts
+
+
+class HttpPeer:
+    """Head office as a pos_app instance: GET /sync/changes and POST /sync/sales with an admin session."""
+
+    def __init__(self, base_url, username, password, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._token = None
+
+    def _request(self, method, path, body=None, authenticate=True):
+        headers = {"Content-Type": "application/json"}
+        if authenticate:
+            if self._token is None:
+                self._token = self._request("POST", "/login", {"username": self.username, "password": self.password},
+                                            authenticate=False)["token"]
+            headers["Authorization"] = f"Bearer {self._token}"
+        data = json.dumps(body, separators=(",", ":")).encode("utf-8") if body is not None else None
+        request = Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except HTTPError as e:
+            if e.code == 401 and authenticate and self._token is not None:
+                self._token = None  # expired session: log in again once
+                return self._request(method, path, body)
+            raise ConnectionError(f"{method} {path} failed with HTTP {e.code}: {e.read()[:200]!r}")
+
+    def node_id(self):
+        return self._request("GET", "/sync/node")["node"]
+
+    def pull(self, since_seq, limit):
+        return self._request("GET", f"/sync/changes?since={int(since_seq)}&limit={int(limit)}")
+
+    def push(self, origin, sales, deleted):
+        result = self._request("POST", "/sync/sales", {"origin": origin, "sales": sales, "deleted": deleted})
+        return result["inserted"], result["replaced"], result["deleted"]
+
+
+def make_peer(target, username=None, password=None):
+    """An HttpPeer for an http(s):// URL, otherwise a LocalPeer for a database path."""
+    if target.startswith(("http://", "https://")):
+        return HttpPeer(target, username, password)
+    return LocalPeer(target)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sync a terminal database with head office.")
+    parser.add_argument("database", help="The terminal's database.")
+    parser.add_argument("peer", help="Head office: a database path or a pos_app URL.")
+    parser.add_argument("--user", default=os.environ.get("POS_SYNC_USER"))
+    parser.add_argument("--password", default=os.environ.get("POS_SYNC_PASSWORD"))
+    parser.add_argument("--batch", type=int, default=DEFAULT_BATCH)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    db_manager = DBManager(args.database)
+    db_manager.create_tables()
+    try:
+        stats = ReplicationManager(db_manager).sync_with(make_peer(args.peer, args.user, args.password), args.batch)
+    except (RuntimeError, ConnectionError, OSError) as e:
+        print(f"Sync failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db_manager.close()
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
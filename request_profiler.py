@@ -0,0 +1,150 @@
+"""
+Opt-in per-request profiling for the Flask API (WSGI middleware).
+
+Only installed when POS_PROFILING=1, so there is no overhead at all otherwise. Once
+installed, a request is profiled when either
+  - it carries 'X-Profile: cprofile' or 'X-Profile: sample' and an admin session token, or
+  - it is picked by random sampling (POS_PROFILE_SAMPLE_RATE, e.g. 0.01; default 0).
+
+'cprofile' writes a pstats dump (<name>.prof, open with `python -m pstats` or snakeviz).
+'sample' runs a 1 ms stack sampler and writes collapsed stacks (<name>.folded), the
+input format of flamegraph.pl / speedscope. Files go to POS_PROFILE_DIR (default
+'profiles'); only the newest POS_PROFILE_MAX_FILES (default 50) are kept.
+"""
+import cProfile
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+DEFAULT_PROFILE_DIR = "profiles"
+DEFAULT_MAX_FILES = 50
+SAMPLE_INTERVAL_SECONDS = 0.001
+PROFILE_MODES = ("cprofile", "sample")
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfilerMiddleware:
+    def __init__(self, wsgi_app, token_verifier, profile_dir=None, max_files=None, sample_rate=None):
+        self.wsgi_app = wsgi_app
+        self.token_verifier = token_verifier
+        self.profile_dir = profile_dir or os.environ.get("POS_PROFILE_DIR", DEFAULT_PROFILE_DIR)
+        self.max_files = max_files or int(os.environ.get("POS_PROFILE_MAX_FILES", DEFAULT_MAX_FILES))
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.environ.get("POS_PROFILE_SAMPLE_RATE", "0"))
+        self._prune_lock = threading.Lock()
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+    def _requested_mode(self, environ):
+        mode = environ.get("HTTP_X_PROFILE", "").strip().lower()
+        if mode in PROFILE_MODES:
+            auth_header = environ.get("HTTP_AUTHORIZATION", "")
+            token = auth_header[len("Bearer "):].strip() if auth_header.startswith("Bearer ") else None
+            user_info = self.token_verifier(token)
+            if user_info and user_info["role"] == "admin":
+                return mode
+            logging.warning("Profiling header ignored: admin session token required.")
+            return None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    def __call__(self, environ, start_response):
+        mode = self._requested_mode(environ)
+        if mode is None:
+            return self.wsgi_app(environ, start_response)
+
+        name = "{}_{}_{}_{}".format(
+            datetime.now().strftime("%Y%m%d-%H%M%S-%f"),
+            environ.get("REQUEST_METHOD", ""),
+            environ.get("PATH_INFO", "").strip("/").replace("/", "_") or "root",
+            os.getpid(),
+        )
+        filename = name + (".prof" if mode == "cprofile" else ".folded")
+
+        def _start_response(status, headers, exc_info=None):
+            return start_response(status, headers + [("X-Profile-File", filename)], exc_info)
+
+        start = time.perf_counter()
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                body = self._run_app(environ, _start_response)
+            finally:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.profile_dir, filename))
+        else:
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                body = self._run_app(environ, _start_response)
+            finally:
+                sampler.stop()
+                with open(os.path.join(self.profile_dir, filename), "w", encoding="utf-8") as f:
+                    f.write(sampler.collapsed())
+        logging.info(f"Profiled {environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} "
+                     f"({mode}, {(time.perf_counter() - start) * 1000:.1f} ms) -> {filename}")
+        self._prune()
+        return body
+
+    def _run_app(self, environ, start_response):
+        # Consume the body inside the profiled region so streamed responses are included
+        result = self.wsgi_app(environ, start_response)
+        try:
+            return list(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    def _prune(self):
+        """Keeps only the newest max_files profiles."""
+        with self._prune_lock:
+            try:
+                entries = [e for e in os.scandir(self.profile_dir)
+                           if e.is_file() and e.name.endswith((".prof", ".folded"))]
+            except OSError:
+                return
+            if len(entries) <= self.max_files:
+                return
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:len(entries) - self.max_files]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
@@ -0,0 +1,541 @@
+"""
+Optional append-only sales journal (enable with POS_SALES_JOURNAL=<directory>).
+
+In journal mode a checkout does not touch the sales, sale_items and products B-trees.
+It appends one NDJSON record (CRC-prefixed) to the current journal segment and is
+acknowledged once that record is fsynced. Concurrent checkouts share fsyncs: whoever
+syncs first makes every record written so far durable. A background applier folds
+durable records into SQLite in batches, one transaction per batch, and stores the last
+applied sequence number in sales_journal_state in that same transaction. On startup
+the journal is replayed from that point, so a crash never loses or double-applies a sale.
+
+Constraints of journal mode:
+  - one process owns the journal (enforced with a lock file); use serve.py --mode threads
+    or the ASGI app, not prefork, and do not record sales from the desktop GUI against
+    the same database at the same time, since the journal hands out sale_ids itself;
+  - sales become visible to reports after the applier runs (POS_JOURNAL_APPLY_MS, default 50 ms);
+  - stock is checked against products.stock minus quantities still waiting in the
+    journal, so sales are never accepted beyond the available stock.
+
+A batch that keeps failing to apply is retried MAX_APPLY_ATTEMPTS times, then applied one
+record at a time: records that still fail (other than on a locked or unavailable database)
+are moved to dead-letter.ndjson in the journal directory, logged at CRITICAL and counted in
+status(), so one bad record cannot hold back the sales journaled after it.
+
+A failed write or fsync fails the journal closed: the record may or may not have reached
+the disk, so every later append raises JournalFailedError until the process is restarted
+and the replay has settled which records exist. Records that were durable keep applying.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from collections import Counter, deque
+from datetime import datetime
+
+from inventory_manager import INSERT_MOVEMENT_SQL, movement_timestamp
+from money import from_cents
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_APPLY_INTERVAL = float(os.environ.get("POS_JOURNAL_APPLY_MS", "50")) / 1000
+DEFAULT_APPLY_BATCH = 1000
+SEGMENT_PREFIX = "sales-"
+SEGMENT_SUFFIX = ".ndjson"
+LOCK_FILE = "journal.lock"
+DEAD_LETTER_FILE = "dead-letter.ndjson"
+MAX_APPLY_ATTEMPTS = 5
+# What applying a record can raise: SQLite errors, or a record of the wrong shape
+_APPLY_ERRORS = (sqlite3.Error, KeyError, TypeError, ValueError)
+
+
+class InsufficientStockError(Exception):
+    def __init__(self, product_id, available):
+        super().__init__(f"Insufficient stock for {product_id} (available: {available})")
+        self.product_id = product_id
+        self.available = available
+
+
+class JournalFailedError(OSError):
+    """Raised by append() once a journal write or fsync has failed."""
+
+
+def encode_record(record):
+    body = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(body), body)
+
+
+def decode_line(line):
+    """:return: the record, or None if the line is torn or fails its checksum."""
+    if not line.endswith(b"\n") or len(line) < 10:
+        return None
+    checksum, body = line[:8], line[9:-1]
+    try:
+        if int(checksum, 16) != zlib.crc32(body):
+            return None
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def read_segment(path):
+    """:return: (records, number of bytes that hold valid records)"""
+    records, good_bytes = [], 0
+    with open(path, "rb") as f:
+        for line in f:
+            record = decode_line(line)
+            if record is None:
+                break
+            records.append(record)
+            good_bytes += len(line)
+    return records, good_bytes
+
+
+def _segment_name(first_seq):
+    return f"{SEGMENT_PREFIX}{first_seq:016d}{SEGMENT_SUFFIX}"
+
+
+def _lock_exclusive(fd):
+    try:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except ImportError:
+        import msvcrt
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+
+def _fsync_dir(path):
+    if os.name == "nt":
+        return  # directories cannot be opened for fsync on Windows
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SalesJournal:
+    def __init__(self, journal_dir, db_path, name="sales", segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 apply_interval=DEFAULT_APPLY_INTERVAL, apply_batch=DEFAULT_APPLY_BATCH):
+        self.journal_dir = journal_dir
+        self.db_path = db_path
+        self.name = name
+        self.segment_bytes = segment_bytes
+        self.apply_interval = apply_interval
+        self.apply_batch = apply_batch
+
+        self._lock = threading.Lock()        # sequence/sale_id allocation, writes, pending stock
+        self._sync_lock = threading.Lock()   # one fsync at a time; waiters ride along
+        self._applied = threading.Condition(threading.Lock())
+        self._wake_applier = threading.Event()
+        self._stop = threading.Event()
+        self._unapplied = deque()
+        self._pending = Counter()            # product_id -> quantity journaled but not yet applied
+        self._segments = []                  # [(first_seq, path)], oldest first
+        self._retired_fds = []
+        self._fd = None
+        self._lock_fd = None
+        self._applier = None
+        self._next_seq = 1
+        self._next_sale_id = 1
+        self._written_seq = 0
+        self._durable_seq = 0
+        self._applied_seq = 0
+        self._current_size = 0
+        self._apply_failures = 0             # consecutive failed attempts at the oldest batch
+        self._last_apply_error = None
+        self._dead_letters = 0
+        self._failed = None                  # the OSError that failed the journal closed
+
+    # --- Startup / shutdown ---
+    def open(self):
+        """Takes the journal lock, replays unapplied records into SQLite and starts the applier."""
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(self.journal_dir, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            _lock_exclusive(self._lock_fd)
+        except OSError:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            raise RuntimeError(f"Sales journal {self.journal_dir} is in use by another process.")
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self._applied_seq = self._read_applied_seq(conn)
+            records = self._load_segments()
+            unapplied = [r for r in records if r["seq"] > self._applied_seq]
+            for start in range(0, len(unapplied), self.apply_batch):
+                chunk = unapplied[start:start + self.apply_batch]
+                try:
+                    self._apply(conn, chunk)
+                except _APPLY_ERRORS as e:
+                    logger.error(f"Sales journal: replaying seq {chunk[0]['seq']}..{chunk[-1]['seq']} failed: {e}")
+                    if self._apply_one_by_one(conn, chunk) < len(chunk):
+                        raise RuntimeError(f"Sales journal replay failed: {self._last_apply_error}")
+            if unapplied:
+                self._applied_seq = unapplied[-1]["seq"]
+                logger.warning(f"Sales journal: replayed {len(unapplied)} unapplied sales "
+                               f"(seq {unapplied[0]['seq']}..{unapplied[-1]['seq']}).")
+            last_seq = records[-1]["seq"] if records else 0
+            self._next_seq = max(last_seq, self._applied_seq) + 1
+            self._written_seq = self._durable_seq = self._next_seq - 1
+            self._dead_letters = self._count_dead_letters()
+            journal_sale_id = max((r["sale_id"] for r in records), default=0)
+            self._next_sale_id = max(self._max_used_sale_id(conn), journal_sale_id) + 1
+        finally:
+            conn.close()
+
+        self._open_current_segment()
+        self._prune_segments()
+        self._applier = threading.Thread(target=self._run_applier, name="sales-journal-applier", daemon=True)
+        self._applier.start()
+        logger.info(f"Sales journal open at {self.journal_dir} (next seq {self._next_seq}, "
+                    f"next sale_id {self._next_sale_id}).")
+        return self
+
+    def close(self):
+        """Stops the applier after it has applied everything durable, then releases the journal."""
+        if self._applier is None:
+            return
+        if self._failed is None:
+            try:
+                self._sync(self._written_seq)
+            except OSError:
+                pass  # logged by _fail; what is durable still gets applied below
+        self._stop.set()
+        self._wake_applier.set()
+        self._applier.join()
+        self._applier = None
+        for fd in self._retired_fds + [self._fd]:
+            os.close(fd)
+        self._retired_fds, self._fd = [], None
+        os.close(self._lock_fd)
+        self._lock_fd = None
+        logger.info(f"Sales journal closed (applied through seq {self._applied_seq}).")
+
+    def _read_applied_seq(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sales_journal_state (
+                journal TEXT PRIMARY KEY,
+                applied_seq INTEGER NOT NULL
+            )
+        """)
+        conn.commit()
+        row = conn.execute("SELECT applied_seq FROM sales_journal_state WHERE journal = ?", (self.name,)).fetchone()
+        return row[0] if row else 0
+
+    def _max_used_sale_id(self, conn):
+        """
+        Highest sale_id ever handed out: archiving moves sales out of the live table
+        (see archive_manager.py), so its MAX alone would hand their ids out again.
+        """
+        used = [conn.execute("SELECT COALESCE(MAX(sale_id), 0) FROM sales").fetchone()[0]]
+        for sql in ("SELECT seq FROM sqlite_sequence WHERE name = 'sales'",
+                    "SELECT MAX(last_sale_id) FROM sales_partitions"):
+            try:
+                row = conn.execute(sql).fetchone()
+            except sqlite3.OperationalError:
+                continue  # table not created yet
+            if row and row[0] is not None:
+                used.append(row[0])
+        return max(used)
+
+    def _load_segments(self):
+        names = sorted(n for n in os.listdir(self.journal_dir)
+                       if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX))
+        records = []
+        for i, segment_name in enumerate(names):
+            path = os.path.join(self.journal_dir, segment_name)
+            first_seq = int(segment_name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            segment_records, good_bytes = read_segment(path)
+            size = os.path.getsize(path)
+            if good_bytes < size:
+                if i != len(names) - 1:
+                    raise RuntimeError(f"Sales journal segment {path} is corrupt at byte {good_bytes}.")
+                # Torn write from a crash: the record was never acknowledged, drop it
+                logger.warning(f"Sales journal: truncating torn tail of {segment_name} ({size - good_bytes} bytes).")
+                with open(path, "r+b") as f:
+                    f.truncate(good_bytes)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._segments.append((first_seq, path))
+            records.extend(segment_records)
+        return records
+
+    def _open_current_segment(self):
+        if self._segments and os.path.getsize(self._segments[-1][1]) < self.segment_bytes:
+            path = self._segments[-1][1]
+        else:
+            path = os.path.join(self.journal_dir, _segment_name(self._next_seq))
+            self._segments.append((self._next_seq, path))
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+        self._current_size = os.path.getsize(path)
+        _fsync_dir(self.journal_dir)
+
+    # --- Checkout path ---
+    def append(self, total_amount, payment_method, cashier_id, items, stock_lookup, discounts=()):
+        """
+        Journals one sale and returns its sale_id once the record is durable.
+        :param items: list of dicts with product_id, name, price, qty, subtotal.
+        :param stock_lookup: callable(product_id) -> stock currently in the products table.
+        :param discounts: list of dicts with promotion_id, name, amount_cents.
+        :raises InsufficientStockError: if an item exceeds the stock not already promised to journaled sales.
+        """
+        quantities = Counter()
+        for item in items:
+            quantities[item["product_id"]] += item["qty"]
+
+        with self._lock:
+            if self._failed is not None:
+                raise JournalFailedError(f"Sales journal failed closed: {self._failed}")
+            for product_id, qty in quantities.items():
+                available = stock_lookup(product_id) - self._pending[product_id]
+                if qty > available:
+                    raise InsufficientStockError(product_id, max(available, 0))
+            seq, sale_id = self._next_seq, self._next_sale_id
+            record = {
+                "seq": seq,
+                "sale_id": sale_id,
+                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "total": total_amount,
+                "payment": payment_method,
+                "cashier": cashier_id,
+                "items": [[i["product_id"], i["name"], i["price"], i["qty"], i["subtotal"]] for i in items],
+            }
+            if discounts:
+                record["discounts"] = [[d["promotion_id"], d["name"], from_cents(d["amount_cents"])] for d in discounts]
+            data = encode_record(record)
+            try:
+                if self._current_size and self._current_size + len(data) > self.segment_bytes:
+                    self._rotate(seq)
+                os.write(self._fd, data)
+            except OSError as e:
+                self._fail(e)
+                raise
+            self._current_size += len(data)
+            self._next_seq += 1
+            self._next_sale_id += 1
+            self._written_seq = seq
+            self._pending.update(quantities)
+            self._unapplied.append(record)
+
+        self._sync(seq)
+        if len(self._unapplied) >= self.apply_batch:
+            self._wake_applier.set()
+        logger.debug("Journaled sale %s (seq %s).", sale_id, seq)
+        return sale_id
+
+    def _rotate(self, first_seq):
+        """Starts a new segment. Called with self._lock held; the old fd is fsynced and closed by _sync."""
+        path = os.path.join(self.journal_dir, _segment_name(first_seq))
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+        self._retired_fds.append(self._fd)
+        self._fd = fd
+        self._segments.append((first_seq, path))
+        self._current_size = 0
+        _fsync_dir(self.journal_dir)
+
+    def _sync(self, seq):
+        """Group commit: blocks until every record up to `seq` is on disk."""
+        with self._sync_lock:
+            if self._durable_seq >= seq:
+                return
+            with self._lock:
+                if self._failed is not None:
+                    raise JournalFailedError(f"Sales journal failed closed: {self._failed}")
+                target, fd, retired = self._written_seq, self._fd, list(self._retired_fds)
+            try:
+                for old_fd in retired:
+                    os.fsync(old_fd)
+                    # Only forget a retired fd once it is synced; close() closes whatever is left
+                    with self._lock:
+                        self._retired_fds.remove(old_fd)
+                    os.close(old_fd)
+                os.fsync(fd)
+            except OSError as e:
+                with self._lock:
+                    self._fail(e)
+                raise
+            self._durable_seq = target
+
+    def _fail(self, error):
+        """Fails the journal closed. Called with self._lock held."""
+        if self._failed is None:
+            self._failed = error
+            logger.critical(f"Sales journal failed closed after seq {self._durable_seq} was durable "
+                            f"(written through {self._written_seq}): {error}. Restart to replay.")
+
+    # --- Applier ---
+    def _run_applier(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            while True:
+                self._wake_applier.wait(self.apply_interval)
+                self._wake_applier.clear()
+                stopping = self._stop.is_set()
+                while self._apply_pending(conn):
+                    pass
+                if stopping:
+                    break
+        finally:
+            conn.close()
+
+    def _apply_pending(self, conn):
+        """Applies one batch of durable records. :return: True if a full batch was applied."""
+        with self._lock:
+            durable = self._durable_seq
+            batch = []
+            for record in self._unapplied:
+                if record["seq"] > durable or len(batch) >= self.apply_batch:
+                    break
+                batch.append(record)
+        if not batch:
+            return False
+        try:
+            self._apply(conn, batch)
+            done = len(batch)
+            self._apply_failures = 0
+        except _APPLY_ERRORS as e:
+            # Records stay queued (and on disk); the next round retries them
+            self._apply_failures += 1
+            self._last_apply_error = str(e)
+            logger.error(f"Sales journal: applying seq {batch[0]['seq']}..{batch[-1]['seq']} failed "
+                         f"(attempt {self._apply_failures}): {e}")
+            if self._apply_failures < MAX_APPLY_ATTEMPTS:
+                return False
+            done = self._apply_one_by_one(conn, batch)
+            if not done:
+                return False
+            self._apply_failures = 0
+        batch = batch[:done]
+
+        applied = Counter()
+        for record in batch:
+            for product_id, _, _, qty, _ in record["items"]:
+                applied[product_id] += qty
+        with self._lock:
+            for _ in batch:
+                self._unapplied.popleft()
+            self._pending.subtract(applied)
+            self._pending += Counter()  # drop zero entries
+        with self._applied:
+            self._applied_seq = batch[-1]["seq"]
+        self._prune_segments()
+        with self._applied:
+            self._applied.notify_all()
+        return len(batch) >= self.apply_batch
+
+    def _apply_one_by_one(self, conn, records):
+        """
+        Applies records one at a time, moving those that fail to the dead-letter file. Stops at
+        an OperationalError (locked, full or unreadable database), which says nothing about the record.
+        :return: Number of leading records applied or dead-lettered.
+        """
+        for done, record in enumerate(records):
+            try:
+                self._apply(conn, [record])
+            except sqlite3.OperationalError as e:
+                self._last_apply_error = str(e)
+                logger.error(f"Sales journal: applying seq {record['seq']} failed: {e}")
+                return done
+            except _APPLY_ERRORS as e:
+                self._last_apply_error = str(e)
+                try:
+                    self._dead_letter(conn, record, e)
+                except (sqlite3.Error, OSError) as dead_letter_error:
+                    logger.error(f"Sales journal: could not dead-letter seq {record['seq']}: {dead_letter_error}")
+                    return done
+        return len(records)
+
+    def _dead_letter(self, conn, record, error):
+        """Appends a record that cannot be applied to the dead-letter file and skips past it."""
+        path = os.path.join(self.journal_dir, DEAD_LETTER_FILE)
+        with open(path, "ab") as f:
+            f.write(encode_record(dict(record, error=str(error))))
+            f.flush()
+            os.fsync(f.fileno())
+        conn.execute("INSERT OR REPLACE INTO sales_journal_state (journal, applied_seq) VALUES (?, ?)",
+                     (self.name, record["seq"]))
+        conn.commit()
+        self._dead_letters += 1
+        logger.critical(f"Sales journal: sale {record.get('sale_id')} (seq {record['seq']}) cannot be applied "
+                        f"and was moved to {path}: {error}")
+
+    def _count_dead_letters(self):
+        try:
+            with open(os.path.join(self.journal_dir, DEAD_LETTER_FILE), "rb") as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    def _apply(self, conn, records):
+        """Writes records to the sales tables and advances applied_seq, all in one transaction."""
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO sales (sale_id, total_amount, payment_method, sale_date, cashier_id) VALUES (?, ?, ?, ?, ?)",
+                [(r["sale_id"], r["total"], r["payment"], r["date"], r["cashier"]) for r in records])
+            conn.executemany(
+                "INSERT INTO sale_items (sale_id, product_id, product_name, price_at_sale, quantity, subtotal) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(r["sale_id"], *item) for r in records for item in r["items"]])
+            conn.executemany(
+                "INSERT INTO sale_discounts (sale_id, promotion_id, promotion_name, amount) VALUES (?, ?, ?, ?)",
+                [(r["sale_id"], *discount) for r in records for discount in r.get("discounts", ())])
+            stock = Counter()
+            for r in records:
+                for product_id, _, _, qty, _ in r["items"]:
+                    stock[product_id] += qty
+            conn.executemany("UPDATE products SET stock = stock - ? WHERE product_id = ?",
+                             [(qty, product_id) for product_id, qty in stock.items()])
+            # Stamped at apply time, not sale time, so a stock snapshot taken meanwhile cannot miss them
+            applied_at = movement_timestamp()
+            conn.executemany(INSERT_MOVEMENT_SQL,
+                             [(product_id, applied_at, -qty, "sale", str(r["sale_id"]))
+                              for r in records for product_id, _, _, qty, _ in r["items"]])
+            conn.execute("INSERT OR REPLACE INTO sales_journal_state (journal, applied_seq) VALUES (?, ?)",
+                         (self.name, records[-1]["seq"]))
+            conn.commit()
+        except _APPLY_ERRORS:
+            conn.rollback()
+            raise
+        logger.debug("Sales journal: applied %d sales through seq %s.", len(records), records[-1]["seq"])
+
+    def _prune_segments(self):
+        """Deletes segments whose records are all applied (never the current one)."""
+        with self._lock:
+            removable = []
+            while len(self._segments) > 1 and self._segments[1][0] - 1 <= self._applied_seq:
+                removable.append(self._segments.pop(0)[1])
+        for path in removable:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Sales journal: could not remove applied segment {path}: {e}")
+
+    def wait_applied(self, timeout=None):
+        """Blocks until every sale journaled so far is in SQLite. :return: False on timeout."""
+        target = self._written_seq if self._failed is None else self._durable_seq
+        if self._failed is None:
+            self._sync(target)
+        self._wake_applier.set()
+        with self._applied:
+            return self._applied.wait_for(lambda: self._applied_seq >= target, timeout)
+
+    def status(self):
+        with self._lock:
+            return {
+                "next_sale_id": self._next_sale_id,
+                "written_seq": self._written_seq,
+                "durable_seq": self._durable_seq,
+                "applied_seq": self._applied_seq,
+                "unapplied": len(self._unapplied),
+                "segments": len(self._segments),
+                "apply_failures": self._apply_failures,
+                "last_apply_error": self._last_apply_error,
+                "dead_letters": self._dead_letters,
+                "failed": str(self._failed) if self._failed is not None else None,
+            }
@@ -1,12 +1,44 @@
 import sqlite3
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import logging
+import os
+import threading
+
+from money import from_cents, sql_cents
+
+logger = logging.getLogger(__name__)
+
+TIMESERIES_BUCKETS = {"hour": 13, "day": 10}  # bucket -> length of the sale_date prefix it groups on
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Time-bucketed reports for periods that ended before today only change when replication
+# pushes late sales for their days (see replication.py), so they are kept per process:
+# (db_name, report, arguments) -> (changes to the period's days, result), least recently used evicted
+_closed_period_reports = OrderedDict()
+_closed_period_lock = threading.Lock()
+CLOSED_PERIOD_CACHE_SIZE = 256
+
+# Closed months archived to their own database files (see archive_manager.py) are ATTACHed
+# as sales_YYYY_MM by the report methods; SQLite's default SQLITE_MAX_ATTACHED caps how
+# many one connection can have at once
+MAX_ATTACHED_PARTITIONS = 10
+SALES_COLUMNS = "sale_id, total_amount, payment_method, sale_date, cashier_id"
+
+
+def _sales_arm(columns=SALES_COLUMNS):
+    return f"SELECT {columns} FROM {{db}}.sales"
 
 class SalesManager:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, journal=None):
+        """
+        :param journal: Optional sales_journal.SalesJournal. When set, checkouts go through
+                        journal_sale() instead of record_sale/record_sale_item.
+        """
         self.db_manager = db_manager
         self.conn = self.db_manager.get_connection()
         self.cursor = self.db_manager.get_cursor()
+        self.journal = journal
 
     def record_sale(self, total_amount, payment_method, cashier_id):
         try:
@@ -16,10 +48,10 @@ class SalesManager:
                 VALUES (?, ?, ?, ?)
             """, (total_amount, payment_method, sale_date, cashier_id))
             # No commit here; it's part of the larger transaction in pos_gui
-            logging.info(f"Sale recorded (ID: {self.cursor.lastrowid}, Total: {total_amount}, Method: {payment_method}). Awaiting commit.")
+            logger.debug("Sale recorded (ID: %s, Total: %s, Method: %s). Awaiting commit.", self.cursor.lastrowid, total_amount, payment_method)
             return self.cursor.lastrowid
         except sqlite3.Error as e:
-            logging.error(f"Error recording sale (total: {total_amount}, method: {payment_method}): {e}")
+            logger.error(f"Error recording sale (total: {total_amount}, method: {payment_method}): {e}")
             return None
 
     def record_sale_item(self, sale_id, product_id, product_name, price_at_sale, quantity, subtotal):
@@ -29,12 +61,94 @@ class SalesManager:
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (sale_id, product_id, product_name, price_at_sale, quantity, subtotal))
             # No commit here; it's part of the larger transaction in pos_gui
-            logging.info(f"Sale item recorded for Sale ID {sale_id}: Product {product_name}, Quantity {quantity}.")
+            logger.debug("Sale item recorded for Sale ID %s: Product %s, Quantity %s.", sale_id, product_name, quantity)
             return True
         except sqlite3.Error as e:
-            logging.error(f"Error recording sale item for sale_id {sale_id}, product {product_id}: {e}")
+            logger.error(f"Error recording sale item for sale_id {sale_id}, product {product_id}: {e}")
             return False
 
+    def record_sale_discounts(self, sale_id, discounts):
+        """
+        :param discounts: The 'discounts' list of a promotion quote (promotion_id, name, amount_cents).
+        No commit: part of the checkout transaction, like record_sale_item.
+        """
+        try:
+            self.cursor.executemany("""
+                INSERT INTO sale_discounts (sale_id, promotion_id, promotion_name, amount)
+                VALUES (?, ?, ?, ?)
+            """, [(sale_id, d["promotion_id"], d["name"], from_cents(d["amount_cents"])) for d in discounts])
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error recording discounts for sale_id {sale_id}: {e}")
+            return False
+
+    def journal_sale(self, total_amount, payment_method, cashier_id, items, stock_lookup, discounts=()):
+        """
+        Journal-mode checkout: appends the sale to the sales journal instead of writing the
+        sales, sale_items and products tables; the journal's applier does that in the background.
+        :param items: List of dicts with product_id, name, price, qty and subtotal.
+        :param stock_lookup: Callable returning a product's stock in the products table.
+        :param discounts: Promotions applied to the sale, as for record_sale_discounts.
+        :return: The new sale_id once the record is durable, or None on an I/O error.
+        :raises sales_journal.InsufficientStockError: If an item exceeds the available stock.
+        """
+        try:
+            return self.journal.append(total_amount, payment_method, cashier_id, items, stock_lookup, discounts)
+        except OSError as e:
+            logger.error(f"Error journaling sale (total: {total_amount}, method: {payment_method}): {e}")
+            return None
+
+    def _partition_chunks(self, start_ts=None, end_ts=None):
+        """
+        The databases holding the sales of a period: main, then the archived months that overlap
+        [start_ts, end_ts] newest first, in chunks that can be attached together.
+        :return: List of chunks, each a list of (schema, path); path is None for main.
+        """
+        conditions, params = [], []
+        if start_ts:
+            conditions.append("month >= substr(?, 1, 7)")
+            params.append(start_ts)
+        if end_ts:
+            conditions.append("month || '-01 00:00:00' <= ?")
+            params.append(end_ts)
+        query = "SELECT month, path FROM sales_partitions"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        self.cursor.execute(query + " ORDER BY month DESC", params)
+        base_dir = os.path.dirname(os.path.abspath(self.db_manager.db_name))
+        schemas = [("main", None)] + [("sales_" + month.replace("-", "_"), os.path.join(base_dir, path))
+                                      for month, path in self.cursor.fetchall()]
+        chunks = [schemas[:MAX_ATTACHED_PARTITIONS + 1]]
+        for i in range(MAX_ATTACHED_PARTITIONS + 1, len(schemas), MAX_ATTACHED_PARTITIONS):
+            chunks.append(schemas[i:i + MAX_ATTACHED_PARTITIONS])
+        return chunks
+
+    def _union_source(self, arm, chunk):
+        """
+        :param arm: SELECT over one database's tables, with {db} in place of the schema name.
+        :return: '(arm UNION ALL arm ...)' over the chunk, attached, for use as a FROM source. SQLite
+                 pushes the outer WHERE down into every arm, so each one uses its own date index.
+        """
+        self._attach_chunk(chunk)
+        return "(" + " UNION ALL ".join(arm.format(db=schema) for schema, _ in chunk) + ")"
+
+    def _attach_chunk(self, chunk):
+        """Attaches the partitions of a chunk, detaching others if the connection is out of slots."""
+        needed = {schema for schema, path in chunk if path}
+        if not needed:
+            return
+        attached = [schema for schema in self.db_manager.attached_schemas() if schema.startswith("sales_")]
+        spare = MAX_ATTACHED_PARTITIONS - len(set(attached) | needed)
+        for schema in attached:
+            if spare >= 0:
+                break
+            if schema not in needed:
+                self.db_manager.detach(schema)
+                spare += 1
+        for schema, path in chunk:
+            if path:
+                self.db_manager.attach(schema, path)
+
     def get_sale_details(self, sale_id):
         """
         Retrieves comprehensive details for a specific sale, including all its items.
@@ -42,21 +156,38 @@ class SalesManager:
         :return: A dictionary containing sale details and a list of sale items, or None if not found.
         """
         try:
+            schema = "main"
             self.cursor.execute("SELECT sale_id, total_amount, payment_method, sale_date, cashier_id FROM sales WHERE sale_id = ?", (sale_id,))
             sale_header = self.cursor.fetchone()
+            if not sale_header:
+                # Archived months whose sale_id range contains it (ranges can overlap when
+                # replicated sales arrive late)
+                self.cursor.execute("SELECT month, path FROM sales_partitions WHERE ? BETWEEN first_sale_id AND last_sale_id",
+                                    (sale_id,))
+                base_dir = os.path.dirname(os.path.abspath(self.db_manager.db_name))
+                for month, path in self.cursor.fetchall():
+                    schema = "sales_" + month.replace("-", "_")
+                    self._attach_chunk([(schema, os.path.join(base_dir, path))])
+                    self.cursor.execute(f"SELECT sale_id, total_amount, payment_method, sale_date, cashier_id "
+                                        f"FROM {schema}.sales WHERE sale_id = ?", (sale_id,))
+                    sale_header = self.cursor.fetchone()
+                    if sale_header:
+                        break
 
             if not sale_header:
-                logging.warning(f"Sale with ID {sale_id} not found.")
+                logger.warning(f"Sale with ID {sale_id} not found.")
                 return None
 
             # Fetch sale items for the given sale_id
-            self.cursor.execute("""
+            self.cursor.execute(f"""
                 SELECT product_name, price_at_sale, quantity, subtotal
-                FROM sale_items
+                FROM {schema}.sale_items
                 WHERE sale_id = ?
                 ORDER BY product_name
             """, (sale_id,))
             sale_items = self.cursor.fetchall()
+            self.cursor.execute(f"SELECT promotion_name, amount FROM {schema}.sale_discounts WHERE sale_id = ?", (sale_id,))
+            sale_discounts = self.cursor.fetchall()
 
             # Convert sale_header tuple to dictionary for better readability
             sale_details = {
@@ -68,72 +199,120 @@ class SalesManager:
                 "items": [
                     {"product_name": item[0], "price_at_sale": item[1], "quantity": item[2], "subtotal": item[3]}
                     for item in sale_items
-                ]
+                ],
+                "discounts": [{"name": d[0], "amount": d[1]} for d in sale_discounts]
             }
-            logging.info(f"Retrieved details for Sale ID {sale_id}.")
+            logger.info(f"Retrieved details for Sale ID {sale_id}.")
             return sale_details
         except sqlite3.Error as e:
-            logging.error(f"Error getting sale details for ID {sale_id}: {e}")
+            logger.error(f"Error getting sale details for ID {sale_id}: {e}")
             return None
 
-    def get_sales_report(self, start_date=None, end_date=None):
-        try:
-            query = "SELECT sale_id, total_amount, payment_method, sale_date, cashier_id FROM sales"
-            params = []
-            conditions = []
+    def _sales_report_queries(self, start_date=None, end_date=None):
+        """Yields (query, params) per chunk of databases (see _partition_chunks), newest sales first."""
+        for chunk in self._partition_chunks(start_date, end_date):
+            yield self._sales_report_query(self._union_source(_sales_arm(), chunk), start_date, end_date)
 
-            if start_date:
-                conditions.append("sale_date >= ?")
-                params.append(start_date)
-            if end_date:
-                conditions.append("sale_date <= ?")
-                params.append(end_date)
+    def _sales_report_query(self, source, start_date=None, end_date=None):
+        query = f"SELECT sale_id, total_amount, payment_method, sale_date, cashier_id FROM {source} AS sales"
+        params = []
+        conditions = []
 
-            if conditions:
-                query += " WHERE " + " AND ".join(conditions)
-            query += " ORDER BY sale_date DESC"
+        if start_date:
+            conditions.append("sale_date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("sale_date <= ?")
+            params.append(end_date)
 
-            self.cursor.execute(query, tuple(params))
-            return self.cursor.fetchall()
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY sale_date DESC"
+        return query, tuple(params)
+
+    def get_sales_report(self, start_date=None, end_date=None):
+        try:
+            rows = []
+            for query, params in self._sales_report_queries(start_date, end_date):
+                self.cursor.execute(query, params)
+                rows.extend(self.cursor.fetchall())
+            return rows
         except sqlite3.Error as e:
-            logging.error(f"Error getting sales report: {e}")
+            logger.error(f"Error getting sales report: {e}")
             return []
 
+    def iter_sales_report(self, start_date=None, end_date=None, batch_size=500):
+        """
+        Same rows as get_sales_report, yielded in lists of up to `batch_size` so large
+        ranges can be streamed. Uses its own cursor; must be consumed on the connection's thread.
+        """
+        cursor = self.conn.cursor()
+        try:
+            for query, params in self._sales_report_queries(start_date, end_date):
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+        except sqlite3.Error as e:
+            logger.error(f"Error streaming sales report: {e}")
+        finally:
+            cursor.close()
+
     def get_top_selling_products(self, limit=10, start_date_str=None, end_date_str=None):
+        if not end_date_str:
+            return self._top_selling_products(limit, start_date_str, end_date_str) or []
+        result = self._closed_period_cached(("top_products", limit, start_date_str, end_date_str),
+                                            start_date_str, end_date_str,
+                                            lambda: self._top_selling_products(limit, start_date_str, end_date_str))
+        return result if result is not None else []
+
+    def _top_selling_products(self, limit, start_date_str, end_date_str):
         try:
-            query = """
-                SELECT si.product_name, SUM(si.quantity) as total_quantity_sold
-                FROM sale_items si
-                JOIN sales s ON si.sale_id = s.sale_id
-            """
             params = []
             where_clauses = []
+            start_ts = end_ts = None
 
             if start_date_str:
-                where_clauses.append("s.sale_date >= ?")
-                params.append(start_date_str + " 00:00:00")
+                where_clauses.append("sale_date >= ?")
+                start_ts = start_date_str + " 00:00:00"
+                params.append(start_ts)
             if end_date_str:
-                where_clauses.append("s.sale_date <= ?")
+                where_clauses.append("sale_date <= ?")
                 # To include the entire end_date, set the end time to the last microsecond of the day
                 end_date_obj = datetime.strptime(end_date_str, "%Y-%m-%d") + timedelta(days=1) - timedelta(microseconds=1)
-                params.append(end_date_obj.strftime("%Y-%m-%d %H:%M:%S"))
-
-
-            if where_clauses:
-                query += " WHERE " + " AND ".join(where_clauses)
+                end_ts = end_date_obj.strftime("%Y-%m-%d %H:%M:%S")
+                params.append(end_ts)
 
-            query += """
-                GROUP BY si.product_name
-                ORDER BY total_quantity_sold DESC
-                LIMIT ?
-            """
-            params.append(limit)
-
-            self.cursor.execute(query, tuple(params))
-            return self.cursor.fetchall()
+            chunks = self._partition_chunks(start_ts, end_ts)
+            totals = {}
+            for chunk in chunks:
+                source = self._union_source("""
+                    SELECT s.sale_date, si.product_name, si.quantity
+                    FROM {db}.sale_items si
+                    JOIN {db}.sales s ON si.sale_id = s.sale_id
+                """, chunk)
+                query = f"""
+                    SELECT product_name, SUM(quantity) as total_quantity_sold
+                    FROM {source}
+                """
+                if where_clauses:
+                    query += " WHERE " + " AND ".join(where_clauses)
+                query += """
+                    GROUP BY product_name
+                    ORDER BY total_quantity_sold DESC
+                    LIMIT ?
+                """
+                # A product's units can be split over chunks, so the limit is applied after summing them
+                self.cursor.execute(query, tuple(params) + (limit if len(chunks) == 1 else -1,))
+                for product_name, quantity in self.cursor.fetchall():
+                    totals[product_name] = totals.get(product_name, 0) + quantity
+            ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+            return ranked if limit < 0 else ranked[:limit]
         except sqlite3.Error as e:
-            logging.error(f"Error getting top selling products: {e}")
-            return []
+            logger.error(f"Error getting top selling products: {e}")
+            return None
 
     def get_daily_sales_summary(self, date_str): #
         """
@@ -141,21 +320,256 @@ class SalesManager:
         Date string format: 'YYYY-MM-DD'.
         """
         try:
-            # Use LIKE to match any sale_date that starts with the given date_str
-            # because sale_date is stored as 'YYYY-MM-DD HH:MM:SS'
-            query = """
-                SELECT SUM(total_amount), COUNT(sale_id)
-                FROM sales
-                WHERE sale_date LIKE ? || '%'
-            """
-            self.cursor.execute(query, (date_str,))
-            result = self.cursor.fetchone()
-
-            total_amount = result[0] if result[0] is not None else 0.0
-            num_sales = result[1] if result[1] is not None else 0
-
-            logging.info(f"Retrieved daily sales summary for {date_str}: Total: {total_amount}, Count: {num_sales}")
+            # sale_date is stored as 'YYYY-MM-DD HH:MM:SS', so a half-open range covers the
+            # whole day and, unlike LIKE, can use idx_sales_date_payment_total
+            next_day = (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            period = (date_str + " 00:00:00", next_day + " 00:00:00")
+            total_cents = num_sales = 0
+            for chunk in self._partition_chunks(*period):
+                # Summed as integer cents so the day's total is exact
+                query = f"""
+                    SELECT SUM({sql_cents('total_amount')}), COUNT(sale_id)
+                    FROM {self._union_source(_sales_arm("sale_id, total_amount, sale_date"), chunk)}
+                    WHERE sale_date >= ? AND sale_date < ?
+                """
+                self.cursor.execute(query, period)
+                result = self.cursor.fetchone()
+                total_cents += result[0] or 0
+                num_sales += result[1] or 0
+
+            total_amount = from_cents(total_cents)
+
+            logger.info(f"Retrieved daily sales summary for {date_str}: Total: {total_amount}, Count: {num_sales}")
             return total_amount, num_sales
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error getting daily sales summary for date {date_str}: {e}")
+            return 0.0, 0 # Return default values on error
+
+    def _closed_period_cached(self, key, start_date_str, end_date_str, compute):
+        """
+        Returns compute(), cached when the period ends before today. A cached result is reused
+        until replication changes the sales of one of its days (sales_day_changes).
+        """
+        if end_date_str >= datetime.now().strftime("%Y-%m-%d"):
+            return compute()
+        try:
+            self.cursor.execute("""
+                SELECT COALESCE(SUM(changes), 0) FROM sales_day_changes
+                WHERE day >= substr(?, 1, 10) AND day <= substr(?, 1, 10)
+            """, (start_date_str or "", end_date_str))
+            version = self.cursor.fetchone()[0]
         except sqlite3.Error as e:
-            logging.error(f"Error getting daily sales summary for date {date_str}: {e}")
-            return 0.0, 0 # Return default values on error
\ No newline at end of file
+            logger.debug("Closed-period cache bypassed: %s", e)  # e.g. a database from before replication
+            return compute()
+        key = (self.db_manager.db_name,) + key
+        with _closed_period_lock:
+            cached = _closed_period_reports.get(key)
+            if cached is not None and cached[0] == version:
+                _closed_period_reports.move_to_end(key)
+                return cached[1]
+        result = compute()
+        if result is not None:
+            with _closed_period_lock:
+                _closed_period_reports[key] = (version, result)
+                _closed_period_reports.move_to_end(key)
+                if len(_closed_period_reports) > CLOSED_PERIOD_CACHE_SIZE:
+                    _closed_period_reports.popitem(last=False)
+        return result
+
+    def get_sales_timeseries(self, start_date_str, end_date_str, bucket="day"):
+        """
+        Revenue and transaction counts per hour or per day, in one range scan of the
+        covering sales index. Every bucket in the period is present, zero-filled.
+        :param start_date_str: 'YYYY-MM-DD', first day included.
+        :param end_date_str: 'YYYY-MM-DD', last day included.
+        :param bucket: 'hour' ('YYYY-MM-DD HH' periods) or 'day' ('YYYY-MM-DD').
+        :return: List of (period, revenue, transactions, {payment_method: (revenue, transactions)}),
+                 oldest first, or None on error.
+        """
+        return self._closed_period_cached(("timeseries", start_date_str, end_date_str, bucket),
+                                          start_date_str, end_date_str,
+                                          lambda: self._sales_timeseries(start_date_str, end_date_str, bucket))
+
+    def _sales_timeseries(self, start_date_str, end_date_str, bucket):
+        try:
+            prefix = TIMESERIES_BUCKETS[bucket]
+            start = datetime.strptime(start_date_str, "%Y-%m-%d")
+            end = datetime.strptime(end_date_str, "%Y-%m-%d") + timedelta(days=1)
+            bounds = (start.strftime("%Y-%m-%d 00:00:00"), end.strftime("%Y-%m-%d 00:00:00"))
+            rows = {}
+            for chunk in self._partition_chunks(*bounds):
+                self.cursor.execute(f"""
+                    SELECT substr(sale_date, 1, {prefix}) AS period, payment_method,
+                           SUM({sql_cents('total_amount')}), COUNT(*)
+                    FROM {self._union_source(_sales_arm("sale_date, payment_method, total_amount"), chunk)}
+                    WHERE sale_date >= ? AND sale_date < ?
+                    GROUP BY period, payment_method
+                """, bounds)
+                for period, payment_method, cents, count in self.cursor.fetchall():
+                    by_method = rows.setdefault(period, {})
+                    previous_cents, previous_count = by_method.get(payment_method, (0, 0))
+                    by_method[payment_method] = (previous_cents + cents, previous_count + count)
+
+            step, fmt = (timedelta(hours=1), "%Y-%m-%d %H") if bucket == "hour" else (timedelta(days=1), "%Y-%m-%d")
+            series = []
+            moment = start
+            while moment < end:
+                period = moment.strftime(fmt)
+                by_method = rows.get(period, {})
+                series.append((
+                    period,
+                    from_cents(sum(cents for cents, _ in by_method.values())),
+                    sum(count for _, count in by_method.values()),
+                    {method: (from_cents(cents), count) for method, (cents, count) in by_method.items()},
+                ))
+                moment += step
+            logger.info(f"Retrieved {bucket} sales timeseries for {start_date_str} to {end_date_str} ({len(series)} buckets).")
+            return series
+        except (sqlite3.Error, ValueError, KeyError) as e:
+            logger.error(f"Error getting sales timeseries for {start_date_str} to {end_date_str}: {e}")
+            return None
+
+    def get_sales_heatmap(self, start_date_str, end_date_str, payment_method=None):
+        """
+        Revenue and transaction counts by weekday and hour of day over a period, in one
+        range scan of the covering sales index.
+        :param payment_method: Optional; only sales paid this way.
+        :return: (revenue, transactions): 7 x 24 lists indexed [weekday][hour], Monday = 0,
+                 zero-filled; or None on error.
+        """
+        return self._closed_period_cached(("heatmap", start_date_str, end_date_str, payment_method),
+                                          start_date_str, end_date_str,
+                                          lambda: self._sales_heatmap(start_date_str, end_date_str, payment_method))
+
+    def _sales_heatmap(self, start_date_str, end_date_str, payment_method):
+        try:
+            end = datetime.strptime(end_date_str, "%Y-%m-%d") + timedelta(days=1)
+            params = [datetime.strptime(start_date_str, "%Y-%m-%d").strftime("%Y-%m-%d 00:00:00"),
+                      end.strftime("%Y-%m-%d 00:00:00")]
+            cents_grid = [[0] * 24 for _ in WEEKDAYS]
+            transactions = [[0] * 24 for _ in WEEKDAYS]
+            for chunk in self._partition_chunks(*params):
+                query = f"""
+                    SELECT CAST(strftime('%w', sale_date) AS INTEGER), CAST(substr(sale_date, 12, 2) AS INTEGER),
+                           SUM({sql_cents('total_amount')}), COUNT(*)
+                    FROM {self._union_source(_sales_arm("sale_date, payment_method, total_amount"), chunk)}
+                    WHERE sale_date >= ? AND sale_date < ?
+                """
+                if payment_method:
+                    query += " AND payment_method = ?"
+                self.cursor.execute(query + " GROUP BY 1, 2", params + ([payment_method] if payment_method else []))
+                for sqlite_weekday, hour, cents, count in self.cursor.fetchall():
+                    weekday = (sqlite_weekday + 6) % 7  # SQLite counts from Sunday = 0
+                    cents_grid[weekday][hour] += cents
+                    transactions[weekday][hour] += count
+            revenue = [[from_cents(cents) for cents in row] for row in cents_grid]
+            logger.info(f"Retrieved sales heatmap for {start_date_str} to {end_date_str}.")
+            return revenue, transactions
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error getting sales heatmap for {start_date_str} to {end_date_str}: {e}")
+            return None
+
+    def get_cashier_summary(self, start_date_str, end_date_str):
+        """
+        Revenue and number of sales per cashier over a period.
+        :param start_date_str: 'YYYY-MM-DD', first day included.
+        :param end_date_str: 'YYYY-MM-DD', last day included.
+        :return: List of (cashier_id, revenue, transactions), highest revenue first, or None on error.
+        """
+        return self._closed_period_cached(("cashiers", start_date_str, end_date_str),
+                                          start_date_str, end_date_str,
+                                          lambda: self._cashier_summary(start_date_str, end_date_str))
+
+    def _cashier_summary(self, start_date_str, end_date_str):
+        try:
+            end = datetime.strptime(end_date_str, "%Y-%m-%d") + timedelta(days=1)
+            bounds = (datetime.strptime(start_date_str, "%Y-%m-%d").strftime("%Y-%m-%d 00:00:00"),
+                      end.strftime("%Y-%m-%d 00:00:00"))
+            totals = {}
+            for chunk in self._partition_chunks(*bounds):
+                self.cursor.execute(f"""
+                    SELECT cashier_id, SUM({sql_cents('total_amount')}), COUNT(*)
+                    FROM {self._union_source(_sales_arm("sale_date, total_amount, cashier_id"), chunk)}
+                    WHERE sale_date >= ? AND sale_date < ?
+                    GROUP BY cashier_id
+                    ORDER BY 2 DESC
+                """, bounds)
+                for cashier_id, cents, count in self.cursor.fetchall():
+                    previous_cents, previous_count = totals.get(cashier_id, (0, 0))
+                    totals[cashier_id] = (previous_cents + cents, previous_count + count)
+            ranked = sorted(totals.items(), key=lambda item: -item[1][0])
+            return [(cashier_id, from_cents(cents), count) for cashier_id, (cents, count) in ranked]
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error getting cashier summary for {start_date_str} to {end_date_str}: {e}")
+            return None
+
+    def generate_z_report(self, date_str):
+        """
+        Stores the Z-report (end-of-day closing totals) of a day: the day's totals in
+        z_reports and one line per cashier and payment method in z_report_lines. An earlier
+        Z-report of the same day is replaced.
+        :param date_str: 'YYYY-MM-DD'.
+        :return: Number of cashier/payment method lines, or None on error.
+        """
+        try:
+            next_day = (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            generated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            bounds = (date_str + " 00:00:00", next_day + " 00:00:00")
+            # One day lies in one month, so main and its partition fit in one chunk; attached
+            # before the DELETE opens the transaction, in which detaching is not possible
+            chunk, = self._partition_chunks(*bounds)
+            source = self._union_source(_sales_arm("sale_date, payment_method, total_amount, cashier_id"), chunk)
+            self.cursor.execute("DELETE FROM z_report_lines WHERE business_day = ?", (date_str,))
+            self.cursor.execute(f"""
+                INSERT INTO z_report_lines (business_day, cashier_id, payment_method, transactions, total_cents)
+                SELECT ?, COALESCE(cashier_id, ''), payment_method, COUNT(*), SUM({sql_cents('total_amount')})
+                FROM {source}
+                WHERE sale_date >= ? AND sale_date < ?
+                GROUP BY 2, 3
+            """, (date_str,) + bounds)
+            lines = self.cursor.rowcount
+            self.cursor.execute("""
+                INSERT OR REPLACE INTO z_reports (business_day, transactions, total_cents, generated_at)
+                SELECT ?, COALESCE(SUM(transactions), 0), COALESCE(SUM(total_cents), 0), ?
+                FROM z_report_lines WHERE business_day = ?
+            """, (date_str, generated_at, date_str))
+            self.conn.commit()
+            logger.info(f"Generated Z-report for {date_str} ({lines} cashier/payment method lines).")
+            return lines
+        except (sqlite3.Error, ValueError) as e:
+            self.conn.rollback()
+            logger.error(f"Error generating Z-report for {date_str}: {e}")
+            return None
+
+    def get_z_report(self, date_str):
+        """
+        :param date_str: 'YYYY-MM-DD'.
+        :return: Dictionary with the day's totals and its cashier/payment method lines, or None
+                 if no Z-report was generated for that day (or on error).
+        """
+        try:
+            self.cursor.execute("SELECT transactions, total_cents, generated_at FROM z_reports WHERE business_day = ?",
+                                (date_str,))
+            header = self.cursor.fetchone()
+            if not header:
+                return None
+            self.cursor.execute("""
+                SELECT cashier_id, payment_method, transactions, total_cents
+                FROM z_report_lines
+                WHERE business_day = ?
+                ORDER BY cashier_id, payment_method
+            """, (date_str,))
+            return {
+                "business_day": date_str,
+                "generated_at": header[2],
+                "transactions": header[0],
+                "total_amount": from_cents(header[1]),
+                "lines": [
+                    {"cashier_id": line[0] or None, "payment_method": line[1], "transactions": line[2],
+                     "total_amount": from_cents(line[3])}
+                    for line in self.cursor.fetchall()
+                ]
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Error getting Z-report for {date_str}: {e}")
+            return None
@@ -0,0 +1,432 @@
+"""
+In-process scheduler for end-of-day and housekeeping jobs (enable with POS_SCHEDULER=1).
+
+One background thread in the API server or the desktop GUI runs:
+
+  z_report     Z-report of the closed business day per cashier and payment method
+  rollups      reorder job (daily sales rollup + suggestions) and stock ledger snapshots
+  cache_warm   closed-period report caches (timeseries, heatmap, top products) up to yesterday
+  checkpoint   passive WAL checkpoint and PRAGMA optimize
+  archive      closed months of sales moved to monthly archive databases (archive_manager.py)
+  sync         change-log sync with head office (replication.py), with the database or
+               pos_app URL in POS_SYNC_PEER and, for a URL, POS_SYNC_USER/POS_SYNC_PASSWORD
+
+POS_SCHEDULE overrides when each job runs, e.g. "z_report=23:55,checkpoint=off":
+  HH:MM        daily at that local time; a run missed while no process was up is caught up
+  idle         once a day, as soon as the lanes have been idle for POS_SCHEDULER_IDLE_S
+  <n>s, <n>m   every n seconds / minutes
+  off          never (run_job and POST /scheduler/jobs/<name>/run still work)
+
+Jobs yield to checkouts: a due job waits until no checkout has been in progress in this
+process, and no sale has been recorded by any process, for POS_SCHEDULER_IDLE_S seconds
+(default 60), but no longer than MAX_DEFER_SECONDS past its due time. The scheduler
+thread also lowers its own OS priority where the platform allows it per thread (Linux).
+
+Every run is recorded in job_runs. A lock file next to the database makes runs exclusive
+across threads and processes (API server and GUI on the same database), and whether a
+job is still due is decided from job_runs while that lock is held, so a job one process
+has done is not repeated by another.
+"""
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from archive_manager import ArchiveManager
+from db_manager import DBManager
+from inventory_manager import InventoryManager
+from reorder_manager import ReorderManager
+from replication import ReplicationManager, make_peer
+from sales_journal import _lock_exclusive
+from sales_manager import SalesManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEDULE = "z_report=00:10,rollups=02:00,cache_warm=idle,checkpoint=5m,archive=03:00,sync=off"
+IDLE_SECONDS = float(os.environ.get("POS_SCHEDULER_IDLE_S", "60"))
+MAX_DEFER_SECONDS = 30 * 60
+RETRY_SECONDS = 10 * 60
+TICK_SECONDS = 15
+HISTORY_ROWS = 5000
+LOCK_SUFFIX = ".jobs.lock"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Serializes runs between threads of this process; the lock file does it between processes
+_run_lock = threading.Lock()
+
+
+class LaneActivity:
+    """Checkouts in progress in this process, so background jobs can wait for a quiet moment."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._last_checkout = time.monotonic()
+
+    @contextmanager
+    def checkout(self):
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._last_checkout = time.monotonic()
+
+    def idle_for(self):
+        """:return: Seconds since the last checkout finished; 0 while one is in progress."""
+        with self._lock:
+            return 0.0 if self._in_flight else time.monotonic() - self._last_checkout
+
+
+lane_activity = LaneActivity()
+
+
+# --- Jobs: callable(db_manager, due_at) -> short result text; raise to fail the run ---
+def run_z_report(db_manager, due_at):
+    # A closing run before noon belongs to the business day before
+    day = due_at.date() if due_at.hour >= 12 else due_at.date() - timedelta(days=1)
+    lines = SalesManager(db_manager).generate_z_report(day.isoformat())
+    if lines is None:
+        raise RuntimeError(f"could not generate the Z-report for {day}")
+    return f"Z-report for {day}: {lines} cashier/payment method lines"
+
+
+def run_rollups(db_manager, due_at):
+    due = ReorderManager(db_manager).run_reorder_job()
+    if due is None:
+        raise RuntimeError("reorder job failed")
+    snapshotted = InventoryManager(db_manager).take_snapshot()
+    if snapshotted is None:
+        raise RuntimeError("stock snapshot failed")
+    return f"{due} products to reorder, {snapshotted} stock snapshots"
+
+
+def run_cache_warm(db_manager, due_at):
+    # The periods the report endpoints and the GUI default to, ending yesterday so they are closed
+    sales_manager = SalesManager(db_manager)
+    end = due_at.date() - timedelta(days=1)
+
+    def start(days):
+        return (end - timedelta(days=days - 1)).isoformat()
+
+    results = [
+        sales_manager.get_sales_timeseries(end.isoformat(), end.isoformat(), "hour"),
+        sales_manager.get_sales_timeseries(start(7), end.isoformat(), "day"),
+        sales_manager.get_sales_timeseries(start(30), end.isoformat(), "day"),
+        sales_manager.get_sales_heatmap(start(28), end.isoformat()),
+        sales_manager.get_top_selling_products(10, start(30), end.isoformat()),
+    ]
+    if any(result is None for result in results):
+        raise RuntimeError("a report could not be computed")
+    return f"{len(results)} reports cached through {end}"
+
+
+def run_checkpoint(db_manager, due_at):
+    conn = db_manager.get_connection()
+    # PASSIVE copies what it can without waiting for, or blocking, readers and writers
+    busy, wal_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    conn.execute("PRAGMA analysis_limit = 1000")
+    conn.execute("PRAGMA optimize")
+    if wal_frames < 0:
+        return "not in WAL mode; statistics optimized"
+    return f"{checkpointed} of {wal_frames} WAL frames checkpointed; statistics optimized"
+
+
+def run_archive(db_manager, due_at):
+    archived = ArchiveManager(db_manager).archive_closed_months(today=due_at.date())
+    if archived is None:
+        raise RuntimeError("archiving failed")
+    return f"{sum(moved for _, moved in archived)} sales archived from {len(archived)} months"
+
+
+def run_sync(db_manager, due_at):
+    target = os.environ.get("POS_SYNC_PEER")
+    if not target:
+        raise RuntimeError("POS_SYNC_PEER is not set")
+    peer = make_peer(target, os.environ.get("POS_SYNC_USER"), os.environ.get("POS_SYNC_PASSWORD"))
+    try:
+        stats = ReplicationManager(db_manager).sync_with(peer)
+    except (ConnectionError, OSError) as e:
+        raise RuntimeError(f"head office unreachable: {e}")
+    return (f"{stats['products_upserted']} products updated, {stats['products_deleted']} deleted "
+            f"({stats['conflicts']} conflicts); {stats['sales_inserted'] + stats['sales_replaced']} sales pushed")
+
+
+JOBS = {
+    "z_report": run_z_report,
+    "rollups": run_rollups,
+    "cache_warm": run_cache_warm,
+    "checkpoint": run_checkpoint,
+    "archive": run_archive,
+    "sync": run_sync,
+}
+
+
+def parse_schedule(spec):
+    """
+    :param spec: 'job=when,...' (see the module docstring).
+    :return: {job: (kind, value)}: ('at', datetime.time), ('every', seconds), ('idle', None) or ('off', None).
+    :raises ValueError: for an unknown job or an unreadable time.
+    """
+    schedule = {}
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        name, _, when = entry.partition("=")
+        name, when = name.strip(), when.strip().lower()
+        if name not in JOBS:
+            raise ValueError(f"Unknown job {name!r} in schedule (jobs: {', '.join(JOBS)})")
+        if when in ("idle", "off"):
+            schedule[name] = (when, None)
+        elif when[-1:] in ("s", "m") and when[:-1].isdigit() and int(when[:-1]) > 0:
+            schedule[name] = ("every", int(when[:-1]) * (60 if when.endswith("m") else 1))
+        else:
+            schedule[name] = ("at", datetime.strptime(when, "%H:%M").time())
+    return schedule
+
+
+def describe_schedule(kind, value):
+    if kind == "at":
+        return f"daily at {value.strftime('%H:%M')}"
+    if kind == "every":
+        return f"every {value}s"
+    return kind
+
+
+def _lower_thread_priority(increment=10):
+    """Raises the nice value of the calling thread only (Linux schedules threads individually)."""
+    if not sys.platform.startswith("linux"):
+        return
+    try:
+        thread_id = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, thread_id, min(os.getpriority(os.PRIO_PROCESS, thread_id) + increment, 19))
+    except OSError as e:
+        logger.debug(f"Could not lower the scheduler thread priority: {e}")
+
+
+class JobScheduler:
+    def __init__(self, db_path, schedule=None, activity=lane_activity, idle_seconds=IDLE_SECONDS,
+                 tick=TICK_SECONDS):
+        """
+        :param schedule: Overrides for DEFAULT_SCHEDULE, in the same 'job=when,...' format.
+        :param activity: LaneActivity the checkouts of this process report to.
+        """
+        self.db_path = db_path
+        self.schedule = parse_schedule(DEFAULT_SCHEDULE)
+        self.schedule.update(parse_schedule(schedule or ""))
+        self.activity = activity
+        self.idle_seconds = idle_seconds
+        self.tick = tick
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="job-scheduler", daemon=True)
+            self._thread.start()
+            logger.info("Job scheduler started (" + ", ".join(
+                f"{name} {describe_schedule(*when)}" for name, when in self.schedule.items()) + ").")
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None
+
+    def _run(self):
+        _lower_thread_priority()
+        while not self._stop.wait(self.tick):
+            for name in self.schedule:
+                if self._stop.is_set():
+                    break
+                try:
+                    due_at = self._pending_run(name)
+                except sqlite3.Error as e:
+                    logger.error(f"Job scheduler: could not check job {name}: {e}")
+                    continue
+                if due_at is not None:
+                    self.run_job(name, due_at, only_if_due=True)
+
+    def _pending_run(self, name):
+        """:return: due_at of a run of `name` that should start now, or None."""
+        now = datetime.now()
+        db_manager = DBManager(self.db_path)
+        try:
+            conn = db_manager.get_connection()
+            due_at = self._due_at(conn, name, now)
+            if due_at is None:
+                return None
+            # Wait for quiet lanes, except for a scheduled run that has already waited long enough
+            kind = self.schedule[name][0]
+            if kind == "idle" or (now - due_at).total_seconds() < MAX_DEFER_SECONDS:
+                if min(self.activity.idle_for(), self._seconds_since_last_sale(conn, now)) < self.idle_seconds:
+                    return None
+            return due_at
+        finally:
+            db_manager.close()
+
+    def _due_at(self, conn, name, now):
+        """:return: When the pending run of `name` fell due according to job_runs, or None if none is pending."""
+        kind, value = self.schedule[name]
+        if kind == "off":
+            return None
+        last_ok_due, last_started = conn.execute("""
+            SELECT MAX(CASE WHEN status = 'ok' THEN due_at END), MAX(started_at)
+            FROM job_runs WHERE job = ?
+        """, (name,)).fetchone()
+        if kind == "every":
+            if last_started is None:
+                return now
+            due_at = datetime.strptime(last_started, TIMESTAMP_FORMAT) + timedelta(seconds=value)
+            return due_at if due_at <= now else None
+
+        if kind == "at":
+            due_at = datetime.combine(now.date(), value)
+            if due_at > now:
+                due_at -= timedelta(days=1)
+        else:
+            due_at = datetime.combine(now.date(), datetime.min.time())
+        if last_ok_due is not None and last_ok_due >= due_at.strftime(TIMESTAMP_FORMAT):
+            return None
+        # A failed run is retried, but not on every tick
+        if last_started is not None and \
+                datetime.strptime(last_started, TIMESTAMP_FORMAT) > now - timedelta(seconds=RETRY_SECONDS):
+            return None
+        return due_at
+
+    def _seconds_since_last_sale(self, conn, now):
+        # Sales recorded by other processes (prefork workers, the GUI) count as lane activity too
+        last_sale = conn.execute("SELECT MAX(sale_date) FROM sales").fetchone()[0]
+        if last_sale is None:
+            return float("inf")
+        try:
+            return (now - datetime.strptime(last_sale, TIMESTAMP_FORMAT)).total_seconds()
+        except ValueError:
+            return float("inf")
+
+    def run_job(self, name, due_at=None, only_if_due=False):
+        """
+        Runs one job now, exclusively, and records the run in job_runs.
+        :param due_at: The scheduled time the run is for; default now.
+        :param only_if_due: Skip the run unless it is still due once the lock is held.
+        :return: (run_id, status, result) with status 'ok' or 'failed'; None if another run holds
+                 the lock, the job is no longer due, or the run could not be recorded.
+        :raises ValueError: for an unknown job.
+        """
+        if name not in JOBS:
+            raise ValueError(f"Unknown job {name!r}")
+        if not _run_lock.acquire(blocking=False):
+            return None
+        lock_fd = None
+        try:
+            lock_fd = os.open(self.db_path + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _lock_exclusive(lock_fd)
+            except OSError:
+                return None
+            db_manager = DBManager(self.db_path)
+            try:
+                return self._run_locked(db_manager, name, due_at, only_if_due)
+            finally:
+                db_manager.close()
+        except sqlite3.Error as e:
+            logger.error(f"Error recording a run of job {name}: {e}")
+            return None
+        finally:
+            if lock_fd is not None:
+                os.close(lock_fd)  # also releases the lock
+            _run_lock.release()
+
+    def _run_locked(self, db_manager, name, due_at, only_if_due):
+        conn = db_manager.get_connection()
+        # No run can be in progress while the lock is held: 'running' rows are left by a crash
+        conn.execute("UPDATE job_runs SET status = 'failed', result = 'interrupted' WHERE status = 'running'")
+        started = datetime.now()
+        if only_if_due and (name not in self.schedule or self._due_at(conn, name, started) is None):
+            conn.commit()
+            return None
+        due_at = due_at or started
+        run_id = conn.execute("""
+            INSERT INTO job_runs (job, due_at, started_at, status) VALUES (?, ?, ?, 'running')
+        """, (name, due_at.strftime(TIMESTAMP_FORMAT), started.strftime(TIMESTAMP_FORMAT))).lastrowid
+        conn.commit()
+
+        try:
+            status, result = "ok", str(JOBS[name](db_manager, due_at))
+        except Exception as e:  # a failing job is recorded, never allowed to kill the scheduler
+            conn.rollback()
+            status, result = "failed", str(e)
+        seconds = (datetime.now() - started).total_seconds()
+        conn.execute("UPDATE job_runs SET finished_at = ?, status = ?, result = ? WHERE run_id = ?",
+                     (datetime.now().strftime(TIMESTAMP_FORMAT), status, result, run_id))
+        conn.execute("DELETE FROM job_runs WHERE run_id <= ?", (run_id - HISTORY_ROWS,))
+        conn.commit()
+        if status == "ok":
+            logger.info(f"Job {name} finished in {seconds:.2f}s: {result}")
+        else:
+            logger.error(f"Job {name} failed after {seconds:.2f}s: {result}")
+        return run_id, status, result
+
+    def get_runs(self, job=None, limit=50):
+        """:return: List of (run_id, job, due_at, started_at, finished_at, status, result), newest first."""
+        query = "SELECT run_id, job, due_at, started_at, finished_at, status, result FROM job_runs"
+        params = []
+        if job:
+            query += " WHERE job = ?"
+            params.append(job)
+        query += " ORDER BY run_id DESC LIMIT ?"
+        params.append(limit)
+        db_manager = DBManager(self.db_path)
+        try:
+            return db_manager.get_connection().execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error getting job runs: {e}")
+            return []
+        finally:
+            db_manager.close()
+
+    def get_status(self):
+        """:return: List of (job, schedule description, due_at of a pending run or None, last run row or None)."""
+        now = datetime.now()
+        db_manager = DBManager(self.db_path)
+        try:
+            conn = db_manager.get_connection()
+            status = []
+            for name in JOBS:
+                kind, value = self.schedule.get(name, ("off", None))
+                due_at = self._due_at(conn, name, now) if name in self.schedule else None
+                last_run = conn.execute("""
+                    SELECT run_id, job, due_at, started_at, finished_at, status, result
+                    FROM job_runs WHERE job = ? ORDER BY started_at DESC LIMIT 1
+                """, (name,)).fetchone()
+                status.append((name, describe_schedule(kind, value), due_at, last_run))
+            return status
+        except sqlite3.Error as e:
+            logger.error(f"Error getting job status: {e}")
+            return []
+        finally:
+            db_manager.close()
+
+
+if __name__ == "__main__":
+    # Run one job by hand or from cron: python scheduler.py JOB [database]
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] not in JOBS:
+        sys.exit(f"usage: python scheduler.py {{{','.join(JOBS)}}} [database]")
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "pos_database.db"
+    setup_db_manager = DBManager(db_path)
+    setup_db_manager.create_tables()
+    setup_db_manager.close()
+    run = JobScheduler(db_path).run_job(sys.argv[1])
+    print(run)
+    sys.exit(0 if run and run[1] == "ok" else 1)
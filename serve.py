@@ -0,0 +1,252 @@
+"""
+Production entry point for the POS backend.
+
+    python serve.py                           # thread pool (waitress), works on Windows
+    python serve.py --mode prefork -w 4       # prefork processes (gunicorn), Linux/macOS
+
+Database setup runs once in this (parent) process before any worker starts or forks.
+Worker counters are kept in shared memory and served at GET /server/stats, with the sales
+journal's status (pending and dead-lettered records) when it is enabled.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from flask import jsonify
+
+import pos_app
+from pos_app import app, setup_database_once
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 5000
+DEFAULT_THREADS = 8
+DEFAULT_KEEPALIVE = 5
+DEFAULT_GRACEFUL_TIMEOUT = 30
+
+# Per-worker slot layout in the shared stats array
+_FIELDS = ("pid", "started_at", "requests", "in_flight", "errors", "busy_seconds")
+
+
+class WorkerStats:
+    """
+    Fixed-size table of per-worker counters in shared memory. Created in the parent
+    before forking so every worker process writes into the same array; each worker
+    claims a free slot (pid 0 or a pid that has exited) when it starts.
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+        self._array = multiprocessing.Array("d", slots * len(_FIELDS))
+        self._slot = None
+
+    def _offset(self, slot, field):
+        return slot * len(_FIELDS) + _FIELDS.index(field)
+
+    def claim_slot(self):
+        pid = os.getpid()
+        with self._array.get_lock():
+            for slot in range(self.slots):
+                slot_pid = int(self._array[self._offset(slot, "pid")])
+                if slot_pid in (0, pid) or not _pid_alive(slot_pid):
+                    base = slot * len(_FIELDS)
+                    self._array[base:base + len(_FIELDS)] = [pid, time.time(), 0, 0, 0, 0]
+                    self._slot = slot
+                    return slot
+        logging.warning(f"serve: no free stats slot for worker {pid}; its requests will not be counted.")
+        return None
+
+    def release_slot(self):
+        if self._slot is not None:
+            with self._array.get_lock():
+                self._array[self._offset(self._slot, "pid")] = 0
+            self._slot = None
+
+    def _add(self, field, amount):
+        if self._slot is None:
+            self.claim_slot()
+            if self._slot is None:
+                return
+        with self._array.get_lock():
+            self._array[self._offset(self._slot, field)] += amount
+
+    def request_started(self):
+        self._add("in_flight", 1)
+
+    def request_finished(self, duration, failed):
+        with self._array.get_lock():
+            if self._slot is None:
+                return
+            self._array[self._offset(self._slot, "in_flight")] -= 1
+            self._array[self._offset(self._slot, "requests")] += 1
+            self._array[self._offset(self._slot, "busy_seconds")] += duration
+            if failed:
+                self._array[self._offset(self._slot, "errors")] += 1
+
+    def snapshot(self):
+        with self._array.get_lock():
+            values = list(self._array)
+        workers = []
+        for slot in range(self.slots):
+            row = dict(zip(_FIELDS, values[slot * len(_FIELDS):(slot + 1) * len(_FIELDS)]))
+            if row["pid"] == 0:
+                continue
+            row["pid"] = int(row["pid"])
+            row["requests"] = int(row["requests"])
+            row["in_flight"] = int(row["in_flight"])
+            row["errors"] = int(row["errors"])
+            row["uptime_seconds"] = round(time.time() - row.pop("started_at"), 1)
+            row["busy_seconds"] = round(row["busy_seconds"], 3)
+            workers.append(row)
+        return workers
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows; slots there are never contended
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class StatsMiddleware:
+    """WSGI middleware that feeds WorkerStats; a 5xx response counts as an error."""
+
+    def __init__(self, wsgi_app, stats):
+        self.wsgi_app = wsgi_app
+        self.stats = stats
+
+    def __call__(self, environ, start_response):
+        status_holder = {}
+
+        def _start_response(status, headers, exc_info=None):
+            status_holder["status"] = status
+            return start_response(status, headers, exc_info)
+
+        self.stats.request_started()
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = self.wsgi_app(environ, _start_response)
+            failed = status_holder.get("status", "500").startswith("5")
+            return result
+        finally:
+            self.stats.request_finished(time.perf_counter() - start, failed)
+
+
+def install_worker_stats(slots, mode):
+    stats = WorkerStats(slots)
+    app.wsgi_app = StatsMiddleware(app.wsgi_app, stats)
+
+    @app.route('/server/stats', methods=['GET'])
+    def server_stats():
+        journal = pos_app.sales_journal.status() if pos_app.sales_journal is not None else None
+        return jsonify({"mode": mode, "served_by": os.getpid(), "workers": stats.snapshot(),
+                        "sales_journal": journal}), 200
+
+    return stats
+
+
+def serve_threads(host, port, threads, keepalive, stats):
+    """Single process, `threads` worker threads (waitress). Keep-alive connections stay open up to `keepalive` s idle."""
+    try:
+        from waitress import create_server
+    except ImportError:
+        sys.exit("Thread-pool mode needs waitress: pip install waitress")
+
+    stats.claim_slot()
+    server = create_server(app, host=host, port=port, threads=threads, channel_timeout=keepalive,
+                           ident="dms-pos")
+
+    def _shutdown(signum, frame):
+        logging.info(f"serve: received signal {signum}, shutting down.")
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    logging.info(f"serve: listening on {host}:{port} with {threads} worker threads.")
+    print(f"DMS POS backend serving on http://{host}:{port} ({threads} threads)")
+    try:
+        server.run()
+    finally:
+        # Closes the listener and lets in-flight requests on the worker threads finish
+        server.close()
+        stats.release_slot()
+        logging.info("serve: stopped.")
+
+
+def serve_prefork(host, port, workers, threads, keepalive, graceful_timeout, stats):
+    """`workers` forked processes (gunicorn), each with `threads` threads. The app is loaded once, before forking."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("Prefork mode needs gunicorn (Linux/macOS): pip install gunicorn")
+
+    class _PreforkApplication(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "threads": threads,
+                "worker_class": "gthread" if threads > 1 else "sync",
+                "keepalive": keepalive,
+                "graceful_timeout": graceful_timeout,
+                "preload_app": True,
+                "post_fork": lambda server, worker: stats.claim_slot(),
+                "worker_exit": lambda server, worker: stats.release_slot(),
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    logging.info(f"serve: starting {workers} prefork workers x {threads} threads on {host}:{port}.")
+    print(f"DMS POS backend serving on http://{host}:{port} ({workers} workers x {threads} threads)")
+    # gunicorn's arbiter handles SIGTERM (graceful) and SIGINT/SIGQUIT (fast) itself
+    _PreforkApplication().run()
+
+
+def main(argv=None):
+    can_fork = hasattr(os, "fork")
+    parser = argparse.ArgumentParser(description="Run the DMS POS backend with a production server.")
+    parser.add_argument("--mode", choices=["threads", "prefork"], default="prefork" if can_fork else "threads")
+    parser.add_argument("--host", default=os.environ.get("POS_HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("POS_PORT", DEFAULT_PORT)))
+    parser.add_argument("-w", "--workers", type=int, default=int(os.environ.get("POS_WORKERS", os.cpu_count() or 1)),
+                        help="Worker processes in prefork mode (default: one per CPU core).")
+    parser.add_argument("-t", "--threads", type=int, default=int(os.environ.get("POS_THREADS", DEFAULT_THREADS)),
+                        help="Threads per worker.")
+    parser.add_argument("--keepalive", type=int, default=DEFAULT_KEEPALIVE, help="Idle keep-alive timeout in seconds.")
+    parser.add_argument("--graceful-timeout", type=int, default=DEFAULT_GRACEFUL_TIMEOUT)
+    parser.add_argument("--database", default=pos_app.DATABASE_NAME)
+    args = parser.parse_args(argv)
+
+    if args.mode == "prefork" and not can_fork:
+        parser.error("prefork mode is not available on this platform; use --mode threads")
+    if args.mode == "prefork" and pos_app.SALES_JOURNAL_DIR:
+        parser.error("the sales journal (POS_SALES_JOURNAL) needs a single process; use --mode threads")
+
+    pos_app.DATABASE_NAME = args.database
+    # Schema creation and seeding happen exactly once, before any worker exists
+    setup_database_once()
+
+    if args.mode == "prefork":
+        stats = install_worker_stats(args.workers, args.mode)
+        serve_prefork(args.host, args.port, args.workers, args.threads, args.keepalive, args.graceful_timeout, stats)
+    else:
+        stats = install_worker_stats(1, args.mode)
+        serve_threads(args.host, args.port, args.threads, args.keepalive, stats)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_TTL = 12 * 60 * 60  # One cashier shift
+SECRET_FILE_NAME = "pos_session.key"
+# How stale another worker's view of a logout may be
+REVOCATION_POLL_SECONDS = float(os.environ.get("POS_REVOCATION_POLL_S", "2"))
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def load_or_create_secret(secret_path=SECRET_FILE_NAME):
+    """
+    Returns the HMAC signing key. $POS_SESSION_SECRET wins; otherwise the key is read
+    from (or generated into) `secret_path` so every worker process and restart
+    signs with the same key.
+    """
+    env_secret = os.environ.get("POS_SESSION_SECRET")
+    if env_secret:
+        return env_secret.encode("utf-8")
+    try:
+        with open(secret_path, "rb") as f:
+            secret = f.read().strip()
+        if secret:
+            return secret
+    except FileNotFoundError:
+        pass
+    secret = secrets.token_hex(32).encode("ascii")
+    try:
+        fd = os.open(secret_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secret)
+        logger.info(f"Generated new session signing key at {secret_path}.")
+    except FileExistsError:
+        # Another worker created it first; use theirs
+        with open(secret_path, "rb") as f:
+            secret = f.read().strip()
+    return secret
+
+
+class SessionTokenManager:
+    """
+    Issues and verifies HMAC-SHA256 signed session tokens of the form
+    '<base64 payload>.<base64 signature>'. Verification checks the signature and the
+    revoked ids in-process and never reads the database. Logout records the token's id in
+    the revoked_tokens table of `db_path`, which every worker process shares, until the
+    token would have expired anyway; each worker picks up the rows added since its last
+    look at most every `revocation_poll` seconds (one indexed range read on seq).
+    Without a db_path the revoked ids are only kept in this process.
+    """
+
+    def __init__(self, secret=None, ttl=DEFAULT_TOKEN_TTL, db_path=None,
+                 revocation_poll=REVOCATION_POLL_SECONDS):
+        self.secret = secret if secret is not None else load_or_create_secret()
+        self.ttl = ttl
+        self.db_path = db_path
+        self.revocation_poll = revocation_poll
+        self._revoked = {}  # jti -> exp
+        self._revoked_seq = 0  # Highest revoked_tokens.seq already in _revoked
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self):
+        """One connection per thread (and per process: never reuse one inherited through fork)."""
+        key = (os.getpid(), self.db_path)
+        if getattr(self._local, "key", None) != key:
+            self._local.conn = sqlite3.connect(self.db_path, timeout=5)
+            self._local.key = key
+        return self._local.conn
+
+    def _sign(self, payload_b64):
+        return _b64encode(hmac.new(self.secret, payload_b64.encode("ascii"), hashlib.sha256).digest())
+
+    def issue_token(self, user_info):
+        """
+        :param user_info: Dict as returned by UserManager.verify_user.
+        :return: Signed token string.
+        """
+        now = int(time.time())
+        payload = {
+            "uid": user_info["user_id"],
+            "usr": user_info["username"],
+            "role": user_info["role"],
+            "iat": now,
+            "exp": now + self.ttl,
+            "jti": secrets.token_hex(8),
+        }
+        payload_b64 = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        return f"{payload_b64}.{self._sign(payload_b64)}"
+
+    def _decode(self, token):
+        """Returns the payload of a correctly signed token, or None. Does not check expiry."""
+        # Tokens are base64url; anything else cannot be signed or compared
+        if not token or not token.isascii() or token.count(".") != 1:
+            return None
+        payload_b64, signature = token.split(".")
+        if not hmac.compare_digest(signature, self._sign(payload_b64)):
+            return None
+        try:
+            return json.loads(_b64decode(payload_b64))
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    def verify_token(self, token):
+        """
+        :return: {"user_id", "username", "role"} for a valid, unexpired, unrevoked token, else None.
+        """
+        payload = self._decode(token)
+        if payload is None:
+            return None
+        if payload.get("exp", 0) < time.time():
+            return None
+        if self._is_revoked(payload.get("jti")):
+            return None
+        return {"user_id": payload["uid"], "username": payload["usr"], "role": payload["role"]}
+
+    def _is_revoked(self, jti):
+        if self.db_path is not None and time.monotonic() >= self._next_poll:
+            self._poll_revocations()
+        with self._lock:
+            return jti in self._revoked
+
+    def _poll_revocations(self):
+        """Merges the revocations other workers recorded since the last poll into _revoked."""
+        # One thread polls; the others keep answering from the set they already have
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            rows = self._connection().execute(
+                "SELECT seq, jti, exp FROM revoked_tokens WHERE seq > ? ORDER BY seq", (self._revoked_seq,)
+            ).fetchall()
+            now = int(time.time())
+            with self._lock:
+                for seq, jti, exp in rows:
+                    self._revoked[jti] = exp
+                    self._revoked_seq = seq
+                for jti in [jti for jti, exp in self._revoked.items() if exp < now]:
+                    del self._revoked[jti]
+        except sqlite3.Error as e:
+            # Keep enforcing what is already known and retry on the next poll
+            logger.error(f"Error polling revoked session tokens: {e}")
+        finally:
+            self._next_poll = time.monotonic() + self.revocation_poll
+            self._poll_lock.release()
+
+    def revoke_token(self, token):
+        """Revokes a token until it would have expired anyway. Returns False if the token is not valid."""
+        payload = self._decode(token)
+        if payload is None:
+            return False
+        now = int(time.time())
+        with self._lock:
+            self._revoked[payload["jti"]] = payload["exp"]
+            for jti in [jti for jti, exp in self._revoked.items() if exp < now]:
+                del self._revoked[jti]
+        if self.db_path is not None:
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.execute("DELETE FROM revoked_tokens WHERE exp < ?", (now,))
+                    conn.execute("INSERT OR REPLACE INTO revoked_tokens (jti, exp) VALUES (?, ?)",
+                                 (payload["jti"], payload["exp"]))
+            except sqlite3.Error as e:
+                logger.error(f"Error revoking session token for user '{payload['usr']}': {e}")
+                return False
+        logger.info(f"Session token revoked for user '{payload['usr']}'.")
+        return True
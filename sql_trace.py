@@ -0,0 +1,206 @@
+"""
+Optional SQL statement instrumentation for DBManager connections.
+
+Enable with DBManager(..., trace=True) or POS_SQL_TRACE=1. Every statement run through
+the connection (cursor.execute/executemany and connection.execute) is timed from execute
+until its results are consumed, then aggregated by normalized SQL text. Statements slower
+than POS_SLOW_QUERY_MS (default 100) are written to the 'sql.slow' logger together with
+their EXPLAIN QUERY PLAN.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+slow_logger = logging.getLogger("sql.slow")
+
+SAMPLES_PER_STATEMENT = 2048
+DEFAULT_SLOW_QUERY_MS = float(os.environ.get("POS_SLOW_QUERY_MS", "100"))
+PLAN_LOG_INTERVAL = 60.0  # seconds between slow-log plan dumps for the same statement
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_normalized_cache = {}
+
+
+def normalize_sql(sql):
+    """Collapses whitespace and replaces literals with '?', so identical statements aggregate together."""
+    cached = _normalized_cache.get(sql)
+    if cached is not None:
+        return cached
+    normalized = _STRING_LITERAL.sub("?", sql)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _WHITESPACE.sub(" ", normalized).strip()
+    normalized = _IN_LIST.sub("(?...)", normalized)
+    if len(_normalized_cache) < 10000:
+        _normalized_cache[sql] = normalized
+    return normalized
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class StatementStats:
+    """Process-wide aggregate of statement timings keyed by normalized SQL."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._last_plan_logged = {}
+
+    def record(self, sql, duration, rows):
+        with self._lock:
+            entry = self._stats.get(sql)
+            if entry is None:
+                entry = self._stats[sql] = {"count": 0, "total": 0.0, "rows": 0,
+                                            "samples": deque(maxlen=SAMPLES_PER_STATEMENT)}
+            entry["count"] += 1
+            entry["total"] += duration
+            entry["rows"] += rows
+            entry["samples"].append(duration)
+
+    def should_log_plan(self, sql):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_plan_logged.get(sql, -PLAN_LOG_INTERVAL) < PLAN_LOG_INTERVAL:
+                return False
+            self._last_plan_logged[sql] = now
+            return True
+
+    def report(self, order_by="total_ms"):
+        """:return: List of per-statement dicts (times in milliseconds), most expensive first."""
+        with self._lock:
+            items = [(sql, dict(entry, samples=sorted(entry["samples"]))) for sql, entry in self._stats.items()]
+        rows = []
+        for sql, entry in items:
+            rows.append({
+                "sql": sql,
+                "count": entry["count"],
+                "total_ms": round(entry["total"] * 1000, 3),
+                "mean_ms": round(entry["total"] * 1000 / entry["count"], 3),
+                "p50_ms": round(_percentile(entry["samples"], 0.50) * 1000, 3),
+                "p99_ms": round(_percentile(entry["samples"], 0.99) * 1000, 3),
+                "rows": entry["rows"],
+            })
+        rows.sort(key=lambda r: r[order_by], reverse=True)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._last_plan_logged.clear()
+
+
+STATS = StatementStats()
+
+
+class TracingCursor(sqlite3.Cursor):
+    """
+    Times each statement from execute() until its rows are exhausted, the next statement
+    starts, or the cursor is closed. Rows are counted as they are fetched.
+    """
+    slow_query_ms = DEFAULT_SLOW_QUERY_MS
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._trace_sql = None
+        self._trace_params = None
+        self._trace_elapsed = 0.0
+        self._trace_rows = 0
+
+    def _finish(self):
+        if self._trace_sql is None:
+            return
+        sql, params, elapsed, rows = self._trace_sql, self._trace_params, self._trace_elapsed, self._trace_rows
+        self._trace_sql = None
+        normalized = normalize_sql(sql)
+        STATS.record(normalized, elapsed, rows if rows else max(self.rowcount, 0))
+        if elapsed * 1000 >= self.slow_query_ms and STATS.should_log_plan(normalized):
+            self._log_slow(sql, params, elapsed)
+
+    def _log_slow(self, sql, params, elapsed):
+        plan = []
+        if sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+            try:
+                # Plain cursor so the EXPLAIN itself is not traced
+                plan_cursor = sqlite3.Cursor(self.connection)
+                plan_cursor.execute("EXPLAIN QUERY PLAN " + sql, params or ())
+                plan = [row[-1] for row in plan_cursor.fetchall()]
+                plan_cursor.close()
+            except sqlite3.Error as e:
+                plan = [f"(plan unavailable: {e})"]
+        slow_logger.warning("Slow query %.1f ms: %s | plan: %s", elapsed * 1000,
+                            _WHITESPACE.sub(" ", sql).strip(), " / ".join(plan))
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._trace_elapsed += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._trace_sql, self._trace_params = sql, parameters
+        self._trace_elapsed, self._trace_rows = 0.0, 0
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            # DML/DDL: nothing to fetch, the statement is complete
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        self._trace_sql, self._trace_params = sql, None
+        self._trace_elapsed, self._trace_rows = 0.0, 0
+        self._timed(super().executemany, sql, seq_of_parameters)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._trace_rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        self._trace_rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._trace_rows += len(rows)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class TracingConnection(sqlite3.Connection):
+    """Connection whose cursors (including the implicit one in execute()) are TracingCursors."""
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
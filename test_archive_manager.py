@@ -0,0 +1,63 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from analytics_store import ColumnarSalesStore
+from archive_manager import ArchiveManager
+from db_manager import DBManager
+from replication import ReplicationManager
+
+
+def _sale(origin_sale_id, total, sale_date):
+    return [origin_sale_id, total, "Cash", sale_date, "cashier1", [["P1", "Widget", total, 1, total]]]
+
+
+class ArchivedSalesInColumnarStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "pos_database.db")
+        self.db_manager = DBManager(self.db_path)
+        ReplicationManager(self.db_manager).apply_sales("T1", [
+            _sale(1, 10.0, "2025-08-14 10:00:00"), _sale(2, 7.0, "2025-09-02 10:00:00"), _sale(3, 5.0, "2025-10-01 09:00:00"),
+        ])
+        self.archive_manager = ArchiveManager(self.db_manager)
+        self.store_dir = os.path.join(self.tmp_dir, "analytics")
+
+    def tearDown(self):
+        self.db_manager.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _revenue_by_month(self):
+        store = ColumnarSalesStore(self.store_dir)
+        store.export(self.db_path)
+        return store.revenue_by("month")
+
+    def test_sales_archived_before_the_export_are_exported(self):
+        self.assertEqual(self.archive_manager.archive_month("2025-08"), 1)
+        self.assertEqual(self.archive_manager.archive_month("2025-09"), 1)
+        self.assertEqual(self._revenue_by_month(),
+                         [("2025-08", 10.0, 1), ("2025-09", 7.0, 1), ("2025-10", 5.0, 1)])
+
+    def test_rebuild_after_archiving_keeps_archived_months(self):
+        self._revenue_by_month()
+        self.archive_manager.archive_month("2025-08")
+        shutil.rmtree(self.store_dir)
+        self.assertEqual(self._revenue_by_month(),
+                         [("2025-08", 10.0, 1), ("2025-09", 7.0, 1), ("2025-10", 5.0, 1)])
+
+    def test_failed_archive_leaves_no_copy_behind(self):
+        cursor = self.db_manager.get_cursor()
+        cursor.execute("DROP TABLE sales_partitions")  # the last statement of the move fails
+        self.assertIsNone(self.archive_manager.archive_month("2025-08"))
+        self.assertEqual(cursor.execute("SELECT COUNT(*) FROM sales WHERE sale_date < '2025-09'").fetchone(), (1,))
+        conn = sqlite3.connect(self.archive_manager.partition_path("2025-08"))
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM sales").fetchone(), (0,))
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+import money
+from money import allocate, cart_totals, percent_of, to_cents, vat_included
+
+
+class ConversionTest(unittest.TestCase):
+    def test_to_cents_is_exact_and_rounds_half_up(self):
+        self.assertEqual(to_cents(19.99), 1999)
+        self.assertEqual(to_cents(0.1 + 0.2), 30)
+        self.assertEqual(to_cents("0.005"), 1)
+        self.assertEqual(to_cents(7), 700)
+
+    def test_percent_of_rounds_half_up(self):
+        self.assertEqual(percent_of(999, 15), 150)  # 149.85
+        self.assertEqual(percent_of(50, 1), 1)      # 0.5
+        self.assertEqual(percent_of(49, 1), 0)      # 0.49
+
+
+class AllocateTest(unittest.TestCase):
+    def test_parts_add_up_to_the_total(self):
+        for total, weights in [(100, [1, 1, 1]), (3352, [10, 6666]), (1, [5, 5]), (999, [3, 0, 7, 11])]:
+            self.assertEqual(sum(allocate(total, weights)), total)
+
+    def test_remainders_go_to_the_largest_fractions_then_the_earliest(self):
+        self.assertEqual(allocate(100, [1, 1, 1]), [34, 33, 33])
+        self.assertEqual(allocate(10, [1, 2, 4]), [1, 3, 6])  # 1.43, 2.86, 5.71
+        self.assertEqual(allocate(1, [5, 5]), [1, 0])
+
+    def test_zero_weights_get_nothing(self):
+        self.assertEqual(allocate(7, [0, 0]), [0, 0])
+        self.assertEqual(allocate(7, [0, 3]), [0, 7])
+
+
+class VatTest(unittest.TestCase):
+    def test_vat_included_rounds_half_up(self):
+        self.assertEqual(vat_included(11600, 16), 1600)
+        self.assertEqual(vat_included(100, 16), 14)   # 13.79
+        self.assertEqual(vat_included(29, 16), 4)     # 4.0 exactly
+        self.assertEqual(vat_included(1, 16), 0)      # 0.138
+
+    def test_cart_vat_is_computed_per_rate_on_the_discounted_total(self):
+        totals = cart_totals([1160, 500], [2, 1], [160, 0], vat_rates=[16, 0])
+        self.assertEqual((totals["subtotal"], totals["discount"], totals["total"]), (2820, 160, 2660))
+        self.assertEqual(totals["vat_breakdown"], {Decimal(16): {"gross": 2160, "vat": 298},
+                                                   Decimal(0): {"gross": 500, "vat": 0}})
+        self.assertEqual(totals["vat"], 298)
+
+    def test_vectorized_and_plain_totals_agree(self):
+        if money.numpy is None:
+            self.skipTest("NumPy is not installed")
+        prices = [(i * 37) % 5000 + 1 for i in range(300)]
+        quantities = [i % 7 + 1 for i in range(300)]
+        discounts = [i % 3 for i in range(300)]
+        rates = [16 if i % 4 else 8 for i in range(300)]
+        vectorized = cart_totals(prices, quantities, discounts, rates)
+        with mock.patch.object(money, "numpy", None):
+            self.assertEqual(cart_totals(prices, quantities, discounts, rates), vectorized)
+
+
+if __name__ == "__main__":
+    unittest.main()
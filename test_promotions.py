@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from db_manager import DBManager
+from promotion_manager import PromotionEngine, PromotionManager, validate_rule
+
+PRICES = {"A": 1999, "B": 10, "C": 3333}
+FRIDAY_5PM = datetime(2025, 1, 3, 17, 0)  # weekday 4
+
+
+def _engine(*promotions):
+    """:param promotions: (promotion_id, kind, rule, priority[, starts_at, ends_at])."""
+    return PromotionEngine([(p[0], f"promo {p[0]}", p[1], p[2], p[3]) + (tuple(p[4:]) or (None, None))
+                            for p in promotions])
+
+
+class PromotionEngineTest(unittest.TestCase):
+    def test_higher_priority_claims_the_units_first(self):
+        three_for_two = (1, "multi_buy", {"product_ids": ["A"], "buy": 3, "pay": 2}, 0)
+        half_off = (2, "percent_off", {"product_ids": ["A"], "percent": 50}, 5)
+        quote = _engine(three_for_two, half_off).evaluate([("A", 3)], PRICES, FRIDAY_5PM)
+        self.assertEqual([d["promotion_id"] for d in quote["discounts"]], [2])
+        self.assertEqual(quote["discount_total_cents"], 2999)  # half of 5997, rounded half up
+
+    def test_equal_priority_applies_the_older_promotion_first(self):
+        ten_off = (7, "percent_off", {"product_ids": ["A"], "percent": 10}, 0)
+        twenty_off = (3, "percent_off", {"product_ids": ["A"], "percent": 20}, 0)
+        quote = _engine(ten_off, twenty_off).evaluate([("A", 1)], PRICES, FRIDAY_5PM)
+        self.assertEqual([d["promotion_id"] for d in quote["discounts"]], [3])
+
+    def test_each_unit_is_discounted_by_one_promotion(self):
+        three_for_two = (1, "multi_buy", {"product_ids": ["A"], "buy": 3, "pay": 2}, 5)
+        ten_off = (2, "percent_off", {"product_ids": ["A"], "percent": 10}, 0)
+        # Split over two cart lines: 6 units go to the multi-buy, the 7th gets 10% off
+        quote = _engine(three_for_two, ten_off).evaluate([("A", 4), ("A", 3)], PRICES, FRIDAY_5PM)
+        self.assertEqual([(d["promotion_id"], d["amount_cents"]) for d in quote["discounts"]], [(1, 2 * 1999), (2, 200)])
+        self.assertEqual(quote["line_discounts_cents"], {"A": 2 * 1999 + 200})
+
+    def test_bundle_saving_is_spread_over_its_lines(self):
+        bundle = (1, "bundle", {"items": {"B": 1, "C": 2}, "price": 50}, 0)
+        quote = _engine(bundle).evaluate([("B", 3), ("C", 5)], PRICES, FRIDAY_5PM)
+        # Two sets (the fifth C is left over), each 6676 cents regular for 5000
+        self.assertEqual(quote["discount_total_cents"], 2 * (10 + 2 * 3333 - 5000))
+        self.assertEqual(sum(quote["line_discounts_cents"].values()), quote["discount_total_cents"])
+        self.assertEqual(quote["line_discounts_cents"], {"B": 5, "C": 3347})
+
+    def test_bundle_dearer_than_its_items_is_not_applied(self):
+        bundle = (1, "bundle", {"items": {"B": 2}, "price": 1}, 0)
+        self.assertEqual(_engine(bundle).evaluate([("B", 2)], PRICES, FRIDAY_5PM)["discounts"], [])
+
+    def test_time_of_day_window_and_days(self):
+        happy_hour = {"product_ids": ["A"], "percent": 20, "from": "16:00", "to": "18:00", "days": [4, 5]}
+        engine = _engine((1, "time_of_day", happy_hour, 0))
+        self.assertEqual(engine.evaluate([("A", 1)], PRICES, FRIDAY_5PM)["discount_total_cents"], 400)
+        self.assertEqual(engine.evaluate([("A", 1)], PRICES, datetime(2025, 1, 3, 18, 0))["discounts"], [])
+        self.assertEqual(engine.evaluate([("A", 1)], PRICES, datetime(2025, 1, 2, 17, 0))["discounts"], [])
+
+    def test_time_of_day_window_wraps_past_midnight(self):
+        late = {"product_ids": ["A"], "percent": 20, "from": "22:00", "to": "02:00"}
+        engine = _engine((1, "time_of_day", late, 0))
+        self.assertTrue(engine.evaluate([("A", 1)], PRICES, datetime(2025, 1, 3, 1, 30))["discounts"])
+        self.assertTrue(engine.evaluate([("A", 1)], PRICES, datetime(2025, 1, 3, 23, 0))["discounts"])
+        self.assertFalse(engine.evaluate([("A", 1)], PRICES, datetime(2025, 1, 3, 12, 0))["discounts"])
+
+    def test_promotion_period_is_start_inclusive_end_exclusive(self):
+        ten_off = (1, "percent_off", {"product_ids": ["A"], "percent": 10}, 0,
+                   "2025-01-01 00:00:00", "2025-01-03 17:00:00")
+        engine = _engine(ten_off)
+        self.assertFalse(engine.evaluate([("A", 1)], PRICES, datetime(2024, 12, 31, 23, 59))["discounts"])
+        self.assertTrue(engine.evaluate([("A", 1)], PRICES, datetime(2025, 1, 1, 0, 0))["discounts"])
+        self.assertFalse(engine.evaluate([("A", 1)], PRICES, FRIDAY_5PM)["discounts"])
+
+
+class ValidateRuleTest(unittest.TestCase):
+    def test_days_are_stored_as_sorted_weekday_ints(self):
+        rule = {"product_ids": ["A"], "percent": 20, "from": "16:00", "to": "18:00", "days": ["5", 4, 4]}
+        self.assertEqual(validate_rule("time_of_day", rule)["days"], [4, 5])
+
+    def test_invalid_days_are_rejected(self):
+        for days in ("0123456", [7], [-1], [True], ["mon"]):
+            rule = {"product_ids": ["A"], "percent": 20, "from": "16:00", "to": "18:00", "days": days}
+            with self.assertRaises(ValueError):
+                validate_rule("time_of_day", rule)
+
+
+class AddPromotionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_manager = DBManager(os.path.join(self.tmp_dir, "pos_database.db"))
+        self.db_manager.create_tables()
+        self.promotion_manager = PromotionManager(self.db_manager)
+
+    def tearDown(self):
+        self.db_manager.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stored_days_drive_the_engine(self):
+        happy_hour = {"product_ids": ["A"], "percent": 20, "from": "16:00", "to": "18:00", "days": ["4"]}
+        promotion_id = self.promotion_manager.add_promotion("Happy hour", "time_of_day", happy_hour)
+        self.assertEqual(self.promotion_manager.get_promotions()[0][3]["days"], [4])
+        quote = self.promotion_manager.quote([("A", 1)], PRICES, FRIDAY_5PM)
+        self.assertEqual([d["promotion_id"] for d in quote["discounts"]], [promotion_id])
+
+    def test_invalid_periods_are_rejected(self):
+        ten_off = {"product_ids": ["A"], "percent": 10}
+        self.assertIsNone(self.promotion_manager.add_promotion("x", "percent_off", ten_off, starts_at="2025-01-01"))
+        self.assertIsNone(self.promotion_manager.add_promotion("x", "percent_off", ten_off,
+                                                               starts_at="2025-01-02 00:00:00",
+                                                               ends_at="2025-01-01 00:00:00"))
+        self.assertEqual(self.promotion_manager.get_promotions(include_inactive=True), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
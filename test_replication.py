@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+
+from analytics_store import ColumnarSalesStore
+from db_manager import DBManager
+from reorder_manager import ReorderManager
+from replication import ReplicationManager
+from sales_manager import SalesManager
+
+
+def _sale(origin_sale_id, total, sale_date):
+    return [origin_sale_id, total, "Cash", sale_date, "cashier1", [["P1", "Widget", total, 1, total]]]
+
+
+class LateSalesAtHeadOfficeTest(unittest.TestCase):
+    """Sales pushed for closed days must not leave cached reports or the columnar store behind."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "head_office.db")
+        self.db_manager = DBManager(self.db_path)
+        self.replication = ReplicationManager(self.db_manager)
+        self.sales_manager = SalesManager(self.db_manager)
+        self.store = ColumnarSalesStore(os.path.join(self.tmp_dir, "analytics"))
+        self.replication.apply_sales("T1", [_sale(1, 10.0, "2025-09-01 10:00:00"), _sale(2, 7.0, "2025-09-02 10:00:00")])
+
+    def tearDown(self):
+        self.db_manager.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _september_total(self):
+        return sum(row[1] for row in self.sales_manager.get_sales_timeseries("2025-09-01", "2025-09-30", "day"))
+
+    def test_closed_period_report_sees_replaced_and_deleted_sales(self):
+        self.assertEqual(self._september_total(), 17.0)
+        self.assertEqual(self.replication.apply_sales("T1", [_sale(1, 25.0, "2025-09-01 10:00:00")]), (0, 1, 0))
+        self.assertEqual(self._september_total(), 32.0)
+        self.replication.apply_sales("T1", [], deleted=[2])
+        self.assertEqual(self._september_total(), 25.0)
+
+    def test_columnar_store_re_exports_rewritten_months(self):
+        self.store.export(self.db_path)
+        self.assertEqual(self.store.revenue_by("month"), [("2025-09", 17.0, 2)])
+        self.replication.apply_sales("T1", [_sale(1, 25.0, "2025-09-01 10:00:00")], deleted=[2])
+        self.store.export(self.db_path)
+        self.assertEqual(self.store.revenue_by("month"), [("2025-09", 25.0, 1)])
+        self.assertEqual(self.store.revenue_by("product"), [(("P1", "Widget"), 25.0, 1)])
+
+    def test_rollup_re_rolls_days_changed_after_they_were_rolled_up(self):
+        reorder_manager = ReorderManager(self.db_manager)
+        reorder_manager.roll_up_daily_sales(today=date(2025, 9, 10))
+        self.replication.apply_sales("T1", [_sale(3, 4.0, "2025-09-02 18:00:00")])
+        self.assertEqual(reorder_manager.roll_up_daily_sales(today=date(2025, 9, 10)), 1)
+        self.assertEqual(reorder_manager.roll_up_daily_sales(today=date(2025, 9, 10)), 0)
+        self.assertEqual(self.db_manager.get_cursor().execute(
+            "SELECT day, quantity FROM product_daily_sales ORDER BY day").fetchall(),
+            [("2025-09-01", 1), ("2025-09-02", 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from db_manager import DBManager
+from sales_journal import SalesJournal, decode_line
+from sales_manager import SalesManager
+
+
+class JournaledCheckoutTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "pos_database.db")
+        db_manager = DBManager(self.db_path)
+        db_manager.create_tables()
+        db_manager.get_cursor().execute("INSERT INTO products (product_id, name, price, stock) VALUES ('P1', 'Widget', 10.0, 10)")
+        db_manager.get_connection().commit()
+        db_manager.close()
+        self.journal = SalesJournal(os.path.join(self.tmp_dir, "journal"), self.db_path).open()
+        self.db_manager = DBManager(self.db_path)
+        self.sales_manager = SalesManager(self.db_manager, journal=self.journal)
+
+    def tearDown(self):
+        self.db_manager.close()
+        self.journal.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _stock(self, product_id):
+        return self.db_manager.get_cursor().execute(
+            "SELECT stock FROM products WHERE product_id = ?", (product_id,)).fetchone()[0]
+
+    def test_discounted_sale_is_journaled_and_applied(self):
+        items = [{"product_id": "P1", "name": "Widget", "price": 10.0, "qty": 3, "subtotal": 30.0}]
+        discounts = [{"promotion_id": 7, "name": "3 for 2", "amount_cents": 1000}]
+        sale_id = self.sales_manager.journal_sale(20.0, "Cash", "cashier1", items, self._stock, discounts)
+        self.assertIsNotNone(sale_id)
+        self.assertTrue(self.journal.wait_applied(timeout=5))
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT total_amount FROM sales WHERE sale_id = ?", (sale_id,)).fetchone(), (20.0,))
+            self.assertEqual(conn.execute("SELECT promotion_id, promotion_name, amount FROM sale_discounts WHERE sale_id = ?",
+                                          (sale_id,)).fetchall(), [(7, "3 for 2", 10.0)])
+            self.assertEqual(conn.execute("SELECT stock FROM products WHERE product_id = 'P1'").fetchone(), (7,))
+        finally:
+            conn.close()
+
+    def test_sale_ids_of_archived_sales_are_not_reused(self):
+        self.journal.close()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO sales_partitions (month, path, sales, items, first_sale_id, last_sale_id, archived_at) "
+                     "VALUES ('2025-01', 'sales_archive/sales-2025-01.db', 40, 40, 1, 40, '2025-04-01 03:00:00')")
+        conn.commit()
+        conn.close()
+        self.journal = SalesJournal(os.path.join(self.tmp_dir, "journal"), self.db_path).open()
+        self.assertEqual(self.journal.status()["next_sale_id"], 41)
+
+    def test_poison_record_is_dead_lettered(self):
+        items = [{"product_id": "P1", "name": "Widget", "price": 10.0, "qty": 1, "subtotal": 10.0}]
+        # The same promotion twice violates sale_discounts' primary key on every attempt
+        twice = [{"promotion_id": 7, "name": "3 for 2", "amount_cents": 100}] * 2
+        poison = self.sales_manager.journal_sale(9.0, "Cash", "cashier1", items, self._stock, twice)
+        good = self.sales_manager.journal_sale(10.0, "Cash", "cashier1", items, self._stock)
+        self.assertTrue(self.journal.wait_applied(timeout=5))
+
+        status = self.journal.status()
+        self.assertEqual((status["dead_letters"], status["unapplied"]), (1, 0))
+        with open(os.path.join(self.tmp_dir, "journal", "dead-letter.ndjson"), "rb") as f:
+            self.assertEqual(decode_line(f.readline())["sale_id"], poison)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT sale_id FROM sales").fetchall(), [(good,)])
+        finally:
+            conn.close()
+
+    def test_failed_fsync_fails_the_journal_closed(self):
+        items = [{"product_id": "P1", "name": "Widget", "price": 10.0, "qty": 1, "subtotal": 10.0}]
+        durable = self.sales_manager.journal_sale(10.0, "Cash", "cashier1", items, self._stock)
+        self.journal.segment_bytes = 1  # the next append retires the current segment
+        with mock.patch("sales_journal.os.fsync", side_effect=OSError(5, "Input/output error")):
+            self.assertIsNone(self.sales_manager.journal_sale(10.0, "Cash", "cashier1", items, self._stock))
+        # The retired segment was not synced, so it is still held for close()
+        self.assertEqual(len(self.journal._retired_fds), 1)
+        self.assertIsNone(self.sales_manager.journal_sale(10.0, "Cash", "cashier1", items, self._stock))
+        self.assertIsNotNone(self.journal.status()["failed"])
+        self.assertTrue(self.journal.wait_applied(timeout=5))
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT sale_id FROM sales").fetchall(), [(durable,)])
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from db_manager import DBManager
+from session_tokens import SessionTokenManager
+
+USER = {"user_id": 1, "username": "cashier1", "role": "cashier"}
+
+
+class RevocationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, "pos_database.db")
+        DBManager(self.db_path).close()  # creates the tables
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_revocation_is_seen_by_other_workers(self):
+        worker_a = SessionTokenManager(secret=b"k", db_path=self.db_path)
+        worker_b = SessionTokenManager(secret=b"k", db_path=self.db_path, revocation_poll=0)
+        token = worker_a.issue_token(USER)
+        self.assertEqual(worker_b.verify_token(token)["username"], "cashier1")
+        self.assertTrue(worker_a.revoke_token(token))
+        self.assertIsNone(worker_a.verify_token(token))
+        self.assertIsNone(worker_b.verify_token(token))
+
+    def test_verification_reads_the_database_at_most_once_per_poll(self):
+        worker_a = SessionTokenManager(secret=b"k", db_path=self.db_path)
+        worker_b = SessionTokenManager(secret=b"k", db_path=self.db_path, revocation_poll=60)
+        token = worker_a.issue_token(USER)
+        self.assertIsNotNone(worker_b.verify_token(token))  # First verify polls
+        worker_a.revoke_token(token)
+        reads = []
+        connection = worker_b._connection
+        worker_b._connection = lambda: reads.append(1) or connection()
+        for _ in range(100):
+            self.assertIsNotNone(worker_b.verify_token(token))  # Not yet polled
+        self.assertEqual(reads, [])
+        worker_b._next_poll = 0
+        self.assertIsNone(worker_b.verify_token(token))
+        self.assertEqual(reads, [1])
+
+    def test_unexpired_revocations_are_never_pruned(self):
+        tokens = SessionTokenManager(secret=b"k", db_path=self.db_path)
+        revoked = tokens.issue_token(USER)
+        tokens.revoke_token(revoked)
+        tokens.ttl = -1
+        for _ in range(50):
+            tokens.revoke_token(tokens.issue_token(USER))
+        # Expired ids are pruned on the next revocation (the last one is still there)
+        conn = tokens._connection()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM revoked_tokens").fetchone()[0], 2)
+        self.assertIsNone(tokens.verify_token(revoked))
+
+
+class DecodeTest(unittest.TestCase):
+    def test_malformed_tokens_are_rejected(self):
+        tokens = SessionTokenManager(secret=b"k")
+        for token in ["", "a", "a.b.c", "a.\xe9", "\xe9.a", "a.b"]:
+            self.assertIsNone(tokens.verify_token(token))
+            self.assertFalse(tokens.revoke_token(token))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,12 @@
 import sqlite3
-import hashlib
 import logging
 
+from password_hashers import (
+    get_hash_pool, hash_password, verify_password, needs_rehash, HashPoolBusyError
+)
+
+logger = logging.getLogger(__name__)
+
 class UserManager:
     def __init__(self, db_manager):
         self.db_manager = db_manager
@@ -20,53 +25,95 @@ class UserManager:
                 );
             """)
             self.conn.commit()
-            logging.info("Users table checked/created successfully.")
+            logger.info("Users table checked/created successfully.")
             # Do NOT add default admin here. This will be done in app.py once.
         except sqlite3.Error as e:
-            logging.critical(f"Error creating users table: {e}")
+            logger.critical(f"Error creating users table: {e}")
             raise RuntimeError(f"Database users table creation failed: {e}")
 
     def hash_password(self, password):
-        # Using SHA256 for password hashing
-        return hashlib.sha256(password.encode()).hexdigest()
+        # Salted slow hash with the configured algorithm/cost (see password_hashers.py)
+        return hash_password(password)
 
     def add_user(self, user_id, username, password, role='cashier'):
-        password_hash = self.hash_password(password)
+        password_hash = get_hash_pool().run(self.hash_password, password)
         try:
             self.cursor.execute("INSERT INTO users (user_id, username, password_hash, role) VALUES (?, ?, ?, ?)",
                                 (user_id, username, password_hash, role))
             self.conn.commit() # Commit here as this is a standalone operation
-            logging.info(f"User '{username}' ({user_id}) added successfully with role {role}.")
+            logger.info(f"User '{username}' ({user_id}) added successfully with role {role}.")
             return True
         except sqlite3.IntegrityError:
-            logging.warning(f"Attempted to add existing User ID/Username: {user_id}/{username}")
+            logger.warning(f"Attempted to add existing User ID/Username: {user_id}/{username}")
             return False
         except sqlite3.Error as e:
-            logging.error(f"Error adding user {username}: {e}")
+            logger.error(f"Error adding user {username}: {e}")
             return False
 
     def verify_user(self, username, password):
-        password_hash = self.hash_password(password)
+        """
+        Checks credentials. The row is fetched on the calling thread (the sqlite connection
+        is not shared); only the hash computation is sent to the bounded hashing pool.
+        Raises HashPoolBusyError when the pool is saturated.
+        """
+        user = self.get_credentials(username)
+        if user is None:
+            # Spend the same hashing time for unknown users so usernames cannot be probed by timing
+            get_hash_pool().run(self.hash_password, password)
+            logger.warning(f"Failed login attempt for username: {username}.")
+            return None
+
+        if get_hash_pool().run(verify_password, password, user[3]):
+            logger.info(f"User '{username}' logged in successfully (Role: {user[2]}).")
+            if needs_rehash(user[3]):
+                self._upgrade_password_hash(user[0], password)
+            return {"user_id": user[0], "username": user[1], "role": user[2]}
+        else:
+            logger.warning(f"Failed login attempt for username: {username}.")
+            return None
+
+    def get_credentials(self, username):
+        """
+        :return: (user_id, username, role, password_hash), or None for an unknown user or on a database error.
+        """
         try:
-            self.cursor.execute("SELECT user_id, username, role FROM users WHERE username = ? AND password_hash = ?",
-                                (username, password_hash))
-            user = self.cursor.fetchone()
-            if user:
-                logging.info(f"User '{username}' logged in successfully (Role: {user[2]}).")
-                return {"user_id": user[0], "username": user[1], "role": user[2]}
-            else:
-                logging.warning(f"Failed login attempt for username: {username}.")
-                return None
+            self.cursor.execute("SELECT user_id, username, role, password_hash FROM users WHERE username = ?",
+                                (username,))
+            return self.cursor.fetchone()
         except sqlite3.Error as e:
-            logging.error(f"Database error during user verification for {username}: {e}")
+            logger.error(f"Database error during user verification for {username}: {e}")
             return None
 
+    def _upgrade_password_hash(self, user_id, password):
+        """Re-hashes a legacy or outdated-cost hash with the current settings after a successful login."""
+        try:
+            new_hash = get_hash_pool().run(self.hash_password, password)
+        except HashPoolBusyError as e:
+            # Not fatal: the old hash still verifies, the upgrade is retried on the next login
+            logger.warning(f"Could not upgrade password hash for user {user_id}: {e}")
+            return
+        self.set_password_hash(user_id, new_hash)
+
+    def set_password_hash(self, user_id, password_hash):
+        """
+        Stores an already computed password hash.
+        :return: True on success, False on a database error.
+        """
+        try:
+            self.cursor.execute("UPDATE users SET password_hash = ? WHERE user_id = ?", (password_hash, user_id))
+            self.conn.commit()
+            logger.info(f"Upgraded password hash for user {user_id}.")
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"Could not upgrade password hash for user {user_id}: {e}")
+            return False
+
     def get_all_users(self):
         try:
             self.cursor.execute("SELECT user_id, username, role FROM users ORDER BY username")
             return self.cursor.fetchall()
         except sqlite3.Error as e:
-            logging.error(f"Error getting all users: {e}")
+            logger.error(f"Error getting all users: {e}")
             return []
 
     def add_default_admin_if_empty(self):
@@ -74,13 +121,13 @@ class UserManager:
         try:
             self.cursor.execute("SELECT COUNT(*) FROM users")
             if self.cursor.fetchone()[0] == 0:
-                logging.info("No users found, adding default admin user 'admin'.")
+                logger.info("No users found, adding default admin user 'admin'.")
                 # Use the self.add_user method, but no commit here, as it's part of initial setup flow.
                 # The add_user method itself commits, so this is fine.
                 self.add_user("ADMIN001", "admin", "adminpass", "admin")
-                logging.info("Default admin user 'admin' created (password: 'adminpass').")
+                logger.info("Default admin user 'admin' created (password: 'adminpass').")
                 return True
             return False
         except sqlite3.Error as e:
-            logging.critical(f"Error checking/adding default admin: {e}")
+            logger.critical(f"Error checking/adding default admin: {e}")
             return False
\ No newline at end of file